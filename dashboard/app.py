@@ -2,6 +2,10 @@
 """
 Medical Telegram Insights Dashboard
 Interactive exploration of Telegram medical/cosmetics data.
+
+Charts are drawn from the latest precomputed snapshot (src/scripts/dashboard_snapshot.py),
+loaded once per snapshot version and shared by every session; only message search queries
+Postgres.
 """
 
 import streamlit as st
@@ -12,6 +16,9 @@ from dotenv import load_dotenv
 import os
 import logging
 
+from src.api.queries import SEARCH_CONFIG
+from src.scripts.dashboard_snapshot import latest_snapshot, load_snapshot
+
 # ────────────────────────────────────────────────
 # Logging Setup – safe & no side-effects
 # ────────────────────────────────────────────────
@@ -71,7 +78,11 @@ def get_engine():
         logging.error(f"DB connection error: {e}")
         st.stop()
 
-engine = get_engine()
+@st.cache_resource(max_entries=2)
+def get_snapshot(name):
+    # Shared by all sessions in this process: treat the DataFrames as read-only
+    logging.info(f"Loading dashboard snapshot {name}")
+    return load_snapshot(name)
 
 # ────────────────────────────────────────────────
 # Dashboard UI
@@ -84,58 +95,35 @@ Explore insights from Ethiopian Telegram channels (medical, pharma, cosmetics).
 Data from staging → dbt star schema → YOLO object enrichment.
 """)
 
-st.success("Connected to database!")
+snapshot_name = latest_snapshot()
+if snapshot_name is None:
+    st.info("No dashboard snapshot yet: run `python -m src.scripts.dashboard_snapshot` after dbt "
+            "(the orchestrator builds one after every run).")
+    st.stop()
+snapshot = get_snapshot(snapshot_name)
+st.caption(f"Data version {snapshot['manifest']['version']}, snapshot built {snapshot['manifest']['built_at'][:19]} UTC")
 
-tab1, tab2, tab3 = st.tabs([
+tab1, tab2, tab3, tab4 = st.tabs([
     "Top Mentioned Products/Drugs",
     "Visual Content by Channel (YOLO)",
-    "Posting Trends"
+    "Posting Trends",
+    "Search Messages"
 ])
 
 with tab1:
     st.subheader("Top Mentioned Products/Drugs")
     limit = st.slider("Number of results", 5, 20, 10)
 
-    @st.cache_data(ttl=600)
-    def get_top_products(lim):
-        query = """
-            SELECT message_text, COUNT(*) as count
-            FROM fct_messages
-            WHERE message_text ILIKE '%%pill%%' OR message_text ILIKE '%%cream%%'
-               OR message_text ILIKE '%%drug%%' OR message_text ILIKE '%%medicine%%'
-            GROUP BY message_text
-            ORDER BY count DESC
-            LIMIT %s
-        """
-        return pd.read_sql(query, engine, params=(lim,))
-
-    df = get_top_products(limit)
+    df = snapshot.get("top_products", pd.DataFrame()).head(limit)
     if not df.empty:
-        # Shorten long labels for chart readability
-        df['short_text'] = df['message_text'].str[:30] + '...'
-        st.bar_chart(df.set_index("short_text")["count"])
-        st.dataframe(df[["message_text", "count"]])
+        st.bar_chart(df.set_index("product")["count"])
+        st.dataframe(df[["product", "category", "count", "mention_count"]])
     else:
-        st.info("No matching product mentions found (check fct_messages).")
+        st.info("No product mentions found (run src/scripts/product_mentions.py after loading).")
 
 with tab2:
     st.subheader("Visual Content by Channel Category (YOLO)")
-    @st.cache_data(ttl=600)
-    def get_visual_stats():
-        query = """
-            SELECT dc.channel_category,
-                   SUM(f.object_count) as total_objects,
-                   AVG(f.object_count) as avg_objects,
-                   COUNT(*) as messages_with_images
-            FROM fct_messages f
-            JOIN dim_channels dc ON f.channel_name = dc.channel_name
-            WHERE f.object_count > 0
-            GROUP BY dc.channel_category
-            ORDER BY total_objects DESC
-        """
-        return pd.read_sql(query, engine)
-
-    df_vis = get_visual_stats()
+    df_vis = snapshot.get("visual_stats", pd.DataFrame())
     if not df_vis.empty:
         st.bar_chart(df_vis.set_index("channel_category")["total_objects"])
         st.dataframe(df_vis)
@@ -145,27 +133,66 @@ with tab2:
 with tab3:
     st.subheader("Posting Volume Trends")
     
-    @st.cache_data(ttl=600)
-    def get_trends():
-        query = """
-            SELECT year, month, COUNT(*) as count
-            FROM fct_messages f
-            JOIN dim_dates d ON f.date_key = d.date_key
-            GROUP BY year, month
-            ORDER BY year, month
-        """
-        return pd.read_sql(query, engine)
-
-    df_trend = get_trends()
+    df_trend = snapshot.get("monthly_volume", pd.DataFrame())
     
     if not df_trend.empty:
-        # Create single x-axis column (Streamlit likes this)
-        df_trend['year_month'] = df_trend['year'].astype(str) + '-' + df_trend['month'].astype(str).str.zfill(2)
-        
-        # Use single index → no KeyError
+        # year_month (built with the snapshot) gives a single x-axis column
         st.line_chart(df_trend.set_index('year_month')['count'])
         
         # Show full table
         st.dataframe(df_trend[['year', 'month', 'count']])
+
+        df_daily = snapshot.get("daily_volume", pd.DataFrame())
+        if not df_daily.empty:
+            bucket_days = int(df_daily["bucket_days"].iloc[0])
+            st.markdown("**Daily posting volume**" if bucket_days == 1
+                        else f"**Daily posting volume** (mean per day over {bucket_days}-day buckets)")
+            st.line_chart(df_daily.set_index("date_key")["count"])
     else:
-        st.info("No trend data available yet.")
\ No newline at end of file
+        st.info("No trend data available yet.")
+
+with tab4:
+    st.subheader("Search Messages")
+    search_text = st.text_input("Search message text", placeholder='e.g. paracetamol, "vitamin c", sunscreen -spf')
+
+    channels = snapshot.get("channels", pd.DataFrame({"channel_name": []}))["channel_name"].tolist()
+    col1, col2 = st.columns(2)
+    channel = col1.selectbox("Channel", ["All channels"] + channels)
+    date_range = col2.date_input("Date range", value=())
+
+    @st.cache_data(ttl=600)
+    def search_messages(q, channel, date_from, date_to, fuzzy=False):
+        # Same search as the API's /search: GIN-indexed tsvector, or pg_trgm word similarity
+        tsquery = "websearch_to_tsquery(CAST(:config AS regconfig), :q)"
+        match = ":q <% message_text" if fuzzy else f"search_vector @@ {tsquery}"
+        rank = "word_similarity(:q, message_text)" if fuzzy else f"ts_rank_cd(search_vector, {tsquery})"
+        query = f"""
+            SELECT channel_name, message_timestamp, message_text, views, {rank} AS rank
+            FROM fct_messages
+            WHERE {match}
+              AND (CAST(:channel AS TEXT) IS NULL OR channel_name = :channel)
+              AND (CAST(:date_from AS DATE) IS NULL OR date_key >= :date_from)
+              AND (CAST(:date_to AS DATE) IS NULL OR date_key <= :date_to)
+            ORDER BY rank DESC, message_timestamp DESC
+            LIMIT 50
+        """
+        return pd.read_sql(text(query), get_engine(), params={
+            "q": q, "config": SEARCH_CONFIG, "channel": channel, "date_from": date_from, "date_to": date_to,
+        })
+
+    if search_text.strip():
+        date_from = date_range[0] if len(date_range) > 0 else None
+        date_to = date_range[1] if len(date_range) > 1 else None
+        channel_filter = None if channel == "All channels" else channel
+        df_search = search_messages(search_text, channel_filter, date_from, date_to)
+        if df_search.empty:
+            try:
+                df_search = search_messages(search_text, channel_filter, date_from, date_to, fuzzy=True)
+                if not df_search.empty:
+                    st.caption("No exact matches; showing similar spellings.")
+            except Exception as e:  # pg_trgm not installed
+                logging.warning(f"Fuzzy search unavailable: {e}")
+        if not df_search.empty:
+            st.dataframe(df_search, use_container_width=True)
+        else:
+            st.info("No messages match your search.")
@@ -0,0 +1,18 @@
+-- Same statements as src/scripts/data_version.py: bump the warehouse data version after a
+-- run so the API drops cached responses built from the previous marts.
+{% macro bump_data_version() %}
+{% if execute and flags.WHICH in ('run', 'build', 'seed', 'snapshot') %}
+CREATE TABLE IF NOT EXISTS {{ target.schema }}.warehouse_data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_by TEXT
+);
+INSERT INTO {{ target.schema }}.warehouse_data_version (id, version, updated_at, updated_by)
+VALUES (TRUE, 1, CURRENT_TIMESTAMP, 'dbt')
+ON CONFLICT (id) DO UPDATE SET
+    version = {{ target.schema }}.warehouse_data_version.version + 1,
+    updated_at = EXCLUDED.updated_at,
+    updated_by = EXCLUDED.updated_by;
+{% endif %}
+{% endmacro %}
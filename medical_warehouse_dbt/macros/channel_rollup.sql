@@ -0,0 +1,75 @@
+-- Per-channel rollup of fct_messages into periods of `period_days` days starting at
+-- `period_start` (a SQL expression over fct_messages row `f`). On incremental runs only the
+-- (channel, period) groups that received new messages or new YOLO results since the last
+-- run are recomputed, so the cost follows new data rather than the size of fct_messages.
+{% macro channel_rollup(period_column, period_start, period_days) %}
+{% if is_incremental() %}
+WITH changed_groups AS (
+    SELECT DISTINCT f.channel_name, {{ period_start }} AS {{ period_column }}
+    FROM {{ ref('fct_messages') }} f
+    WHERE f.loaded_at > (SELECT COALESCE(MAX(last_loaded_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+       OR f.enriched_at > (SELECT COALESCE(MAX(last_enriched_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+),
+messages AS (
+    SELECT f.channel_name, f.channel_category, f.views, f.forwards, f.image_path,
+           f.object_count, f.detected_objects, f.loaded_at, f.enriched_at, g.{{ period_column }}
+    FROM changed_groups g
+    JOIN {{ ref('fct_messages') }} f
+      ON f.channel_name = g.channel_name
+     AND f.date_key >= g.{{ period_column }}
+     AND f.date_key < g.{{ period_column }} + {{ period_days }}
+),
+{% else %}
+WITH messages AS (
+    SELECT f.channel_name, f.channel_category, f.views, f.forwards, f.image_path,
+           f.object_count, f.detected_objects, f.loaded_at, f.enriched_at, {{ period_start }} AS {{ period_column }}
+    FROM {{ ref('fct_messages') }} f
+),
+{% endif %}
+
+object_classes AS (
+    -- detected_objects holds each message's unique classes, so this counts messages per class
+    SELECT channel_name, {{ period_column }}, jsonb_object_agg(object_class, messages) AS objects_by_class
+    FROM (
+        SELECT m.channel_name, m.{{ period_column }}, o.object_class, COUNT(*) AS messages
+        FROM messages m
+        CROSS JOIN LATERAL UNNEST(m.detected_objects) AS o(object_class)
+        GROUP BY m.channel_name, m.{{ period_column }}, o.object_class
+    ) per_class
+    GROUP BY channel_name, {{ period_column }}
+),
+
+totals AS (
+    SELECT
+        channel_name,
+        {{ period_column }},
+        MAX(channel_category) AS channel_category,
+        COUNT(*) AS message_count,
+        COALESCE(SUM(views), 0) AS total_views,
+        COALESCE(SUM(forwards), 0) AS total_forwards,
+        COUNT(*) FILTER (WHERE image_path IS NOT NULL AND image_path != '') AS image_count,
+        COUNT(*) FILTER (WHERE object_count > 0) AS messages_with_objects,
+        COALESCE(SUM(object_count), 0) AS total_objects,
+        MAX(loaded_at) AS last_loaded_at,
+        MAX(enriched_at) AS last_enriched_at
+    FROM messages
+    GROUP BY channel_name, {{ period_column }}
+)
+
+SELECT
+    t.channel_name,
+    t.{{ period_column }},
+    t.channel_category,
+    t.message_count,
+    t.total_views,
+    t.total_forwards,
+    t.image_count,
+    t.messages_with_objects,
+    t.total_objects,
+    COALESCE(o.objects_by_class, '{}'::jsonb) AS objects_by_class,
+    t.last_loaded_at,
+    t.last_enriched_at
+FROM totals t
+LEFT JOIN object_classes o
+  ON o.channel_name = t.channel_name AND o.{{ period_column }} = t.{{ period_column }}
+{% endmacro %}
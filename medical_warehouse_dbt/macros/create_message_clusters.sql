@@ -0,0 +1,20 @@
+-- Near-duplicate clusters are written here by src/scripts/dedup_messages.py and joined
+-- into fct_messages. Created up front so the join works before the first clustering run.
+{% macro create_message_clusters() %}
+CREATE SEQUENCE IF NOT EXISTS {{ target.schema }}.message_cluster_id_seq;
+CREATE TABLE IF NOT EXISTS {{ target.schema }}.message_clusters (
+    channel_name TEXT NOT NULL,
+    message_id BIGINT NOT NULL,
+    message_cluster_id BIGINT NOT NULL,
+    signature BYTEA,
+    bands BIGINT[] NOT NULL DEFAULT '{}',
+    clustered_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (channel_name, message_id)
+);
+CREATE INDEX IF NOT EXISTS message_clusters_cluster_idx
+    ON {{ target.schema }}.message_clusters (message_cluster_id);
+CREATE INDEX IF NOT EXISTS message_clusters_clustered_at_idx
+    ON {{ target.schema }}.message_clusters (clustered_at);
+CREATE INDEX IF NOT EXISTS message_clusters_bands_idx
+    ON {{ target.schema }}.message_clusters USING GIN (bands) WITH (fastupdate = off);
+{% endmacro %}
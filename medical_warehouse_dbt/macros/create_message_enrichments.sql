@@ -0,0 +1,16 @@
+-- YOLO results are written here by src/scripts/enrich_images_yolo.py and joined into
+-- fct_messages, so rebuilding the marts never discards them. Created up front so the
+-- join works before the first enrichment run.
+{% macro create_message_enrichments() %}
+CREATE TABLE IF NOT EXISTS {{ target.schema }}.message_enrichments (
+    channel_name TEXT NOT NULL,
+    message_id BIGINT NOT NULL,
+    detected_objects TEXT[],
+    object_count INTEGER,
+    detected_model TEXT,
+    enriched_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (channel_name, message_id)
+);
+CREATE INDEX IF NOT EXISTS message_enrichments_enriched_at_idx
+    ON {{ target.schema }}.message_enrichments (enriched_at);
+{% endmacro %}
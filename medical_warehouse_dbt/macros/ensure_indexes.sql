@@ -0,0 +1,27 @@
+-- dbt only creates a model's `indexes` when it builds the table, i.e. on the first run and on
+-- --full-refresh; an index added to the config of an existing incremental model would never be
+-- built. Run as a post-hook, this creates each configured index that is missing. An index over
+-- the same columns (such as the one dbt created, under its generated name) counts as present.
+{% macro ensure_indexes() %}
+{% set indexes = config.get('indexes') or [] %}
+DO $$
+BEGIN
+{% for index in indexes %}
+    {% set columns = index['columns'] %}
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        WHERE i.indrelid = '{{ this }}'::regclass
+          AND ARRAY(
+              SELECT a.attname::text
+              FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+              JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+              ORDER BY k.position
+          ) = ARRAY[{% for column in columns %}'{{ column }}'{% if not loop.last %}, {% endif %}{% endfor %}]::text[]
+    ) THEN
+        CREATE {% if index.get('unique') %}UNIQUE {% endif %}INDEX {{ this.identifier }}_{{ columns | join('_') }}_idx
+            ON {{ this }} USING {{ index.get('type', 'btree') }} ({{ columns | join(', ') }});
+    END IF;
+{% endfor %}
+END $$;
+{% endmacro %}
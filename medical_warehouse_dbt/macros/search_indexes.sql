@@ -0,0 +1,22 @@
+-- Message search: a tsvector column with a GIN index is built into fct_messages; these add
+-- trigram (pg_trgm) support for fuzzy matching of misspelled product names. pg_trgm ships
+-- with PostgreSQL's contrib modules; where it isn't installed both are no-ops and only
+-- full-text search is available.
+{% macro create_search_extensions() %}
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    END IF;
+END $$;
+{% endmacro %}
+
+{% macro create_trigram_index(column) %}
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS {{ this.identifier }}_{{ column }}_trgm_idx
+            ON {{ this }} USING gin ({{ column }} gin_trgm_ops);
+    END IF;
+END $$;
+{% endmacro %}
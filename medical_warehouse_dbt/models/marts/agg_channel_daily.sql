@@ -0,0 +1,14 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_name', 'date_key'],
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    indexes=[
+        {'columns': ['channel_name', 'date_key'], 'unique': True},
+        {'columns': ['date_key']},
+    ],
+    post_hook="{{ ensure_indexes() }}"
+) }}
+
+-- Daily per-channel message, view, forward, image and YOLO object totals
+{{ channel_rollup('date_key', 'f.date_key', 1) }}
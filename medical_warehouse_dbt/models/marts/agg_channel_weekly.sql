@@ -0,0 +1,14 @@
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_name', 'week_start'],
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    indexes=[
+        {'columns': ['channel_name', 'week_start'], 'unique': True},
+        {'columns': ['week_start']},
+    ],
+    post_hook="{{ ensure_indexes() }}"
+) }}
+
+-- Weekly (Monday-start) per-channel message, view, forward, image and YOLO object totals
+{{ channel_rollup('week_start', "DATE_TRUNC('week', f.date_key)::DATE", 7) }}
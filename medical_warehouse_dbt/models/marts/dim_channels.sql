@@ -1,6 +1,20 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key='channel_name',
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns'
+) }}
 
-SELECT DISTINCT
+-- Only channels with newly loaded messages are recounted on incremental runs
+{% if is_incremental() %}
+WITH changed_channels AS (
+    SELECT DISTINCT channel_name
+    FROM {{ ref('stg_telegram_messages') }}
+    WHERE loaded_at > (SELECT COALESCE(MAX(last_loaded_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+)
+{% endif %}
+
+SELECT
     channel_name,
     CASE
         WHEN channel_name ILIKE '%lobelia%' THEN 'Cosmetics & Health Products'
@@ -9,6 +23,10 @@ SELECT DISTINCT
         WHEN channel_name ILIKE '%quora%' OR channel_name ILIKE '%doctor%' THEN 'Doctors & Health Announcements'
         ELSE 'Other / Unknown'
     END AS channel_category,
-    COUNT(*) OVER (PARTITION BY channel_name) AS total_messages
+    COUNT(*) AS total_messages,
+    MAX(loaded_at) AS last_loaded_at
 FROM {{ ref('stg_telegram_messages') }}
-ORDER BY total_messages DESC
\ No newline at end of file
+{% if is_incremental() %}
+WHERE channel_name IN (SELECT channel_name FROM changed_channels)
+{% endif %}
+GROUP BY channel_name
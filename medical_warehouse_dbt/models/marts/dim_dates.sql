@@ -1,15 +1,32 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key='date_key',
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns'
+) }}
 
-SELECT DISTINCT
-    DATE(message_timestamp) AS date_key,
-    EXTRACT(YEAR FROM message_timestamp) AS year,
-    EXTRACT(MONTH FROM message_timestamp) AS month,
-    EXTRACT(WEEK FROM message_timestamp) AS week,
-    EXTRACT(DAY FROM message_timestamp) AS day_of_month,
-    TO_CHAR(message_timestamp, 'Day') AS day_name,
+WITH message_dates AS (
+    SELECT
+        DATE(message_timestamp) AS date_key,
+        MAX(loaded_at) AS last_loaded_at
+    FROM {{ ref('stg_telegram_messages') }}
+    {% if is_incremental() %}
+    -- Only dates of newly loaded messages; dates already present are simply re-merged
+    WHERE loaded_at > (SELECT COALESCE(MAX(last_loaded_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+    {% endif %}
+    GROUP BY DATE(message_timestamp)
+)
+
+SELECT
+    date_key,
+    EXTRACT(YEAR FROM date_key) AS year,
+    EXTRACT(MONTH FROM date_key) AS month,
+    EXTRACT(WEEK FROM date_key) AS week,
+    EXTRACT(DAY FROM date_key) AS day_of_month,
+    TO_CHAR(date_key, 'Day') AS day_name,
     CASE
-        WHEN EXTRACT(DOW FROM message_timestamp) IN (0, 6) THEN true
+        WHEN EXTRACT(DOW FROM date_key) IN (0, 6) THEN true
         ELSE false
-    END AS is_weekend
-FROM {{ ref('stg_telegram_messages') }}
-ORDER BY date_key
\ No newline at end of file
+    END AS is_weekend,
+    last_loaded_at
+FROM message_dates
@@ -1,8 +1,55 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_name', 'message_id'],
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    indexes=[
+        {'columns': ['channel_name', 'message_id'], 'unique': True},
+        {'columns': ['loaded_at']},
+        {'columns': ['enriched_at']},
+        {'columns': ['clustered_at']},
+        {'columns': ['message_cluster_id']},
+        {'columns': ['channel_name', 'date_key']},
+        {'columns': ['message_timestamp', 'channel_name', 'message_id']},
+        {'columns': ['detected_objects'], 'type': 'gin'},
+        {'columns': ['search_vector'], 'type': 'gin'},
+    ],
+    post_hook=["{{ ensure_indexes() }}", "{{ create_trigram_index('message_text') }}"]
+) }}
+
+WITH changed_messages AS (
+    SELECT *
+    FROM {{ ref('stg_telegram_messages') }}
+    {% if is_incremental() %}
+    WHERE loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+    {% endif %}
+
+    {% if is_incremental() %}
+    -- Messages already in the fact table whose YOLO results were (re)written since the last run
+    UNION
+    SELECT m.*
+    FROM {{ ref('stg_telegram_messages') }} m
+    JOIN {{ source('postgres_raw', 'message_enrichments') }} e
+      ON e.channel_name = m.channel_name AND e.message_id = m.message_id
+    WHERE e.enriched_at > (SELECT COALESCE(MAX(enriched_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+
+    -- ...and those whose duplicate cluster was assigned or merged since the last run
+    -- (all clustered messages on the first run after the column was added)
+    {% set existing_columns = adapter.get_columns_in_relation(this) | map(attribute='name') | list %}
+    UNION
+    SELECT m.*
+    FROM {{ ref('stg_telegram_messages') }} m
+    JOIN {{ source('postgres_raw', 'message_clusters') }} c
+      ON c.channel_name = m.channel_name AND c.message_id = m.message_id
+    {% if 'clustered_at' in existing_columns %}
+    WHERE c.clustered_at > (SELECT COALESCE(MAX(clustered_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+    {% endif %}
+    {% endif %}
+)
 
 SELECT
     m.message_id,
-    dc.channel_name,
+    m.channel_name,
     dc.channel_category,
     dd.date_key,
     m.message_timestamp,
@@ -12,9 +59,20 @@ SELECT
     m.views,
     m.forwards,
     m.loaded_at,
-    -- Placeholders for YOLO results (will update later)
-    NULL::text[] AS detected_objects,
-    NULL::integer AS object_count
-FROM {{ ref('stg_telegram_messages') }} m
+    -- YOLO results live in message_enrichments and are joined in, never overwritten by a rebuild
+    e.detected_objects,
+    e.object_count,
+    e.detected_model,
+    e.enriched_at,
+    -- Near-duplicates (src/scripts/dedup_messages.py) share a cluster; group on it to count each post once
+    c.message_cluster_id,
+    c.clustered_at,
+    -- Full-text search document; recomputed whenever the message is merged
+    to_tsvector('{{ var("search_config") }}', m.message_text) AS search_vector
+FROM changed_messages m
+LEFT JOIN {{ source('postgres_raw', 'message_enrichments') }} e
+  ON e.channel_name = m.channel_name AND e.message_id = m.message_id
+LEFT JOIN {{ source('postgres_raw', 'message_clusters') }} c
+  ON c.channel_name = m.channel_name AND c.message_id = m.message_id
 LEFT JOIN {{ ref('dim_channels') }} dc ON m.channel_name = dc.channel_name
-LEFT JOIN {{ ref('dim_dates') }} dd ON DATE(m.message_timestamp) = dd.date_key
\ No newline at end of file
+LEFT JOIN {{ ref('dim_dates') }} dd ON DATE(m.message_timestamp) = dd.date_key
@@ -1,4 +1,14 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_name', 'message_id'],
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns',
+    indexes=[
+        {'columns': ['channel_name', 'message_id'], 'unique': True},
+        {'columns': ['loaded_at']},
+    ],
+    post_hook="{{ ensure_indexes() }}"
+) }}
 
 SELECT
     message_id,
@@ -13,4 +23,9 @@ SELECT
 FROM {{ source('postgres_raw', 'staging_telegram_messages') }}
 WHERE message_id IS NOT NULL
   AND channel_name IS NOT NULL
-  AND message_date IS NOT NULL
\ No newline at end of file
+  AND message_date IS NOT NULL
+{% if is_incremental() %}
+  -- The loader sets loaded_at on insert and on every upsert, so this picks up new and changed rows
+  -- (minus the lookback: a load that commits late can carry a loaded_at below the last run's)
+  AND loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM {{ this }}) - INTERVAL '{{ var("watermark_lookback") }}'
+{% endif %}
@@ -0,0 +1,8 @@
+-- Telegram message ids are only unique within a channel, so the staging key is (channel_name, message_id)
+SELECT
+    channel_name,
+    message_id,
+    COUNT(*) AS copies
+FROM {{ source('postgres_raw', 'staging_telegram_messages') }}
+GROUP BY channel_name, message_id
+HAVING COUNT(*) > 1
@@ -0,0 +1,94 @@
+"""
+Response cache for the API.
+
+Serialized JSON bodies are kept in a TTL cache that evicts least recently used
+entries when full. Keys include the warehouse data version, so a load or dbt
+run invalidates every cached response at once; the TTL only bounds how long
+an entry lives if no new data ever arrives. The ETag is derived from the same
+key, which lets clients that poll revalidate with If-None-Match and get a
+304 without the query being run or the body being sent.
+"""
+
+import hashlib
+import os
+import threading
+
+from cachetools import TTLCache
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from src.scripts.instrumentation import counter
+
+CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "512"))
+CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", "600"))
+
+CACHE_LOOKUPS = counter("api_cache_lookups_total", "Response cache lookups by result (hit or miss)")
+
+
+class ResponseCache:
+    """Serialized responses keyed by (data version, request path, query string)."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(request: Request, version: int) -> tuple:
+        return version, request.url.path, str(request.query_params)
+
+    @staticmethod
+    def etag(key: tuple) -> str:
+        return '"' + hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32] + '"'
+
+    def get(self, key: tuple):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_LOOKUPS.inc(result="miss" if body is None else "hit")
+        return body
+
+    def put(self, key: tuple, body: bytes):
+        with self._lock:
+            self._entries[key] = body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+async def cached_json(request: Request, cache: ResponseCache, version: int, produce) -> Response:
+    """Serve `await produce()` as JSON through the cache, answering 304 to matching revalidations."""
+    key = cache.key(request, version)
+    etag = cache.etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # clients may store it but must revalidate
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get(key)
+    if body is None:
+        body = JSONResponse(jsonable_encoder(await produce())).body
+        cache.put(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,141 @@
+"""
+Async database access for the API.
+
+One pooled async engine (asyncpg) per process, created on first use. Every
+connection gets a server-side statement timeout, so a slow query can't pin a
+pool slot indefinitely. The warehouse data version is read at most once per
+DATA_VERSION_CHECK_SECONDS however many requests arrive, so cached responses
+can be served without touching Postgres at all.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.scripts.data_version import DATA_VERSION_TABLE
+from src.scripts.instrumentation import histogram, timer
+
+load_dotenv()
+
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASS = os.getenv("POSTGRES_PASSWORD")
+DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
+DB_PORT = os.getenv("POSTGRES_PORT", "5432")
+DB_NAME = os.getenv("POSTGRES_DB", "medical_warehouse")
+
+DATABASE_URL = os.getenv(
+    "API_DATABASE_URL", f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+
+POOL_SIZE = int(os.getenv("API_DB_POOL_SIZE", "10"))                # connections kept open
+MAX_OVERFLOW = int(os.getenv("API_DB_MAX_OVERFLOW", "5"))            # extra connections under bursts
+POOL_TIMEOUT = float(os.getenv("API_DB_POOL_TIMEOUT", "5"))          # seconds to wait for a free connection
+POOL_RECYCLE = int(os.getenv("API_DB_POOL_RECYCLE", "1800"))         # reconnect after this many seconds
+STATEMENT_TIMEOUT_MS = int(os.getenv("API_DB_STATEMENT_TIMEOUT_MS", "5000"))
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("API_DATA_VERSION_CHECK_SECONDS", "5"))
+# Bulk exports stream for much longer than an interactive query may run
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("API_EXPORT_STATEMENT_TIMEOUT_MS", "1800000"))
+EXPORT_FETCH_ROWS = int(os.getenv("API_EXPORT_FETCH_ROWS", "5000"))  # rows per server-side cursor fetch
+
+QUERY_SECONDS = histogram("api_query_seconds", "Database time per API query, including waiting for a pooled connection")
+
+_engine = None
+
+
+def get_engine():
+    """The shared async engine (created lazily so importing the API never connects)."""
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            DATABASE_URL,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True,
+            connect_args={
+                "server_settings": {
+                    "statement_timeout": str(STATEMENT_TIMEOUT_MS),
+                    "application_name": "medical-telegram-api",
+                }
+            },
+        )
+    return _engine
+
+
+async def dispose_engine():
+    """Close pooled connections (called on application shutdown)."""
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+async def fetch_all(query: str, params: dict = None) -> list:
+    """Run a read-only query and return its rows as dicts."""
+    with timer(QUERY_SECONDS):
+        async with get_engine().connect() as conn:
+            result = await conn.execute(text(query), params or {})
+            return [dict(row._mapping) for row in result]
+
+
+def pool_status() -> dict:
+    """Connections in use and idle in the pool (empty before the first query)."""
+    if _engine is None:
+        return {}
+    pool = _engine.pool
+    return {"in_use": pool.checkedout(), "idle": pool.checkedin()}
+
+
+async def stream_rows(query: str, params: dict = None, fetch_rows: int = EXPORT_FETCH_ROWS,
+                      statement_timeout_ms: int = EXPORT_STATEMENT_TIMEOUT_MS):
+    """Yield a query's rows as lists of dicts, `fetch_rows` at a time, from a server-side cursor.
+
+    Only one fetch is held in memory at a time. The statement timeout is raised for this
+    transaction only, and the connection goes back to the pool when the consumer stops,
+    including when an HTTP client disconnects mid-export.
+    """
+    async with get_engine().connect() as conn:
+        await conn.execute(
+            text("SELECT set_config('statement_timeout', :timeout, true)"), {"timeout": str(statement_timeout_ms)}
+        )
+        result = await conn.stream(text(query), params or {}, execution_options={"yield_per": fetch_rows})
+        async for partition in result.partitions(fetch_rows):
+            yield [dict(row._mapping) for row in partition]
+
+
+class DataVersion:
+    """Cached view of the warehouse data version, re-read at most every `check_seconds`."""
+
+    def __init__(self, check_seconds: float = DATA_VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def read(self) -> int:
+        """Current version from the database (0 until a loader or dbt run first stamps it)."""
+        try:
+            rows = await fetch_all(f"SELECT version FROM {DATA_VERSION_TABLE}")
+        except ProgrammingError as e:  # table not created yet
+            logging.warning(f"Data version unavailable, treating as 0: {e.orig}")
+            return 0
+        return rows[0]["version"] if rows else 0
+
+    async def current(self) -> int:
+        if self._version is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return self._version
+        async with self._lock:  # one refresh however many requests are waiting
+            if self._version is None or time.monotonic() - self._checked_at >= self.check_seconds:
+                self._version = await self.read()
+                self._checked_at = time.monotonic()
+        return self._version
+
+
+data_version = DataVersion()
@@ -0,0 +1,56 @@
+"""
+Streaming NDJSON / CSV encoders for bulk exports.
+
+Both consume batches of row dicts from a server-side cursor and yield one
+encoded chunk per batch, so memory use is bounded by the fetch size however
+many rows the export has.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ";".join(str(item) for item in value)  # e.g. detected_objects
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+async def ndjson_chunks(batches):
+    """One JSON object per line."""
+    async for rows in batches:
+        yield "".join(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n" for row in rows)
+
+
+async def csv_chunks(batches, columns):
+    """A header row, then every row; list values are joined with ';'."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(row.get(column)) for column in columns] for row in rows)
+        yield buffer.getvalue()
+
+
+def encode_export(batches, export_format: str, columns):
+    return ndjson_chunks(batches) if export_format == "ndjson" else csv_chunks(batches, columns)
@@ -0,0 +1,184 @@
+"""
+SQL for the message-level endpoints: typed filters, keyset pagination and exports.
+
+Pages are fetched with keyset (cursor) pagination: each page continues from
+the sort key of the last row of the previous one, so page N costs the same as
+page 1 instead of re-reading and skipping N * limit rows like OFFSET would.
+The cursor is that sort key, JSON-encoded in URL-safe base64; clients treat
+it as opaque.
+"""
+
+import base64
+import binascii
+import json
+import os
+from datetime import date, datetime
+
+from fastapi import HTTPException
+
+MESSAGE_COLUMNS = [
+    "message_id", "channel_name", "channel_category", "date_key", "message_timestamp", "message_text",
+    "has_media", "image_path", "views", "forwards", "detected_objects", "object_count", "message_cluster_id",
+]
+MENTION_COLUMNS = ["channel_name", "message_id", "product", "category", "date_key"]
+
+# Newest first; (channel_name, message_id) breaks ties between messages posted in the same second
+MESSAGE_KEY = ["message_timestamp", "channel_name", "message_id"]
+# Primary key order of fct_product_mentions
+MENTION_KEY = ["channel_name", "message_id", "product"]
+
+# Must match the dbt var search_config that fct_messages.search_vector is built with
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "simple")
+
+
+def encode_cursor(values) -> str:
+    payload = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Sort-key values from a cursor; a malformed cursor is a 400, not a 500."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _text(value) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"expected a string, got {type(value).__name__}")
+    return value
+
+
+def parse_cursor(cursor: str, parsers) -> list:
+    """decode_cursor, then each value through its parser; a cursor with wrongly typed values is a 400 too."""
+    values = decode_cursor(cursor, len(parsers))
+    try:
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def message_filters(channel=None, date_from=None, date_to=None, product=None, detected_object=None):
+    """WHERE clauses and parameters for fct_messages (aliased f)."""
+    clauses, params = [], {}
+    if channel:
+        clauses.append("f.channel_name = :channel")
+        params["channel"] = channel
+    if date_from:
+        clauses.append("f.date_key >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        clauses.append("f.date_key <= :date_to")
+        params["date_to"] = date_to
+    if product:
+        clauses.append("""EXISTS (
+            SELECT 1 FROM fct_product_mentions p
+            WHERE p.channel_name = f.channel_name AND p.message_id = f.message_id AND p.product = :product
+        )""")
+        params["product"] = product
+    if detected_object:
+        clauses.append("f.detected_objects @> ARRAY[CAST(:detected_object AS TEXT)]")
+        params["detected_object"] = detected_object
+    return clauses, params
+
+
+def mention_filters(channel=None, date_from=None, date_to=None, product=None):
+    """WHERE clauses and parameters for fct_product_mentions (aliased p)."""
+    clauses, params = [], {}
+    if channel:
+        clauses.append("p.channel_name = :channel")
+        params["channel"] = channel
+    if date_from:
+        clauses.append("p.date_key >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        clauses.append("p.date_key <= :date_to")
+        params["date_to"] = date_to
+    if product:
+        clauses.append("p.product = :product")
+        params["product"] = product
+    return clauses, params
+
+
+def _where(clauses) -> str:
+    return ("WHERE " + "\n  AND ".join(clauses)) if clauses else ""
+
+
+def messages_query(clauses, params, cursor: str = None, limit: int = None):
+    """SELECT over fct_messages in MESSAGE_KEY order (descending), optionally one keyset page."""
+    clauses, params = list(clauses), dict(params)
+    if cursor:
+        timestamp, channel_name, message_id = parse_cursor(cursor, [datetime.fromisoformat, _text, int])
+        clauses.append("(f.message_timestamp, f.channel_name, f.message_id) < (:after_timestamp, :after_channel, :after_id)")
+        params.update(after_timestamp=timestamp, after_channel=channel_name, after_id=message_id)
+    query = f"""
+        SELECT {", ".join("f." + column for column in MESSAGE_COLUMNS)}
+        FROM fct_messages f
+        {_where(clauses)}
+        ORDER BY f.message_timestamp DESC, f.channel_name DESC, f.message_id DESC
+    """
+    if limit is not None:
+        query += "LIMIT :limit"
+        params["limit"] = limit
+    return query, params
+
+
+def mentions_query(clauses, params, cursor: str = None, limit: int = None):
+    """SELECT over fct_product_mentions in MENTION_KEY order, optionally one keyset page."""
+    clauses, params = list(clauses), dict(params)
+    if cursor:
+        channel_name, message_id, product = parse_cursor(cursor, [_text, int, _text])
+        clauses.append("(p.channel_name, p.message_id, p.product) > (:after_channel, :after_id, :after_product)")
+        params.update(after_channel=channel_name, after_id=message_id, after_product=product)
+    query = f"""
+        SELECT {", ".join("p." + column for column in MENTION_COLUMNS)}
+        FROM fct_product_mentions p
+        {_where(clauses)}
+        ORDER BY p.channel_name, p.message_id, p.product
+    """
+    if limit is not None:
+        query += "LIMIT :limit"
+        params["limit"] = limit
+    return query, params
+
+
+def next_cursor(rows, limit: int, key) -> str:
+    """Cursor for the page after `rows` (fetched with limit + 1), or None if this was the last page."""
+    if len(rows) <= limit:
+        return None
+    return encode_cursor([rows[limit - 1][column] for column in key])
+
+
+def search_query(clauses, params, q: str, limit: int, fuzzy: bool = False):
+    """Ranked message search: full text over the GIN-indexed search_vector, or trigram word
+    similarity (pg_trgm) when `fuzzy`, for misspelled product names.
+
+    Only the top `limit` rows get a highlighted snippet; ts_headline re-parses the text, so
+    it runs after the LIMIT rather than for every match.
+    """
+    params = {**params, "q": q, "limit": limit, "config": SEARCH_CONFIG}
+    if fuzzy:
+        match = "CAST(:q AS TEXT) <% f.message_text"
+        rank = "word_similarity(CAST(:q AS TEXT), f.message_text)"
+    else:
+        match = "f.search_vector @@ websearch_to_tsquery(CAST(:config AS regconfig), :q)"
+        rank = "ts_rank_cd(f.search_vector, websearch_to_tsquery(CAST(:config AS regconfig), :q))"
+    query = f"""
+        SELECT top.*,
+               ts_headline(CAST(:config AS regconfig), top.message_text,
+                           {"plainto_tsquery(CAST(:config AS regconfig), :q)" if fuzzy else "websearch_to_tsquery(CAST(:config AS regconfig), :q)"},
+                           'MaxFragments=1, MaxWords=25, MinWords=8') AS snippet
+        FROM (
+            SELECT {", ".join("f." + column for column in MESSAGE_COLUMNS)}, {rank} AS rank
+            FROM fct_messages f
+            {_where([match, *clauses])}
+            ORDER BY rank DESC, f.message_timestamp DESC
+            LIMIT :limit
+        ) top
+        ORDER BY top.rank DESC, top.message_timestamp DESC
+    """
+    return query, params
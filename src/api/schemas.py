@@ -0,0 +1,51 @@
+"""Response models for the message-level API endpoints."""
+
+from datetime import date, datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class Message(BaseModel):
+    message_id: int
+    channel_name: str
+    channel_category: Optional[str] = None
+    date_key: Optional[date] = None
+    message_timestamp: datetime
+    message_text: Optional[str] = None
+    has_media: Optional[bool] = None
+    image_path: Optional[str] = None
+    views: int = 0
+    forwards: int = 0
+    detected_objects: Optional[List[str]] = None
+    object_count: Optional[int] = None
+    message_cluster_id: Optional[int] = None  # shared by near-duplicate copies of a post
+
+
+class ProductMention(BaseModel):
+    channel_name: str
+    message_id: int
+    product: str
+    category: Optional[str] = None
+    date_key: Optional[date] = None
+
+
+class MessagePage(BaseModel):
+    items: List[Message]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page; None on the last page
+
+
+class MentionPage(BaseModel):
+    items: List[ProductMention]
+    next_cursor: Optional[str] = None
+
+
+class SearchResult(Message):
+    rank: float
+    snippet: Optional[str] = None  # matched fragment with <b>highlights</b>
+
+
+class SearchResults(BaseModel):
+    query: str
+    mode: str  # "fts" or "fuzzy": which matcher produced the results
+    items: List[SearchResult]
@@ -0,0 +1,143 @@
+"""
+Offline analytics over the Parquet archive with DuckDB: no server, no Postgres.
+
+Each archived dataset (see src/scripts/parquet_archive.py) is a view in an
+in-process DuckDB database: `messages` (raw messages) and one view per mart
+(`fct_messages`, `fct_product_mentions`, `agg_channel_daily`, ...). Month
+partitions and Parquet row-group statistics let DuckDB skip every file and
+row group a date or channel filter rules out, so year-scale questions run
+on one machine without touching the database the API serves from:
+
+    from src.scripts.archive_query import ArchiveQuery
+    archive = ArchiveQuery()
+    archive.trends(date_from="2025-01-01")
+    archive.top_products(limit=10)
+    archive.sql("SELECT channel_name, COUNT(*) FROM messages GROUP BY 1 ORDER BY 2 DESC")
+"""
+
+import argparse
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+from src.scripts.parquet_archive import ARCHIVE_DIR, UNKNOWN_MONTH, marts_dir, messages_dir
+from src.scripts.shared_queries import top_products_sql
+
+
+def _month(value) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m")
+
+
+class ArchiveQuery:
+    """A DuckDB connection with a view over every archived dataset."""
+
+    def __init__(self, archive_dir: Path = None, threads: int = None, memory_limit: str = None):
+        self.archive_dir = Path(archive_dir or ARCHIVE_DIR)
+        self.conn = duckdb.connect()
+        if threads:
+            self.conn.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            self.conn.execute("SET memory_limit = ?", [memory_limit])
+        self.views = []
+        datasets = {"messages": messages_dir(self.archive_dir)}
+        mart_root = marts_dir(self.archive_dir)
+        if mart_root.exists():
+            datasets.update({path.name: path for path in sorted(mart_root.iterdir()) if path.is_dir()
+                             and not path.name.startswith(".")})
+        for name, path in datasets.items():
+            if any(path.rglob("*.parquet")):
+                self._create_view(name, path)
+
+    def _create_view(self, name: str, path: Path):
+        files = str(path / "**" / "*.parquet").replace("'", "''")
+        partitioned = any(child.is_dir() and child.name.startswith("month=") for child in path.iterdir())
+        options = ", hive_partitioning = true, hive_types = {'month': VARCHAR}" if partitioned else ""
+        self.conn.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet('{files}'{options})")
+        self.views.append(name)
+
+    def _require(self, *views):
+        missing = [view for view in views if view not in self.views]
+        if missing:
+            raise FileNotFoundError(
+                f"{', '.join(missing)} not archived in {self.archive_dir}; run python -m src.scripts.parquet_archive"
+            )
+
+    def sql(self, query: str, params=None) -> pd.DataFrame:
+        """Run any query against the archive views and return a DataFrame."""
+        return self.conn.execute(query, params or []).df()
+
+    @staticmethod
+    def _date_filters(column: str, date_from=None, date_to=None, month_column: str = None):
+        """WHERE clauses and params for a date range; bounds on `month_column` prune whole partitions."""
+        clauses, params = [], []
+        if date_from is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(pd.Timestamp(date_from).date())
+            if month_column:
+                clauses.append(f"{month_column} >= ? AND {month_column} <> ?")
+                params += [_month(date_from), UNKNOWN_MONTH]
+        if date_to is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(pd.Timestamp(date_to).date())
+            if month_column:
+                clauses.append(f"{month_column} <= ?")
+                params.append(_month(date_to))
+        return clauses, params
+
+    def trends(self, date_from=None, date_to=None, channel: str = None) -> pd.DataFrame:
+        """Weekly posting volume, as /trends serves it, from the archived agg_channel_daily."""
+        self._require("agg_channel_daily", "dim_dates")
+        clauses, params = self._date_filters("a.date_key", date_from, date_to, "a.month")
+        if channel:
+            clauses.append("a.channel_name = ?")
+            params.append(channel)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.sql(f"""
+            SELECT d.year, d.month, d.week, d.day_name, d.is_weekend,
+                   SUM(a.message_count)::BIGINT AS message_count
+            FROM agg_channel_daily a
+            JOIN dim_dates d ON a.date_key = d.date_key
+            {where}
+            GROUP BY d.year, d.month, d.week, d.day_name, d.is_weekend
+            ORDER BY d.year, d.month, d.week
+        """, params)
+
+    def daily_volume(self, date_from=None, date_to=None, channel: str = None) -> pd.DataFrame:
+        """Messages per channel per day straight from the raw archive (no marts needed)."""
+        self._require("messages")
+        clauses, params = self._date_filters("CAST(message_date AS DATE)", date_from, date_to, "month")
+        if channel:
+            clauses.append("channel_name = ?")
+            params.append(channel)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.sql(f"""
+            SELECT CAST(message_date AS DATE) AS date_key, channel_name,
+                   COUNT(*) AS message_count, SUM(views) AS total_views,
+                   COUNT(*) FILTER (WHERE image_path IS NOT NULL) AS messages_with_images
+            FROM messages
+            {where}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """, params)
+
+    def top_products(self, limit: int = 10, date_from=None, date_to=None, channel: str = None) -> pd.DataFrame:
+        """Most mentioned products, counting copies of a post once, as /top-products does."""
+        self._require("fct_product_mentions")
+        clauses, params = self._date_filters("p.date_key", date_from, date_to)
+        if channel:
+            clauses.append("p.channel_name = ?")
+            params.append(channel)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = top_products_sql(limit="?", where=where, clustered="message_clusters" in self.views)
+        return self.sql(query, params + [limit])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the Parquet archive with DuckDB")
+    parser.add_argument("query", nargs="?", help="SQL over the archive views (default: list them)")
+    parser.add_argument("--archive-dir", type=Path, default=ARCHIVE_DIR, help="archive root")
+    args = parser.parse_args()
+    archive = ArchiveQuery(args.archive_dir)
+    with pd.option_context("display.max_rows", 100, "display.width", 200):
+        print(archive.sql(args.query) if args.query else "\n".join(archive.views))
@@ -0,0 +1,91 @@
+"""
+Benchmark YOLO inference throughput per worker configuration.
+
+Runs the same image sample through each WORKERSxTHREADS configuration (no
+database, no detection cache) and reports images/sec overall and per worker.
+
+    python -m src.scripts.benchmark_inference --images data/raw/images --configs 1x8,2x4,4x2,8x1
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from src.scripts.enrich_images_yolo import BATCH_SIZE, IMG_SIZE, MODEL_NAME
+from src.scripts.inference_pool import InferencePool, LocalInference
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def parse_configs(spec: str):
+    """'1x8,2x4' -> [(1, 8), (2, 4)] as (workers, threads per worker)."""
+    configs = []
+    for part in spec.split(","):
+        workers, threads = part.lower().split("x")
+        configs.append((int(workers), int(threads)))
+    return configs
+
+
+def run_config(image_paths, workers: int, threads: int, batch_size: int = BATCH_SIZE):
+    """Time one configuration over all images; model loading is excluded by warming up first."""
+    if workers > 1:
+        runner = InferencePool(workers, threads, MODEL_NAME, IMG_SIZE)
+    else:
+        runner = LocalInference(MODEL_NAME, IMG_SIZE, threads)
+    batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+
+    with runner:
+        runner.warm_up()  # every worker, so model load time isn't counted
+
+        started = time.perf_counter()
+        in_flight = 0
+        for batch_id, batch in enumerate(batches):
+            runner.submit(batch_id, [(str(p), None, str(p)) for p in batch])
+            in_flight += 1
+            while in_flight > workers * 2:
+                runner.get()
+                in_flight -= 1
+        while in_flight:
+            runner.get()
+            in_flight -= 1
+        elapsed = time.perf_counter() - started
+
+    images_per_sec = len(image_paths) / elapsed
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "images": len(image_paths),
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(images_per_sec, 2),
+        "images_per_sec_per_worker": round(images_per_sec / workers, 2),
+    }
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark YOLO inference per worker configuration")
+    parser.add_argument("--images", default="data/raw/images", help="directory searched recursively for images")
+    parser.add_argument("--limit", type=int, default=256, help="number of images in the sample")
+    parser.add_argument("--configs", default=f"1x{cores},{max(1, cores // 2)}x2,{cores}x1", help="WORKERSxTHREADS list")
+    parser.add_argument("--output", help="also write results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    image_paths = sorted(p for p in Path(args.images).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)[: args.limit]
+    if not image_paths:
+        raise SystemExit(f"No images found under {args.images}")
+
+    results = [run_config(image_paths, workers, threads) for workers, threads in parse_configs(args.configs)]
+
+    print(f"{'config':>8} {'images/s':>10} {'per worker':>11} {'seconds':>9}")
+    for r in results:
+        print(f"{r['workers']}x{r['threads_per_worker']:<6} {r['images_per_sec']:>10} {r['images_per_sec_per_worker']:>11} {r['seconds']:>9}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
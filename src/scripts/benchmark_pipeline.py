@@ -0,0 +1,458 @@
+"""
+End-to-end pipeline benchmark.
+
+Times each stage of the pipeline (synthetic data generation, the scraper
+against an offline Telegram stand-in, raw-file parsing, the COPY load, product mention extraction, duplicate clustering,
+dbt, image preprocessing, YOLO enrichment) and the API's p50/p99 latencies, and writes the results
+as JSON so runs can be compared:
+
+    python -m src.scripts.benchmark_pipeline --generate 100000 --output bench/100k.json
+    python -m src.scripts.benchmark_pipeline --stages api --compare bench/100k.json
+
+Every stage runs in its own child process, so its wall time and peak RSS are
+its own (dbt's peak includes the dbt process it starts). Throughput is the
+number of items the stage processed (messages, rows, images or requests) per
+second. Stages write to the warehouse configured in .env, so run this against
+a scratch Postgres, and from an empty warehouse when comparing against a
+baseline: incremental stages only process what is new. The cold import time
+of each entry point is timed too, in fresh interpreters, since every short
+cron invocation pays it.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from src.scripts.downloads import IMAGES_DIR
+from src.scripts.raw_sink import RAW_DIR
+
+STAGES = ["generate", "scrape", "parse", "load", "mentions", "dedup", "dbt", "images", "yolo", "api"]
+DEFAULT_STAGES = ["scrape", "parse", "load", "mentions", "dedup", "dbt", "images", "yolo", "api"]
+DBT_PROJECT_DIR = Path(__file__).resolve().parents[2] / "medical_warehouse_dbt"
+
+# API requests timed per endpoint; {channel} and {product} are filled from the data
+API_ENDPOINTS = [
+    "/top-products",
+    "/channel-visuals",
+    "/trends",
+    "/messages?limit=100",
+    "/messages?limit=100&channel={channel}",
+    "/messages?limit=100&product={product}",
+    "/mentions?limit=100&product={product}",
+    "/search?q={product}",
+]
+
+# Entry points whose cold import (a fresh interpreter, as every cron invocation pays) is timed
+IMPORT_MODULES = [
+    "src.scripts.scraper",
+    "src.scripts.loader",
+    "src.scripts.product_mentions",
+    "src.scripts.dedup_messages",
+    "src.scripts.enrich_images_yolo",
+    "src.api.main",
+]
+IMPORT_NOISE_MS = 50  # --compare ignores import slowdowns smaller than this
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of `values` (q in 0..100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1]
+
+
+def _peak_rss_mb(rusage) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(rusage.ru_maxrss / scale, 1)
+
+
+def run_stage(name: str, args) -> dict:
+    """Run one stage in a child process and return its timing, throughput and peak RSS."""
+    command = [sys.executable, "-m", "src.scripts.benchmark_pipeline", "--run-stage", name, *_forwarded(args)]
+    logging.info(f"Running stage {name}")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    output = process.stdout.read()
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(process.pid, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_mb = _peak_rss_mb(rusage)
+    else:  # Windows: no per-child resource usage
+        returncode, peak_rss_mb = process.wait(), None
+    seconds = time.perf_counter() - started
+    if returncode != 0:
+        raise RuntimeError(f"Stage {name} failed with exit code {returncode}")
+
+    result = json.loads(output.strip().splitlines()[-1])  # the stage prints its result last
+    seconds = result.pop("seconds", None) or seconds  # stages that build fixtures time only their work
+    items = result.pop("items")
+    return {
+        "seconds": round(seconds, 3),
+        "items": items,
+        "unit": result.pop("unit"),
+        "items_per_sec": round(items / seconds, 1) if seconds else None,
+        "peak_rss_mb": peak_rss_mb,
+        **result,
+    }
+
+
+def _forwarded(args) -> list:
+    """The options a child stage needs, as command-line arguments."""
+    forwarded = [
+        "--raw-dir", str(args.raw_dir), "--images-dir", str(args.images_dir),
+        "--generate", str(args.generate or 0), "--seed", str(args.seed),
+        "--api-requests", str(args.api_requests), "--api-concurrency", str(args.api_concurrency),
+        "--scrape-messages", str(args.scrape_messages), "--scrape-latency", str(args.scrape_latency),
+        "--scrape-media-latency", str(args.scrape_media_latency),
+    ]
+    if args.dbt_profiles_dir:
+        forwarded += ["--dbt-profiles-dir", str(args.dbt_profiles_dir)]
+    return forwarded
+
+
+def time_imports(modules=IMPORT_MODULES, runs: int = 3) -> dict:
+    """Best-of-`runs` cold import time of each module in ms, each import in a fresh interpreter."""
+    timings = {}
+    for module in modules:
+        code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+        samples = []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+            if result.returncode != 0:
+                logging.warning(f"Could not import {module}: {result.stderr.strip().splitlines()[-1:]}")
+                break
+            samples.append(float(result.stdout.strip().splitlines()[-1]))
+        timings[module] = round(min(samples) * 1000, 1) if samples else None
+    return timings
+
+
+# Stage bodies: each runs inside the child process and returns {"items": n, "unit": ..., extra...}
+
+def stage_generate(args) -> dict:
+    from src.scripts.synthetic_data import generate
+
+    summary = generate(args.generate, seed=args.seed, raw_dir=args.raw_dir, images_dir=args.images_dir)
+    return {"items": summary["messages"], "unit": "messages", "images": summary["images"]}
+
+
+def stage_scrape(args) -> dict:
+    # Request budgets are lifted unless set in the environment, so this times the scraper, not the limits
+    os.environ.setdefault("SCRAPER_REQUESTS_PER_SECOND", "1000000")
+    os.environ.setdefault("SCRAPER_DOWNLOADS_PER_SECOND", "1000000")
+    from src.scripts.fake_telegram import FakeTelegramClient
+
+    fake = FakeTelegramClient.synthetic(
+        args.scrape_messages, seed=args.seed, latency=args.scrape_latency, media_latency=args.scrape_media_latency
+    )
+    workdir = tempfile.mkdtemp(prefix="scrape_bench_")
+    os.chdir(workdir)  # the scraper writes data/ and logs/ relative to the working directory
+    from src.scripts import scraper
+
+    logging.getLogger().setLevel(logging.WARNING)  # one line per saved message otherwise
+    started = time.perf_counter()
+    asyncio.run(scraper.main(limit=args.scrape_messages, channels=fake.channels, telegram=fake))
+    seconds = time.perf_counter() - started
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "items": fake.stats["messages"],
+        "unit": "messages",
+        "seconds": round(seconds, 3),
+        "requests": fake.stats["requests"],
+        "downloads": fake.stats["downloads"],
+        "max_concurrent_downloads": fake.stats["max_concurrent_downloads"],
+    }
+
+
+def _loader(args):
+    from src.scripts import loader
+
+    loader.RAW_DIR = args.raw_dir
+    return loader
+
+
+def stage_parse(args) -> dict:
+    from src.scripts.raw_parser import iter_parsed_shards
+
+    loader = _loader(args)
+    entries = [{"file_path": str(p), "size_bytes": p.stat().st_size} for p in loader.list_raw_files()]
+    rows = size = 0
+    for batch, _, stats in iter_parsed_shards(entries, loader.PARSE_WORKERS):
+        rows += batch.num_rows
+        size += stats["bytes"]
+    return {"items": rows, "unit": "messages", "files": len(entries), "megabytes": round(size / 1e6, 1)}
+
+
+def stage_load(args) -> dict:
+    from src.scripts.data_version import bump_data_version
+
+    loader = _loader(args)
+    loader.create_staging_table()
+    loader.create_manifest_table()
+    new_files = loader.find_unloaded_files(loader.list_raw_files(), loader.fetch_manifest())
+    rows = loader.copy_load(new_files) if new_files else 0
+    if new_files:
+        bump_data_version(loader.get_engine(), "loader")
+    return {"items": rows, "unit": "messages", "files": len(new_files)}
+
+
+def stage_mentions(args) -> dict:
+    from src.scripts import product_mentions
+
+    return {"items": product_mentions.main(), "unit": "messages"}
+
+
+def stage_dedup(args) -> dict:
+    from src.scripts import dedup_messages
+
+    return {"items": dedup_messages.main(), "unit": "messages"}
+
+
+def _scalar(query: str, default=0, params: dict = None):
+    from sqlalchemy import text
+
+    from src.scripts.loader import get_engine
+
+    with get_engine().connect() as conn:
+        try:
+            return conn.execute(text(query), params or {}).scalar()
+        except Exception:  # table not created yet
+            return default
+
+
+def stage_dbt(args) -> dict:
+    # Messages merged into fct_messages by this (incremental) run
+    pending = _scalar("""
+        SELECT COUNT(*) FROM staging_telegram_messages
+        WHERE loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM fct_messages)
+    """, None)
+    if pending is None:
+        pending = _scalar("SELECT COUNT(*) FROM staging_telegram_messages")
+    command = ["dbt", "run", "--project-dir", str(DBT_PROJECT_DIR)]
+    if args.dbt_profiles_dir:
+        command += ["--profiles-dir", str(args.dbt_profiles_dir)]
+    subprocess.run(command, check=True, stdout=sys.stderr)
+    return {"items": pending, "unit": "messages"}
+
+
+def stage_images(args) -> dict:
+    from src.scripts import image_preprocess
+
+    return {"items": image_preprocess.main(images_dir=args.images_dir), "unit": "images"}
+
+
+def stage_yolo(args) -> dict:
+    from src.scripts import enrich_images_yolo
+
+    started_at = datetime.now(timezone.utc)
+    with enrich_images_yolo.make_runner() as runner:
+        warm_up_started = time.perf_counter()
+        enrich_images_yolo.warm_up(runner)
+        warm_up_seconds = time.perf_counter() - warm_up_started
+        enrich_images_yolo.main(runner=runner)
+    enriched = _scalar(
+        f"SELECT COUNT(*) FROM {enrich_images_yolo.ENRICHMENT_TABLE} WHERE enriched_at >= :started_at",
+        params={"started_at": started_at},
+    )
+    return {"items": enriched, "unit": "images", "warm_up_seconds": round(warm_up_seconds, 3)}
+
+
+async def _time_requests(client, paths, concurrency: int, before=None) -> list:
+    """Issue the requests with at most `concurrency` in flight; returns per-request latency in ms."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(path):
+        async with semaphore:
+            if before is not None:
+                before()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+
+    await asyncio.gather(*(one(path) for path in paths))
+    return latencies
+
+
+async def _benchmark_api(args) -> dict:
+    import httpx
+
+    from src.api import main as api
+    from src.api.database import dispose_engine
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per request otherwise
+
+    channel = _scalar("SELECT channel_name FROM dim_channels ORDER BY total_messages DESC LIMIT 1", "tikvahethiopia")
+    product = _scalar("SELECT product FROM fct_product_mentions GROUP BY product ORDER BY COUNT(*) DESC LIMIT 1", "paracetamol")
+    paths = [endpoint.format(channel=channel, product=product) for endpoint in API_ENDPOINTS]
+
+    endpoints = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for path in paths:
+            # Uncached: every request reaches Postgres, one at a time
+            latencies = await _time_requests(client, [path] * args.api_requests, 1, before=api.response_cache.clear)
+            endpoints[path] = {"p50_ms": round(percentile(latencies, 50), 2), "p99_ms": round(percentile(latencies, 99), 2)}
+
+        # Cached: the mix of endpoints under concurrency, as a dashboard polling the API would see it.
+        # One warm-up request per path first, so the pass times cache hits rather than misses
+        await _time_requests(client, paths, 1)
+        mixed = paths * args.api_requests
+        started = time.perf_counter()
+        latencies = await _time_requests(client, mixed, args.api_concurrency)
+        seconds = time.perf_counter() - started
+    await dispose_engine()
+    cached = {
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "requests_per_sec": round(len(mixed) / seconds, 1),
+    }
+    return {"items": len(paths) * args.api_requests + len(mixed), "unit": "requests", "endpoints": endpoints, "cached": cached}
+
+
+def stage_api(args) -> dict:
+    return asyncio.run(_benchmark_api(args))
+
+
+STAGE_FUNCTIONS = {
+    "generate": stage_generate,
+    "scrape": stage_scrape,
+    "parse": stage_parse,
+    "load": stage_load,
+    "mentions": stage_mentions,
+    "dedup": stage_dedup,
+    "dbt": stage_dbt,
+    "images": stage_images,
+    "yolo": stage_yolo,
+    "api": stage_api,
+}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """Regressions of `results` against `baseline` beyond `tolerance` (a fraction), as messages."""
+    regressions = []
+    for name, stage in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        if base.get("items_per_sec") and stage.get("items_per_sec") is not None \
+                and stage["items_per_sec"] < base["items_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {stage['items_per_sec']} {stage['unit']}/s, baseline {base['items_per_sec']}")
+        if base.get("peak_rss_mb") and stage.get("peak_rss_mb") is not None \
+                and stage["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {stage['peak_rss_mb']} MB, baseline {base['peak_rss_mb']} MB")
+        for path, latency in stage.get("endpoints", {}).items():
+            base_latency = base.get("endpoints", {}).get(path)
+            if base_latency and latency["p99_ms"] > base_latency["p99_ms"] * (1 + tolerance):
+                regressions.append(f"{name} {path}: p99 {latency['p99_ms']} ms, baseline {base_latency['p99_ms']} ms")
+    for module, import_ms in results.get("imports", {}).items():
+        base_ms = baseline.get("imports", {}).get(module)
+        if base_ms and import_ms is not None and import_ms > base_ms * (1 + tolerance) \
+                and import_ms - base_ms > IMPORT_NOISE_MS:
+            regressions.append(f"import {module}: {import_ms} ms, baseline {base_ms} ms")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict):
+    print(f"{'stage':<10} {'seconds':>9} {'items':>10} {'items/s':>11} {'peak RSS MB':>12}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<10} {stage['seconds']:>9} {stage['items']:>10} {stage['items_per_sec']!s:>11} {stage['peak_rss_mb']!s:>12}")
+    api = results["stages"].get("api")
+    if api:
+        print(f"\n{'endpoint (uncached)':<45} {'p50 ms':>8} {'p99 ms':>8}")
+        for path, latency in api["endpoints"].items():
+            print(f"{path:<45} {latency['p50_ms']:>8} {latency['p99_ms']:>8}")
+        cached = api["cached"]
+        print(f"{'all endpoints (cached)':<45} {cached['p50_ms']:>8} {cached['p99_ms']:>8}  {cached['requests_per_sec']} req/s")
+    if results.get("imports"):
+        print(f"\n{'module (cold import)':<45} {'ms':>8}")
+        for module, import_ms in results["imports"].items():
+            print(f"{module:<45} {import_ms!s:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage and the API end to end")
+    parser.add_argument("--stages", default=",".join(DEFAULT_STAGES), help=f"comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--generate", type=int, help="first generate this many synthetic messages (adds the generate stage)")
+    parser.add_argument("--seed", type=int, default=42, help="seed for --generate")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR, help="raw message directory read by the loader")
+    parser.add_argument("--images-dir", type=Path, default=IMAGES_DIR, help="image directory for --generate")
+    parser.add_argument("--dbt-profiles-dir", type=Path, help="passed to dbt run as --profiles-dir")
+    parser.add_argument("--api-requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--api-concurrency", type=int, default=8, help="concurrent requests in the cached pass")
+    parser.add_argument("--scrape-messages", type=int, default=5000, help="messages served by the fake Telegram client")
+    parser.add_argument("--scrape-latency", type=float, default=0.05, help="fake Telegram latency per request (seconds)")
+    parser.add_argument("--scrape-media-latency", type=float, default=0.2, help="fake Telegram latency per image download (seconds)")
+    parser.add_argument("--import-runs", type=int, default=3, help="cold imports timed per entry point (0 = skip)")
+    parser.add_argument("--output", type=Path, help="write results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="baseline results JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline (fraction)")
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)  # internal: run one stage in this process
+    args = parser.parse_args()
+
+    if args.run_stage:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+        result = STAGE_FUNCTIONS[args.run_stage](args)
+        print(json.dumps(result, default=str))
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    if args.generate and "generate" not in stages:
+        stages.insert(0, "generate")
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {"stages": stages, "generate": args.generate, "seed": args.seed, "raw_dir": str(args.raw_dir),
+                   "api_requests": args.api_requests, "api_concurrency": args.api_concurrency,
+                   "scrape_messages": args.scrape_messages, "scrape_latency": args.scrape_latency,
+                   "scrape_media_latency": args.scrape_media_latency, "import_runs": args.import_runs},
+        "stages": {},
+    }
+    if args.import_runs:
+        results["imports"] = time_imports(runs=args.import_runs)
+    for stage in stages:
+        results["stages"][stage] = run_stage(stage, args)
+
+    print_report(results)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+        logging.info(f"Results written to {args.output}")
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        for regression in regressions:
+            logging.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logging.info(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Per-channel scrape checkpoints.
+
+Each channel gets a small JSON file under data/checkpoints/ holding:
+    last_message_id    high-water mark; incremental runs fetch only newer messages
+    backfill_cursor    oldest message id reached so far; backfill walks below it
+    backfill_complete  True once backfill has reached the start of the channel
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+CHECKPOINT_DIR = Path("data/checkpoints")
+
+
+def checkpoint_path(channel: str, checkpoint_dir: Path = None) -> Path:
+    return (checkpoint_dir or CHECKPOINT_DIR) / f"{channel.lower()}.json"
+
+
+def load_checkpoint(channel: str, checkpoint_dir: Path = None) -> dict:
+    """Return the saved checkpoint for a channel, or an empty dict if it was never scraped."""
+    path = checkpoint_path(channel, checkpoint_dir)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(channel: str, checkpoint: dict, checkpoint_dir: Path = None):
+    """Write the checkpoint atomically (temp file + rename) so a crash never leaves it half-written."""
+    path = checkpoint_path(channel, checkpoint_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint["updated_at"] = datetime.now(timezone.utc).isoformat()
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
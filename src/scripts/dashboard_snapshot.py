@@ -0,0 +1,202 @@
+"""
+Precomputed dashboard datasets.
+
+The dashboard draws every chart from a small versioned snapshot instead of
+querying Postgres in each session:
+
+    data/snapshots/dashboard/v<data version>/<dataset>.parquet
+    data/snapshots/dashboard/LATEST          name of the newest complete snapshot
+
+A snapshot is named after the warehouse data version it was built from, so
+an unchanged warehouse is never queried twice. It is written to a temporary
+directory, renamed into place, and only then made LATEST, so the dashboard
+never sees half a snapshot. Every dataset is read in one REPEATABLE READ
+transaction, so all charts agree with each other. Long time series are
+downsampled here, once, to at most MAX_POINTS points.
+
+The orchestrator builds a snapshot after each dbt run; after a manual
+`dbt run`, build one with:
+
+    python -m src.scripts.dashboard_snapshot
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from src.scripts.data_version import DATA_VERSION_TABLE, read_data_version
+from src.scripts.database import get_engine
+from src.scripts.instrumentation import record_run
+from src.scripts.shared_queries import top_products_sql
+
+load_dotenv()
+
+SNAPSHOT_DIR = Path(os.getenv("DASHBOARD_SNAPSHOT_DIR", "data/snapshots/dashboard"))
+MAX_POINTS = int(os.getenv("DASHBOARD_MAX_POINTS", "500"))  # points per time series chart
+KEEP_SNAPSHOTS = 3  # older snapshots are removed once a newer one is published
+TOP_PRODUCTS = 20   # the dashboard's slider goes up to 20
+COMPRESSION = "zstd"
+LATEST_FILE = "LATEST"
+
+DATASETS = {
+    # Near-duplicate reposts (message_clusters) count once, as in /top-products
+    "top_products": top_products_sql(limit=str(TOP_PRODUCTS)),
+    "visual_stats": """
+        SELECT channel_category,
+               SUM(total_objects)::bigint AS total_objects,
+               SUM(total_objects)::float / NULLIF(SUM(messages_with_objects), 0) AS avg_objects,
+               SUM(messages_with_objects)::bigint AS messages_with_images
+        FROM agg_channel_daily
+        GROUP BY channel_category
+        HAVING SUM(messages_with_objects) > 0
+        ORDER BY total_objects DESC
+    """,
+    "monthly_volume": """
+        SELECT year, month, SUM(a.message_count)::bigint AS count
+        FROM agg_channel_daily a
+        JOIN dim_dates d ON a.date_key = d.date_key
+        GROUP BY year, month
+        ORDER BY year, month
+    """,
+    "daily_volume": """
+        SELECT date_key, SUM(message_count)::bigint AS count
+        FROM agg_channel_daily
+        GROUP BY date_key
+        ORDER BY date_key
+    """,
+    "channels": "SELECT channel_name FROM dim_channels ORDER BY channel_name",
+}
+
+
+def downsample(df: pd.DataFrame, max_points: int = MAX_POINTS) -> pd.DataFrame:
+    """Daily counts -> at most `max_points` buckets of equal width, as the mean count per day.
+
+    Missing days count as zero. Each row's date_key is the first day of its bucket, and
+    bucket_days gives the bucket's width.
+    """
+    if df.empty:
+        return df.assign(bucket_days=pd.Series(dtype="int64"))
+    daily = df.set_index(pd.to_datetime(df["date_key"]))["count"].resample("D").sum()
+    width = max(1, -(-len(daily) // max_points))
+    series = daily.resample(f"{width}D").mean() if width > 1 else daily
+    return pd.DataFrame({"date_key": series.index.date, "count": series.to_numpy(), "bucket_days": width})
+
+
+def query_datasets(engine) -> tuple:
+    """Read every dataset in one consistent snapshot; returns (data version, {name: DataFrame})."""
+    frames = {}
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        with conn.begin():
+            try:
+                with conn.begin_nested():
+                    version = conn.execute(text(f"SELECT version FROM {DATA_VERSION_TABLE}")).scalar() or 0
+            except ProgrammingError:  # nothing has bumped it yet
+                version = 0
+            for name, query in DATASETS.items():
+                try:
+                    with conn.begin_nested():
+                        frames[name] = pd.read_sql(text(query), conn)
+                except ProgrammingError as e:
+                    logging.warning(f"Skipping dataset {name}, its tables are missing: {e.orig}")
+    return version, frames
+
+
+def snapshot_name(version: int) -> str:
+    return f"v{version}"
+
+
+def publish(frames: dict, version: int, snapshot_dir: Path = None, keep: int = KEEP_SNAPSHOTS) -> Path:
+    """Write `frames` as snapshot `version`, make it LATEST and drop all but the newest `keep` snapshots."""
+    snapshot_dir = Path(snapshot_dir or SNAPSHOT_DIR)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    final_dir = snapshot_dir / snapshot_name(version)
+    tmp_dir = snapshot_dir / f".tmp-{snapshot_name(version)}-{uuid.uuid4().hex[:8]}"
+    tmp_dir.mkdir()
+    for name, df in frames.items():
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_dir / f"{name}.parquet",
+                       compression=COMPRESSION)
+    manifest = {
+        "version": version,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "datasets": {name: len(df) for name, df in frames.items()},
+    }
+    (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    replaced = None
+    if final_dir.exists():  # --force rebuild of a published version: swap, then delete
+        replaced = final_dir.rename(snapshot_dir / f".old-{tmp_dir.name[5:]}")
+    os.replace(tmp_dir, final_dir)
+    if replaced is not None:
+        shutil.rmtree(replaced, ignore_errors=True)
+
+    latest_tmp = snapshot_dir / f"{LATEST_FILE}.tmp"
+    latest_tmp.write_text(final_dir.name, encoding="utf-8")
+    os.replace(latest_tmp, snapshot_dir / LATEST_FILE)
+
+    # Sessions that already loaded an older snapshot keep it in memory; only the files go
+    published = sorted((path for path in snapshot_dir.glob("v*") if path.is_dir() and path.name[1:].isdigit()),
+                       key=lambda path: int(path.name[1:]), reverse=True)
+    for old in published[keep:]:
+        if old != final_dir:
+            shutil.rmtree(old, ignore_errors=True)
+    logging.info(f"Published dashboard snapshot {final_dir} ({manifest['datasets']})")
+    return final_dir
+
+
+def build_snapshot(engine, snapshot_dir: Path = None, max_points: int = MAX_POINTS, force: bool = False) -> Path:
+    """Query, downsample and publish the dashboard datasets unless this data version is already published."""
+    snapshot_dir = Path(snapshot_dir or SNAPSHOT_DIR)
+    version = read_data_version(engine)
+    if not force and latest_snapshot(snapshot_dir) == snapshot_name(version):
+        logging.info(f"Dashboard snapshot for data version {version} is already published")
+        return snapshot_dir / snapshot_name(version)
+    version, frames = query_datasets(engine)
+    if "daily_volume" in frames:
+        frames["daily_volume"] = downsample(frames["daily_volume"], max_points)
+    if "monthly_volume" in frames:
+        monthly = frames["monthly_volume"]
+        monthly["year_month"] = monthly["year"].astype(str) + "-" + monthly["month"].astype(str).str.zfill(2)
+    return publish(frames, version, snapshot_dir)
+
+
+def latest_snapshot(snapshot_dir: Path = None):
+    """Name of the newest published snapshot, or None if none was built yet."""
+    try:
+        return (Path(snapshot_dir or SNAPSHOT_DIR) / LATEST_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+
+
+def load_snapshot(name: str, snapshot_dir: Path = None) -> dict:
+    """{dataset: DataFrame} for snapshot `name`, plus its manifest under "manifest"."""
+    path = Path(snapshot_dir or SNAPSHOT_DIR) / name
+    snapshot = {"manifest": json.loads((path / "manifest.json").read_text(encoding="utf-8"))}
+    for dataset in snapshot["manifest"]["datasets"]:
+        snapshot[dataset] = pq.read_table(path / f"{dataset}.parquet").to_pandas()
+    return snapshot
+
+
+def main(snapshot_dir: Path = None, max_points: int = MAX_POINTS, force: bool = False) -> Path:
+    return build_snapshot(get_engine(), snapshot_dir, max_points, force)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Precompute the dashboard datasets into a versioned Parquet snapshot")
+    parser.add_argument("--snapshot-dir", type=Path, default=SNAPSHOT_DIR, help="where snapshots are published")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help="points per time series after downsampling")
+    parser.add_argument("--force", action="store_true", help="rebuild even if this data version is already published")
+    args = parser.parse_args()
+    with record_run("dashboard_snapshot"):
+        main(args.snapshot_dir, args.max_points, args.force)
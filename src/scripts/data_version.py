@@ -0,0 +1,52 @@
+"""
+Warehouse data version stamp.
+
+A single-row counter bumped by every stage that changes what the API serves
+(loader, product mention extraction, duplicate clustering, and dbt through its
+on-run-end hook). The API keys its response cache and ETags on it, so cached
+responses stay valid exactly until the next load or dbt run.
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+DATA_VERSION_TABLE = "warehouse_data_version"
+
+CREATE_DATA_VERSION_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        updated_by TEXT
+    )
+"""
+
+BUMP_DATA_VERSION_SQL = f"""
+    INSERT INTO {DATA_VERSION_TABLE} (id, version, updated_at, updated_by)
+    VALUES (TRUE, 1, CURRENT_TIMESTAMP, :source)
+    ON CONFLICT (id) DO UPDATE SET
+        version = {DATA_VERSION_TABLE}.version + 1,
+        updated_at = EXCLUDED.updated_at,
+        updated_by = EXCLUDED.updated_by
+    RETURNING version
+"""
+
+
+def bump_data_version(engine, source: str) -> int:
+    """Increment the warehouse data version after `source` changed served data; returns the new version."""
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_DATA_VERSION_SQL))
+        version = conn.execute(text(BUMP_DATA_VERSION_SQL), {"source": source}).scalar()
+    logging.info(f"Warehouse data version is now {version} (bumped by {source})")
+    return version
+
+
+def read_data_version(engine) -> int:
+    """The current warehouse data version, or 0 if nothing has bumped it yet."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT version FROM {DATA_VERSION_TABLE}")).scalar() or 0
+    except ProgrammingError:  # table not created yet
+        return 0
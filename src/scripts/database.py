@@ -0,0 +1,34 @@
+"""
+Warehouse connection for the pipeline scripts.
+
+Built from the same POSTGRES_* settings as the loader and the API, so every
+stage reaches the same database wherever it is deployed. Each process gets
+one engine, and so one connection pool, created on first use.
+"""
+
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+load_dotenv()
+
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASS = os.getenv("POSTGRES_PASSWORD")
+DB_HOST = os.getenv("POSTGRES_HOST", "localhost")
+DB_PORT = os.getenv("POSTGRES_PORT", "5432")
+DB_NAME = os.getenv("POSTGRES_DB", "medical_warehouse")
+
+DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+_engine = None
+_engine_pid = None
+
+
+def get_engine():
+    """This process's engine (a forked worker creates its own rather than sharing the parent's pool)."""
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        _engine = create_engine(DATABASE_URL)
+        _engine_pid = os.getpid()
+    return _engine
@@ -0,0 +1,475 @@
+"""
+Near-duplicate message clustering (MinHash + LSH) into message_clusters.
+
+Promotional posts are copied almost word for word across channels and
+re-posted for days, so counting raw messages inflates everything downstream.
+This stage runs after the loader, next to product mention extraction: every
+message's text is cut into word shingles and summarised by a MinHash
+signature, whose Jaccard similarity estimate is compared only between
+messages that share at least one LSH band. Candidate lookups go through a GIN
+index on the stored band keys, so a batch costs time proportional to its own
+size and the buckets it touches, never to the whole history.
+
+Each message gets a message_cluster_id; near-duplicates share one. dbt joins
+it into fct_messages and the API counts distinct clusters instead of rows.
+Only messages loaded since the previous run, or in a short lookback window
+before it (a load can commit after a run read past its loaded_at), are
+clustered; re-loads whose text did not change are left alone. If the MinHash
+parameters changed, everything is re-clustered. A full re-cluster deletes the
+old clusters and writes the new ones in a single transaction, so readers keep
+the previous clusters until it commits and a crash leaves them untouched.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import zlib
+from contextlib import nullcontext
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from src.scripts.data_version import bump_data_version
+from src.scripts.database import get_engine
+
+load_dotenv()
+
+SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "3"))   # words per shingle
+NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))           # MinHash signature length
+BANDS = int(os.getenv("DEDUP_BANDS", "32"))                  # LSH bands (NUM_PERM / BANDS rows each)
+THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))       # estimated Jaccard similarity for a duplicate
+BATCH_SIZE = int(os.getenv("DEDUP_BATCH_SIZE", "5000"))      # messages clustered and written per transaction
+WATERMARK_LOOKBACK = int(os.getenv("WATERMARK_LOOKBACK_SECONDS", "300"))  # re-read for loads that committed late
+SEED = 1  # fixed: signatures written by different runs must be comparable
+
+CLUSTERS_TABLE = "message_clusters"
+CLUSTER_ID_SEQUENCE = "message_cluster_id_seq"
+STATE_TABLE = "message_cluster_state"
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_URL = re.compile(r"https?://\S+|t\.me/\S+|@\w+")
+_WORD = re.compile(r"\w+")
+
+
+def shingles(message_text: str, size: int = SHINGLE_WORDS) -> set:
+    """Word n-grams of a message, ignoring case, punctuation, links and @handles.
+
+    Messages shorter than `size` words are a single shingle; empty ones have none.
+    """
+    words = _WORD.findall(_URL.sub(" ", (message_text or "").casefold()))
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def params_version(num_perm: int = NUM_PERM, bands: int = BANDS, shingle_words: int = SHINGLE_WORDS) -> str:
+    """Identifies the signature layout; a new version triggers a full re-cluster."""
+    params = {"num_perm": num_perm, "bands": bands, "shingle_words": shingle_words, "seed": SEED}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class MinHasher:
+    """MinHash signatures and LSH band keys for many messages at once."""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, seed: int = SEED):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        # Universal hashes (a * x + b) mod p; a < 2**31 keeps a * x inside uint64 for 32-bit x
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 1 << 63, self.rows, dtype=np.uint64) | np.uint64(1)
+
+    def signatures(self, shingle_sets, chunk_rows: int = 65536) -> np.ndarray:
+        """(len(shingle_sets), num_perm) uint32 signatures; every set must be non-empty."""
+        lengths = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=len(shingle_sets))
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for s in shingle_sets for shingle in s),
+            dtype=np.uint64, count=int(lengths.sum()),
+        )
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        result = np.empty((len(shingle_sets), self.num_perm), dtype=np.uint64)
+        # Hash all shingles of a batch in one array op, then take each message's minimum;
+        # chunked by whole messages so the intermediate array stays small
+        first = 0
+        while first < len(shingle_sets):
+            last = first + 1
+            while last < len(shingle_sets) and starts[last] + lengths[last] - starts[first] <= chunk_rows:
+                last += 1
+            lo, hi = starts[first], starts[last - 1] + lengths[last - 1]
+            permuted = (np.outer(hashes[lo:hi], self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+            result[first:last] = np.minimum.reduceat(permuted, starts[first:last] - lo, axis=0)
+            first = last
+        return result.astype(np.uint32)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(n, bands) int64 keys, one per band: a 48-bit hash of the band's rows tagged with its index."""
+        rows = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        mixed = (rows * self._band_mix).sum(axis=2, dtype=np.uint64) >> np.uint64(16)
+        return (mixed | (np.arange(self.bands, dtype=np.uint64) << np.uint64(48))).astype(np.int64)
+
+
+def similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two messages' shingle sets."""
+    return float(np.count_nonzero(signature_a == signature_b)) / len(signature_a)
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, node):
+        self.parent.setdefault(node, node)
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:  # path compression
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+
+def assign_clusters(messages, candidates, threshold: float = THRESHOLD):
+    """Group a batch of messages with each other and with already-clustered candidates.
+
+    `messages` are dicts with key, signature (None for empty text) and bands, in load
+    order. `candidates` are stored rows (key, cluster_id, signature, bands) sharing at
+    least one band with the batch. Returns (groups, merges): groups is a list of
+    (existing cluster id or None for a new cluster, [(message, bands to index)]), and
+    merges maps a kept cluster id to existing ids that the batch showed are the same
+    cluster. A message's bands already indexed for its cluster are not indexed again,
+    so a post copied a thousand times adds one set of bands, not a thousand.
+    """
+    union_find = _UnionFind()
+    buckets = {}
+    for candidate in candidates:
+        node = ("cluster", candidate["cluster_id"])
+        union_find.find(node)
+        for band in candidate["bands"]:
+            buckets.setdefault(band, []).append((node, candidate["signature"]))
+
+    for message in messages:
+        node = ("message", message["key"])
+        union_find.find(node)
+        if message["signature"] is None:
+            continue
+        # Each candidate is compared once however many bands it shares, all in one array op
+        others = {}
+        for band in message["bands"]:
+            for other, signature in buckets.get(band, ()):
+                others[other] = signature
+        if others:
+            nodes = list(others)
+            agreement = (np.stack(list(others.values())) == message["signature"]).mean(axis=1)
+            for other, score in zip(nodes, agreement):
+                if score >= threshold:
+                    union_find.union(other, node)
+        # A bucket keeps one entry per cluster, so a post copied thousands of times is
+        # compared once per new message, not once per copy
+        root = union_find.find(node)
+        same = {other for other in others if union_find.find(other) == root}
+        for band in message["bands"]:
+            bucket = buckets.setdefault(band, [])
+            if not any(other in same for other, _ in bucket):
+                bucket.append((node, message["signature"]))
+
+    existing = {}
+    for candidate in candidates:
+        existing.setdefault(union_find.find(("cluster", candidate["cluster_id"])), set()).add(candidate["cluster_id"])
+    indexed = {}
+    for candidate in candidates:
+        indexed.setdefault(union_find.find(("cluster", candidate["cluster_id"])), set()).update(candidate["bands"])
+
+    groups, merges = {}, {}
+    for message in messages:
+        root = union_find.find(("message", message["key"]))
+        covered = indexed.setdefault(root, set())
+        if root not in groups:
+            cluster_ids = sorted(existing.get(root, ()))
+            groups[root] = (cluster_ids[0] if cluster_ids else None, [])
+            if len(cluster_ids) > 1:
+                merges[cluster_ids[0]] = cluster_ids[1:]  # keep the oldest id
+        groups[root][1].append((message, [band for band in message["bands"] if band not in covered]))
+        covered.update(message["bands"])
+    return list(groups.values()), merges
+
+
+def ensure_tables(engine):
+    """Create the cluster table (same DDL as the dbt create_message_clusters macro) and the state table."""
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {CLUSTER_ID_SEQUENCE}"))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {CLUSTERS_TABLE} (
+                channel_name TEXT NOT NULL,
+                message_id BIGINT NOT NULL,
+                message_cluster_id BIGINT NOT NULL,
+                signature BYTEA,
+                bands BIGINT[] NOT NULL DEFAULT '{{}}',
+                clustered_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (channel_name, message_id)
+            )
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {CLUSTERS_TABLE}_cluster_idx ON {CLUSTERS_TABLE} (message_cluster_id)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {CLUSTERS_TABLE}_clustered_at_idx ON {CLUSTERS_TABLE} (clustered_at)"))
+        # No fastupdate: every batch probes the index tens of thousands of times, and each probe
+        # would otherwise re-read the whole pending list of recent inserts
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {CLUSTERS_TABLE}_bands_idx ON {CLUSTERS_TABLE}
+            USING GIN (bands) WITH (fastupdate = off)
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                params_version TEXT PRIMARY KEY,
+                last_loaded_at TIMESTAMP,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.commit()
+
+
+def fetch_watermark(engine, version: str):
+    """loaded_at of the newest message clustered with these parameters (None: cluster everything)."""
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(f"SELECT last_loaded_at FROM {STATE_TABLE} WHERE params_version = :version"),
+            {"version": version},
+        ).fetchone()
+    return row.last_loaded_at if row else None
+
+
+def save_watermark(engine, version: str, last_loaded_at):
+    """Record the clustering position; states for other parameter versions are dropped."""
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {STATE_TABLE} WHERE params_version != :version"), {"version": version})
+        conn.execute(text(f"""
+            INSERT INTO {STATE_TABLE} (params_version, last_loaded_at, updated_at)
+            VALUES (:version, :last_loaded_at, CURRENT_TIMESTAMP)
+            ON CONFLICT (params_version) DO UPDATE SET
+                last_loaded_at = EXCLUDED.last_loaded_at,
+                updated_at = EXCLUDED.updated_at
+        """), {"version": version, "last_loaded_at": last_loaded_at})
+
+
+def iter_message_batches(engine, since=None, batch_size: int = BATCH_SIZE, lookback: int = WATERMARK_LOOKBACK):
+    """Stream the rows stg_telegram_messages keeps, loaded after `since` - `lookback` s, in lists of `batch_size`."""
+    query = text(f"""
+        SELECT channel_name, message_id, TRIM(COALESCE(message_text, '')) AS message_text, loaded_at
+        FROM staging_telegram_messages
+        WHERE message_id IS NOT NULL AND channel_name IS NOT NULL AND message_date IS NOT NULL
+        {"AND loaded_at > CAST(:since AS TIMESTAMP) - make_interval(secs => :lookback)" if since is not None else ""}
+        ORDER BY loaded_at
+    """)
+    with engine.connect().execution_options(stream_results=True, yield_per=batch_size) as conn:
+        result = conn.execute(query, {"since": since, "lookback": lookback} if since is not None else {})
+        for partition in result.partitions():
+            yield partition
+
+
+def _signature(value) -> np.ndarray:
+    return np.frombuffer(bytes(value), dtype="<u4") if value is not None else None
+
+
+def _same_signature(a, b) -> bool:
+    return (a is None and b is None) or (a is not None and b is not None and np.array_equal(a, b))
+
+
+def prepare_batch(hasher: MinHasher, rows) -> list:
+    """Signature and band keys for each staging row (None / no bands when the text has no words)."""
+    messages = [{"key": (row.channel_name, int(row.message_id)), "signature": None, "bands": []} for row in rows]
+    shingled = [(message, shingles(row.message_text)) for message, row in zip(messages, rows)]
+    shingled = [(message, s) for message, s in shingled if s]
+    if shingled:
+        signatures = hasher.signatures([s for _, s in shingled])
+        for (message, _), signature, bands in zip(shingled, signatures, hasher.band_keys(signatures)):
+            message["signature"] = signature
+            message["bands"] = bands.tolist()
+    return messages
+
+
+def fetch_stored(conn, keys) -> dict:
+    """Stored (signature, cluster id, indexed bands) of messages in this batch that were clustered before (re-loads)."""
+    rows = conn.execute(text(f"""
+        SELECT c.channel_name, c.message_id, c.signature, c.message_cluster_id, c.bands
+        FROM {CLUSTERS_TABLE} c
+        JOIN jsonb_to_recordset(CAST(:keys AS JSONB)) AS k(channel_name TEXT, message_id BIGINT)
+          ON c.channel_name = k.channel_name AND c.message_id = k.message_id
+    """), {"keys": json.dumps([{"channel_name": c, "message_id": m} for c, m in keys])})
+    return {
+        (row.channel_name, row.message_id): (_signature(row.signature), row.message_cluster_id, row.bands)
+        for row in rows
+    }
+
+
+def fetch_candidates(conn, messages) -> list:
+    """Already-clustered messages sharing an LSH band with the batch (GIN index lookup)."""
+    bands = sorted({band for message in messages for band in message["bands"]})
+    if not bands:
+        return []
+    keys = json.dumps([{"channel_name": c, "message_id": m} for c, m in (message["key"] for message in messages)])
+    # One GIN probe per band key; a single `bands && :bands` with tens of thousands of keys
+    # is far slower, since every key is checked against every indexed array
+    rows = conn.execute(text(f"""
+        SELECT DISTINCT ON (c.channel_name, c.message_id)
+               c.channel_name, c.message_id, c.message_cluster_id, c.signature, c.bands
+        FROM unnest(CAST(:bands AS BIGINT[])) AS q(band)
+        JOIN {CLUSTERS_TABLE} c ON c.bands @> ARRAY[q.band]
+        WHERE NOT EXISTS (
+              SELECT 1 FROM jsonb_to_recordset(CAST(:keys AS JSONB)) AS k(channel_name TEXT, message_id BIGINT)
+              WHERE k.channel_name = c.channel_name AND k.message_id = c.message_id
+          )
+    """), {"bands": bands, "keys": keys})
+    return [
+        {"key": (row.channel_name, row.message_id), "cluster_id": row.message_cluster_id,
+         "signature": _signature(row.signature), "bands": row.bands}
+        for row in rows
+    ]
+
+
+def write_clusters(conn, groups, merges) -> int:
+    """Relabel merged clusters, allocate ids for new ones and upsert the batch; returns new cluster count."""
+    for keep, merged in merges.items():
+        conn.execute(text(f"""
+            UPDATE {CLUSTERS_TABLE} SET message_cluster_id = :keep, clustered_at = CURRENT_TIMESTAMP
+            WHERE message_cluster_id = ANY(:merged)
+        """), {"keep": keep, "merged": merged})
+
+    new_groups = [members for cluster_id, members in groups if cluster_id is None]
+    new_ids = conn.execute(
+        text(f"SELECT nextval('{CLUSTER_ID_SEQUENCE}') AS id FROM generate_series(1, :n)"), {"n": len(new_groups)}
+    ).scalars().all() if new_groups else []
+    new_ids = iter(new_ids)
+
+    rows = []
+    for cluster_id, members in groups:
+        cluster_id = cluster_id if cluster_id is not None else next(new_ids)
+        for message, bands in members:
+            channel_name, message_id = message["key"]
+            signature = message["signature"]
+            rows.append({
+                "channel_name": channel_name,
+                "message_id": message_id,
+                "message_cluster_id": cluster_id,
+                "signature": signature.astype("<u4").tobytes().hex() if signature is not None else None,
+                "bands": bands,
+            })
+    conn.execute(text(f"""
+        INSERT INTO {CLUSTERS_TABLE} (channel_name, message_id, message_cluster_id, signature, bands, clustered_at)
+        SELECT channel_name, message_id, message_cluster_id, decode(signature, 'hex'), bands, CURRENT_TIMESTAMP
+        FROM jsonb_to_recordset(CAST(:rows AS JSONB))
+             AS t(channel_name TEXT, message_id BIGINT, message_cluster_id BIGINT, signature TEXT, bands BIGINT[])
+        ON CONFLICT (channel_name, message_id) DO UPDATE SET
+            message_cluster_id = EXCLUDED.message_cluster_id,
+            signature = EXCLUDED.signature,
+            bands = EXCLUDED.bands,
+            clustered_at = EXCLUDED.clustered_at
+    """), {"rows": json.dumps(rows)})
+    return len(new_groups)
+
+
+def reindex_clusters(conn, hasher: MinHasher, cluster_ids):
+    """Index every band of these clusters' members again, once per cluster.
+
+    A cluster's band keys are stored on whichever member brought them first; when that member
+    is re-clustered its row takes new bands, so the ones only it held are put back on the
+    remaining members (recomputed from their stored signatures).
+    """
+    rows = conn.execute(text(f"""
+        SELECT channel_name, message_id, message_cluster_id, signature, bands
+        FROM {CLUSTERS_TABLE}
+        WHERE message_cluster_id = ANY(:cluster_ids) AND signature IS NOT NULL
+        ORDER BY message_cluster_id, clustered_at, channel_name, message_id
+    """), {"cluster_ids": sorted(cluster_ids)}).fetchall()
+    if not rows:
+        return
+    covered = {}
+    for row in rows:
+        covered.setdefault(row.message_cluster_id, set()).update(row.bands)
+    updates = []
+    for row, bands in zip(rows, hasher.band_keys(np.stack([_signature(row.signature) for row in rows]))):
+        missing = [band for band in bands.tolist() if band not in covered[row.message_cluster_id]]
+        if missing:
+            covered[row.message_cluster_id].update(missing)
+            updates.append({"channel_name": row.channel_name, "message_id": row.message_id, "bands": row.bands + missing})
+    if updates:
+        conn.execute(text(f"""
+            UPDATE {CLUSTERS_TABLE} c SET bands = t.bands
+            FROM jsonb_to_recordset(CAST(:rows AS JSONB)) AS t(channel_name TEXT, message_id BIGINT, bands BIGINT[])
+            WHERE c.channel_name = t.channel_name AND c.message_id = t.message_id
+        """), {"rows": json.dumps(updates)})
+
+
+def cluster_batch(conn, hasher: MinHasher, rows, threshold: float = THRESHOLD) -> int:
+    """Cluster one batch of staging rows on `conn`; returns how many messages were (re)clustered."""
+    messages = prepare_batch(hasher, rows)
+    stored = fetch_stored(conn, [message["key"] for message in messages])
+    # Re-loads (e.g. refreshed view counts) with unchanged text keep their cluster untouched
+    messages = [
+        message for message in messages
+        if message["key"] not in stored or not _same_signature(stored[message["key"]][0], message["signature"])
+    ]
+    if messages:
+        groups, merges = assign_clusters(messages, fetch_candidates(conn, messages), threshold)
+        write_clusters(conn, groups, merges)
+        # Edited messages that held band keys for their old cluster took them along
+        merged_into = {old: keep for keep, merged in merges.items() for old in merged}
+        left = {merged_into.get(stored[m["key"]][1], stored[m["key"]][1])
+                for m in messages if m["key"] in stored and stored[m["key"]][2]}
+        if left:
+            reindex_clusters(conn, hasher, left)
+    return len(messages)
+
+
+def main(full: bool = False, batch_size: int = BATCH_SIZE, threshold: float = THRESHOLD):
+    engine = get_engine()
+    ensure_tables(engine)
+    hasher = MinHasher()
+    version = params_version()
+
+    since = None if full else fetch_watermark(engine, version)
+    if since is None:
+        logging.info(f"Full clustering with parameters {version} ({NUM_PERM} permutations, {BANDS} bands)")
+    else:
+        logging.info(f"Clustering messages loaded after {since}")
+
+    scanned = clustered = 0
+    last_loaded_at = since
+    # New signature layout (or --full): stored signatures and bands are not comparable. They are
+    # replaced in one transaction (DELETE, not TRUNCATE, which would lock readers out), so
+    # /top-products and the marts never see an empty or half-built cluster table.
+    with engine.begin() if since is None else nullcontext() as rebuild:
+        if rebuild is not None:
+            rebuild.execute(text(f"DELETE FROM {CLUSTERS_TABLE}"))
+        for rows in iter_message_batches(engine, since, batch_size):
+            with nullcontext(rebuild) if rebuild is not None else engine.begin() as conn:
+                clustered += cluster_batch(conn, hasher, rows, threshold)
+            scanned += len(rows)
+            last_loaded_at = rows[-1].loaded_at  # batches arrive in loaded_at order
+            logging.info(f"Scanned {scanned} messages, {clustered} (re)clustered")
+
+    # Saved only at the end: a crash mid-run re-scans from the old watermark, and unchanged
+    # messages are skipped on the way
+    save_watermark(engine, version, last_loaded_at)
+    if clustered:
+        bump_data_version(engine, "dedup_messages")
+    logging.info(f"Near-duplicate clustering complete: {clustered} of {scanned} messages (re)clustered.")
+    return scanned
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate messages into message_clusters")
+    parser.add_argument("--full", action="store_true", help="re-cluster every message, not just newly loaded ones")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="messages per batch")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="estimated Jaccard similarity for a duplicate")
+    args = parser.parse_args()
+    main(full=args.full, batch_size=args.batch_size, threshold=args.threshold)
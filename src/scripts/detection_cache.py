@@ -0,0 +1,147 @@
+"""
+Persistent YOLO detection cache keyed by image content hash and model version.
+
+The same product photo is reposted across channels; with this cache each
+distinct image is run through the model once per model version. Entries keep
+the full detections (class, confidence, normalised xyxy bbox), track hits for
+hit-rate stats, and can be evicted by age or least-recent use.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+
+from sqlalchemy import text
+
+CACHE_TABLE = "yolo_detection_cache"
+
+
+def image_digest(data: bytes) -> str:
+    """Content hash used as the cache key (same SHA-256 as the scraper's image store)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class DetectionCache:
+    """Detection cache in Postgres, scoped to one model version."""
+
+    def __init__(self, engine, model_version: str):
+        self.engine = engine
+        self.model_version = model_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # get() runs in decode threads
+
+    def ensure_table(self):
+        with self.engine.connect() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                    image_hash TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    detections JSONB NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    last_hit_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    hit_count BIGINT DEFAULT 0,
+                    PRIMARY KEY (image_hash, model_version)
+                )
+            """))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {CACHE_TABLE}_last_hit_idx ON {CACHE_TABLE} (last_hit_at)"))
+            conn.commit()
+
+    def get(self, digest: str):
+        """Return cached detections for an image, or None on a miss. Safe to call from worker threads."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(f"SELECT detections FROM {CACHE_TABLE} WHERE image_hash = :digest AND model_version = :model_version"),
+                {"digest": digest, "model_version": self.model_version},
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row.detections
+
+    def get_many(self, digests) -> dict:
+        """Return {digest: detections} for the cached ones among `digests`, in one query."""
+        digests = list(set(digests))
+        if not digests:
+            return {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT image_hash, detections FROM {CACHE_TABLE}
+                    WHERE image_hash = ANY(:digests) AND model_version = :model_version
+                """),
+                {"digests": digests, "model_version": self.model_version},
+            ).fetchall()
+        found = {row.image_hash: row.detections for row in rows}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(digests) - len(found)
+        return found
+
+    def put_many(self, detections_by_digest: dict):
+        """Store detections for newly inferred images."""
+        if not detections_by_digest:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+                INSERT INTO {CACHE_TABLE} (image_hash, model_version, detections)
+                VALUES (:digest, :model_version, CAST(:detections AS JSONB))
+                ON CONFLICT (image_hash, model_version) DO UPDATE SET detections = EXCLUDED.detections
+            """), [
+                {"digest": digest, "model_version": self.model_version, "detections": json.dumps(detections)}
+                for digest, detections in detections_by_digest.items()
+            ])
+
+    def touch(self, digests):
+        """Record hits so eviction keeps images that keep getting reposted."""
+        if not digests:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+                UPDATE {CACHE_TABLE}
+                SET hit_count = hit_count + 1, last_hit_at = CURRENT_TIMESTAMP
+                WHERE image_hash = :digest AND model_version = :model_version
+            """), [{"digest": digest, "model_version": self.model_version} for digest in digests])
+
+    def evict(self, max_entries: int = None, max_age_days: int = None) -> int:
+        """Drop entries unused for `max_age_days`, then the least recently used beyond `max_entries`."""
+        evicted = 0
+        with self.engine.begin() as conn:
+            if max_age_days is not None:
+                evicted += conn.execute(text(f"""
+                    DELETE FROM {CACHE_TABLE}
+                    WHERE last_hit_at < CURRENT_TIMESTAMP - make_interval(days => :days)
+                """), {"days": max_age_days}).rowcount
+            if max_entries is not None:
+                evicted += conn.execute(text(f"""
+                    DELETE FROM {CACHE_TABLE}
+                    WHERE (image_hash, model_version) IN (
+                        SELECT image_hash, model_version FROM {CACHE_TABLE}
+                        ORDER BY last_hit_at DESC
+                        OFFSET :max_entries
+                    )
+                """), {"max_entries": max_entries}).rowcount
+        logging.info(f"Evicted {evicted} entries from {CACHE_TABLE}")
+        return evicted
+
+    def stats(self) -> dict:
+        """Hit rate for this run plus totals for the stored cache."""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(f"""
+                SELECT COUNT(*) AS entries,
+                       COUNT(*) FILTER (WHERE model_version = :model_version) AS entries_for_model,
+                       COALESCE(SUM(hit_count), 0) AS total_hits
+                FROM {CACHE_TABLE}
+            """), {"model_version": self.model_version}).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "run_hits": self.hits,
+            "run_misses": self.misses,
+            "run_hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "entries": row.entries,
+            "entries_for_model": row.entries_for_model,
+            "total_hits": int(row.total_hits),
+        }
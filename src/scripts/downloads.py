@@ -0,0 +1,212 @@
+"""
+Bounded async download pool for Telegram images.
+
+Message iteration submits media jobs to a bounded queue (so it slows down
+instead of buffering unboundedly when downloads fall behind) and N workers
+fetch them concurrently, retrying with backoff. Downloads that still fail
+are appended to a JSONL queue that the next run retries. The jobs taken for
+a retry stay on disk until the retry has drained, so an interrupted run
+loses none of them.
+
+Image bytes are stored once under images/_blobs/ by SHA-256, and each
+per-channel image path is a hard link to its blob, so a promo photo reposted
+across channels takes disk space only once while image_path stays the same.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+from src.scripts.instrumentation import counter, gauge, histogram, timer
+
+IMAGES_DIR = Path("data/raw/images")
+FAILED_DOWNLOADS_PATH = Path("data/raw/failed_downloads.jsonl")
+
+DOWNLOADS = counter("downloads_total", "Image downloads by result (downloaded, deduplicated, skipped, failed)")
+DOWNLOAD_SECONDS = histogram("download_seconds", "Time per image fetch attempt, including storing it")
+SUBMIT_WAIT_SECONDS = histogram("download_submit_wait_seconds", "Time message iteration waited on a full download queue")
+QUEUE_DEPTH = gauge("download_queue_depth", "Downloads queued but not started")
+
+
+def store_image(data: bytes, target: Path, images_dir: Path = IMAGES_DIR) -> bool:
+    """Store image bytes by content hash and link them at `target`. Returns True if the bytes were new."""
+    digest = hashlib.sha256(data).hexdigest()
+    blob = images_dir / "_blobs" / digest[:2] / f"{digest}{target.suffix}"
+    is_new = not blob.exists()
+    if is_new:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp_blob = blob.with_name(blob.name + ".tmp")
+        tmp_blob.write_bytes(data)
+        os.replace(tmp_blob, blob)
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if not target.exists():
+        try:
+            os.link(blob, target)
+        except OSError:
+            shutil.copyfile(blob, target)  # filesystem without hard links
+    return is_new
+
+
+async def fetch_image(message, target: Path, images_dir: Path = IMAGES_DIR) -> bool:
+    """Download one message's media into the content-addressed store."""
+    data = await message.download_media(file=bytes)
+    if not data:
+        raise ValueError("empty media payload")
+    return store_image(data, target, images_dir)
+
+
+def load_failed_downloads(path: Path = FAILED_DOWNLOADS_PATH) -> list:
+    """Take all queued failed downloads, with any that an interrupted run was still retrying.
+
+    The jobs move to a .processing file that stays until finish_failed_downloads(); new
+    failures are appended to `path` again meanwhile. A job queued twice is returned once.
+    """
+    processing = path.with_suffix(".processing")
+    if path.exists():
+        if processing.exists():  # left by a run that died mid-retry: its jobs are still owed
+            with open(processing, "a", encoding="utf-8") as f:
+                f.write(path.read_text(encoding="utf-8"))
+            path.unlink()
+        else:
+            os.replace(path, processing)
+    if not processing.exists():
+        return []
+    jobs = {}
+    with open(processing, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                job = json.loads(line)
+                jobs[(job["channel"], job["message_id"])] = job
+    return list(jobs.values())
+
+
+def finish_failed_downloads(path: Path = FAILED_DOWNLOADS_PATH):
+    """Drop the jobs taken by load_failed_downloads() once every one was re-submitted and drained
+    (those that failed again are back in `path` by then)."""
+    path.with_suffix(".processing").unlink(missing_ok=True)
+
+
+class DownloadPool:
+    """N concurrent download workers fed through a bounded queue."""
+
+    def __init__(
+        self,
+        workers: int = 8,
+        queue_size: int = 100,
+        max_retries: int = 3,
+        retry_backoff: float = 2.0,
+        rate_limiter=None,
+        flood_errors=(),
+        images_dir: Path = IMAGES_DIR,
+        failed_path: Path = FAILED_DOWNLOADS_PATH,
+    ):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = rate_limiter
+        self.flood_errors = tuple(flood_errors)
+        self.images_dir = images_dir
+        self.failed_path = failed_path
+        self.stats = {"downloaded": 0, "deduplicated": 0, "skipped": 0, "failed": 0}
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._failed = []
+
+    async def __aenter__(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def submit(self, channel: str, message, target: Path, on_done=None):
+        """Queue a download; waits while the queue is full (backpressure).
+
+        `on_done` is called with True once the image is at `target`, or with False once
+        the download has used up its retries.
+        """
+        if target.exists():
+            self.stats["skipped"] += 1
+            DOWNLOADS.inc(result="skipped")
+            if on_done is not None:
+                on_done(True)
+            return
+        with timer(SUBMIT_WAIT_SECONDS):
+            await self._queue.put((channel, message, target, on_done))
+        QUEUE_DEPTH.set(self._queue.qsize())
+
+    def mark_failed(self, channel: str, message_id: int, target: Path, error):
+        """Record a download to retry on the next run."""
+        self.stats["failed"] += 1
+        DOWNLOADS.inc(result="failed")
+        self._failed.append({
+            "channel": channel,
+            "message_id": message_id,
+            "target": str(target),
+            "error": str(error),
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+    async def drain(self):
+        """Wait for every queued download and persist anything that failed; the workers keep running."""
+        await self._queue.join()
+        if self._failed:
+            self.failed_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.failed_path, "a", encoding="utf-8") as f:
+                for job in self._failed:
+                    f.write(json.dumps(job, ensure_ascii=False) + "\n")
+            logging.warning(f"{len(self._failed)} image downloads failed; queued in {self.failed_path}")
+            self._failed = []
+
+    async def close(self):
+        """Finish queued downloads, stop the workers and persist anything that failed."""
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logging.info(f"Download pool finished: {self.stats}")
+
+    async def _worker(self):
+        while True:
+            channel, message, target, on_done = await self._queue.get()
+            QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                ok = await self._download(channel, message, target)
+                if on_done is not None:
+                    on_done(ok)
+            except Exception as e:
+                logging.error(f"Download callback failed for msg {message.id} in {channel}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _download(self, channel: str, message, target: Path) -> bool:
+        attempt = 0
+        while True:
+            try:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                with timer(DOWNLOAD_SECONDS):
+                    is_new = await fetch_image(message, target, self.images_dir)
+                result = "downloaded" if is_new else "deduplicated"
+                self.stats[result] += 1
+                DOWNLOADS.inc(result=result)
+                logging.info(f"Downloaded image: {target}" + ("" if is_new else " (duplicate content)"))
+                return True
+            except self.flood_errors as e:
+                # Flood waits don't count as failures: wait them out and try again
+                logging.warning(f"Flood wait on image download for msg {message.id}: sleeping {e.seconds}s")
+                await asyncio.sleep(e.seconds)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logging.error(f"Image download failed for msg {message.id} in {channel}: {e}")
+                    self.mark_failed(channel, message.id, target, e)
+                    return False
+                await asyncio.sleep(self.retry_backoff ** attempt)
@@ -0,0 +1,179 @@
+"""
+In-memory stand-in for the Telethon client, for running the scraper offline.
+
+The scraper needs only a handful of client calls: start(), disconnect(),
+get_entity(username), get_messages(entity, limit=, offset_id=, min_id=) or
+get_messages(entity, ids=[...]), and download_media(file=bytes) on the
+messages it gets back. FakeTelegramClient answers them from channels held in
+memory, replayed from raw files an earlier scrape wrote or generated by
+src/scripts/synthetic_data.py, with injectable request and media latency,
+FloodWaitError every N requests and ChannelPrivateError for chosen channels.
+Its stats record requests, downloads and the peak number of downloads in
+flight, so scraper throughput and download concurrency can be measured on a
+machine with no network:
+
+    from src.scripts import scraper
+    fake = FakeTelegramClient.synthetic(20000, latency=0.05, media_latency=0.2)
+    asyncio.run(scraper.main(limit=20000, telegram=fake))
+"""
+
+import asyncio
+import bisect
+import logging
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+from telethon.errors import ChannelPrivateError, FloodWaitError
+from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+
+from src.scripts.raw_parser import read_raw_file
+
+
+class FakeMessage:
+    """The attributes of a Telethon Message the scraper reads, plus download_media()."""
+
+    def __init__(self, client, message_id: int, date: datetime, message: str = None, media=None,
+                 payload=None, views: int = 0, forwards: int = 0):
+        self._client = client
+        self.id = message_id
+        self.date = date
+        self.message = message
+        self.media = media
+        self.payload = payload  # image bytes, or a Path read when downloaded
+        self.views = views
+        self.forwards = forwards
+
+    async def download_media(self, file=None):
+        if file is not bytes:
+            raise NotImplementedError("FakeMessage only downloads to bytes")
+        return await self._client._download(self)
+
+
+class FakeTelegramClient:
+    """Serves channels of FakeMessages with Telethon's paging semantics (newest first)."""
+
+    def __init__(self, channels: dict = None, latency: float = 0.0, media_latency: float = 0.0,
+                 flood_every: int = 0, flood_seconds: int = 1, private=()):
+        self.latency = latency
+        self.media_latency = media_latency
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.private = {name.lower() for name in private}
+        self.stats = {"requests": 0, "messages": 0, "flood_waits": 0, "downloads": 0, "bytes": 0,
+                      "max_concurrent_downloads": 0}
+        self._history = {}  # username (lowercase) -> messages in ascending id order
+        self._ids = {}
+        self._downloading = 0
+        for username, messages in (channels or {}).items():
+            self.add_channel(username, messages)
+
+    @property
+    def channels(self) -> list:
+        return list(self._history)
+
+    def add_channel(self, username: str, messages):
+        history = sorted(messages, key=lambda m: m.id)
+        self._history[username.lower()] = history
+        self._ids[username.lower()] = [m.id for m in history]
+
+    def message(self, record: dict, payload=None) -> FakeMessage:
+        """A FakeMessage from a raw-layout record; `payload` (bytes or a Path) makes it a photo."""
+        media = None
+        if payload is not None:
+            media = MessageMediaPhoto()
+        elif record.get("has_media"):
+            media = MessageMediaDocument(document=SimpleNamespace(mime_type="video/mp4"))
+        return FakeMessage(
+            self, record["message_id"], datetime.fromisoformat(record["message_date"]),
+            message=record.get("message_text"), media=media, payload=payload,
+            views=record.get("views") or 0, forwards=record.get("forwards") or 0,
+        )
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """Build channels from (record, payload) pairs in the raw layout."""
+        client = cls(**kwargs)
+        channels = {}
+        for record, payload in records:
+            channels.setdefault(record["channel_name"], {})[record["message_id"]] = client.message(record, payload)
+        for username, messages in channels.items():
+            client.add_channel(username, messages.values())
+        return client
+
+    @classmethod
+    def from_raw(cls, raw_dir: Path, **kwargs):
+        """Replay the messages (and downloaded images) an earlier scrape wrote under `raw_dir`."""
+        def records():
+            for path in sorted(Path(raw_dir).rglob("*")):
+                if path.suffix not in (".json", ".jsonl") or not path.is_file():
+                    continue
+                for record in read_raw_file(path):
+                    image = Path(record["image_path"]) if record.get("image_path") else None
+                    yield record, image if image is not None and image.exists() else None
+
+        client = cls.from_records(records(), **kwargs)
+        logging.info(f"Replaying {sum(map(len, client._ids.values()))} messages from {raw_dir}")
+        return client
+
+    @classmethod
+    def synthetic(cls, messages: int, channels: int = 4, seed: int = 42, image_ratio: float = 0.3,
+                  unique_images: int = 50, **kwargs):
+        """Channels of synthetic messages (see src/scripts/synthetic_data.py)."""
+        from src.scripts.synthetic_data import iter_messages
+
+        records = iter_messages(messages, channels=channels, seed=seed, image_ratio=image_ratio,
+                                unique_images=unique_images)
+        return cls.from_records(records, **kwargs)
+
+    async def start(self, phone=None):
+        return self
+
+    async def disconnect(self):
+        pass
+
+    async def _request(self):
+        self.stats["requests"] += 1
+        if self.flood_every and self.stats["requests"] % self.flood_every == 0:
+            self.stats["flood_waits"] += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_entity(self, username: str):
+        await self._request()
+        key = username.lower()
+        if key in self.private:
+            raise ChannelPrivateError(request=None)
+        if key not in self._history:
+            raise ValueError(f'No user has "{username}" as username')
+        return SimpleNamespace(id=abs(hash(key)) % 10**10, username=username, title=username)
+
+    async def get_messages(self, entity, limit: int = 100, offset_id: int = 0, min_id: int = 0, ids=None):
+        await self._request()
+        key = entity.username.lower()
+        history, message_ids = self._history[key], self._ids[key]
+        if ids is not None:
+            by_id = {message_ids[i]: history[i] for i in range(len(message_ids))}
+            return [by_id.get(message_id) for message_id in ids]
+        # Newest first, strictly below offset_id (0 = from the newest) and above min_id
+        upper = bisect.bisect_left(message_ids, offset_id) if offset_id else len(message_ids)
+        lower = max(bisect.bisect_right(message_ids, min_id), upper - limit)
+        page = history[lower:upper][::-1]
+        self.stats["messages"] += len(page)
+        return page
+
+    async def _download(self, message: FakeMessage):
+        self._downloading += 1
+        self.stats["max_concurrent_downloads"] = max(self.stats["max_concurrent_downloads"], self._downloading)
+        try:
+            if self.media_latency:
+                await asyncio.sleep(self.media_latency)
+            if message.payload is None:
+                return None
+            data = message.payload.read_bytes() if isinstance(message.payload, Path) else message.payload
+            self.stats["downloads"] += 1
+            self.stats["bytes"] += len(data)
+            return data
+        finally:
+            self._downloading -= 1
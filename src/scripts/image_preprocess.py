@@ -0,0 +1,369 @@
+"""
+Image preprocessing: thumbnails, perceptual hashes and bounded storage.
+
+Runs once per distinct image, after the scraper. Every image under
+data/raw/images is identified by the SHA-256 of its bytes (the scraper's blob
+name, and the detection cache key). Each new image is decoded once to
+record its dimensions, format and size in dim_images. It is also shrunk to
+a model-sized JPEG thumbnail, which YOLO enrichment reads instead of the
+full-size original, and summarised by a 64-bit difference hash (dHash).
+
+Near-identical photos (re-encoded, resized, watermarked copies) have dHashes
+a few bits apart. An image joins the group of its nearest earlier image
+within MAX_DISTANCE bits, found through a GIN index on the hash's band keys
+as in dedup_messages. A repost of the same product shot is therefore one
+image_group_id.
+
+Originals can be evicted, oldest last use first, to keep the image store
+under a disk budget or a retention age. Only images whose thumbnail exists
+are evicted, so enrichment keeps working from the thumbnail.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+from sqlalchemy import text
+
+from src.scripts.database import get_engine
+from src.scripts.detection_cache import image_digest
+from src.scripts.downloads import IMAGES_DIR
+from src.scripts.instrumentation import counter, histogram, record_run, timer
+
+load_dotenv()
+
+THUMBNAILS_DIR = Path(os.getenv("IMAGE_THUMBNAILS_DIR", "data/processed/thumbnails"))
+THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", os.getenv("YOLO_IMG_SIZE", "640")))  # longest side
+THUMBNAIL_QUALITY = int(os.getenv("IMAGE_THUMBNAIL_QUALITY", "90"))
+BATCH_SIZE = int(os.getenv("IMAGE_PREPROCESS_BATCH_SIZE", "500"))    # images per transaction
+WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(os.cpu_count() or 1)))  # hash/decode threads
+HASH_BANDS = 4  # 16-bit dHash bands: images at most 3 bits apart always share one
+MAX_DISTANCE = int(os.getenv("IMAGE_GROUP_MAX_DISTANCE", "3"))  # dHash bits apart for the same group
+ORIGINALS_MAX_BYTES = int(os.getenv("IMAGE_ORIGINALS_MAX_BYTES", "0"))        # 0 = no disk budget
+ORIGINALS_MAX_AGE_DAYS = int(os.getenv("IMAGE_ORIGINALS_MAX_AGE_DAYS", "0"))  # 0 = keep forever
+
+IMAGES_TABLE = "dim_images"
+PATHS_TABLE = "image_paths"
+GROUP_ID_SEQUENCE = "image_group_id_seq"
+
+PREPROCESSED = counter("images_preprocessed_total", "Image files preprocessed, by result (new, known, unreadable)")
+PREPROCESS_SECONDS = histogram("image_preprocess_seconds", "Time to decode, thumbnail and hash one new image")
+EVICTED = counter("images_evicted_total", "Original images evicted from the image store")
+EVICTED_BYTES = counter("image_evicted_bytes_total", "Bytes of original images evicted from the image store")
+
+_UINT64 = (1 << 64) - 1
+
+
+def ensure_tables(engine):
+    """Create dim_images, the image_paths lookup and the group id sequence."""
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {GROUP_ID_SEQUENCE}"))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {IMAGES_TABLE} (
+                image_hash TEXT PRIMARY KEY,
+                width INTEGER,
+                height INTEGER,
+                format TEXT,
+                size_bytes BIGINT NOT NULL,
+                thumbnail_path TEXT,
+                thumbnail_bytes BIGINT,
+                dhash BIGINT,
+                bands BIGINT[] NOT NULL DEFAULT '{{}}',
+                image_group_id BIGINT,
+                first_seen_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                original_evicted_at TIMESTAMP WITH TIME ZONE
+            )
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {IMAGES_TABLE}_group_idx ON {IMAGES_TABLE} (image_group_id)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {IMAGES_TABLE}_last_seen_idx ON {IMAGES_TABLE} (last_seen_at)"))
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {IMAGES_TABLE}_bands_idx ON {IMAGES_TABLE}
+            USING GIN (bands) WITH (fastupdate = off)
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {PATHS_TABLE} (
+                image_path TEXT PRIMARY KEY,
+                image_hash TEXT NOT NULL
+            )
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {PATHS_TABLE}_hash_idx ON {PATHS_TABLE} (image_hash)"))
+        conn.commit()
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash (as a signed BIGINT): is each pixel of a 9x8 greyscale copy brighter than its right neighbour."""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    return int(np.packbits(pixels[:, 1:] > pixels[:, :-1]).view(">i8")[0])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & _UINT64).count("1")
+
+
+def band_keys(value: int, bands: int = HASH_BANDS) -> list:
+    """One key per 64/bands-bit slice of the hash, tagged with the slice's index."""
+    width = 64 // bands
+    value &= _UINT64
+    return [(i << width) | ((value >> (i * width)) & ((1 << width) - 1)) for i in range(bands)]
+
+
+def thumbnail_path(digest: str, thumbnails_dir: Path = THUMBNAILS_DIR) -> Path:
+    return thumbnails_dir / digest[:2] / f"{digest}.jpg"
+
+
+def list_image_files(images_dir: Path = IMAGES_DIR) -> list:
+    """Per-channel image paths (the blob store and other _-prefixed directories are skipped)."""
+    return sorted(
+        p for p in images_dir.rglob("*")
+        if p.is_file() and not p.name.endswith(".tmp")
+        and not any(part.startswith("_") for part in p.relative_to(images_dir).parts[:-1])
+    )
+
+
+def hash_file(path: Path) -> dict:
+    data = path.read_bytes()
+    return {"image_path": str(path), "image_hash": image_digest(data), "size_bytes": len(data)}
+
+
+def preprocess_file(path: Path, digest: str, thumbnails_dir: Path = THUMBNAILS_DIR, size: int = THUMBNAIL_SIZE) -> dict:
+    """Decode one original once: dimensions, a model-sized JPEG thumbnail and its dHash.
+
+    A JPEG that already fits is hard-linked as its own thumbnail instead of re-encoded.
+    Unreadable images get no thumbnail or hash and are not retried on later runs.
+    """
+    data = path.read_bytes()
+    image = {"image_hash": digest, "size_bytes": len(data), "width": None, "height": None, "format": None,
+             "thumbnail_path": None, "thumbnail_bytes": None, "dhash": None, "bands": []}
+    with timer(PREPROCESS_SECONDS):
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                image.update(width=img.width, height=img.height, format=img.format)
+                img.draft("RGB", (size, size))  # JPEG: decode straight at a reduced scale
+                thumbnail = img.convert("RGB")
+            thumbnail.thumbnail((size, size))
+        except Exception as e:
+            logging.warning(f"Unreadable image {path}: {e}")
+            return image
+        target = thumbnail_path(digest, thumbnails_dir)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        if image["format"] == "JPEG" and max(image["width"], image["height"]) <= size:
+            try:
+                os.link(path, tmp_path)
+            except OSError:
+                tmp_path.write_bytes(data)  # filesystem without hard links
+        else:
+            thumbnail.save(tmp_path, "JPEG", quality=THUMBNAIL_QUALITY)
+        os.replace(tmp_path, target)
+        image.update(thumbnail_path=str(target), thumbnail_bytes=target.stat().st_size, dhash=dhash(thumbnail))
+        image["bands"] = band_keys(image["dhash"])
+    return image
+
+
+def assign_groups(images, candidates, max_distance: int = MAX_DISTANCE) -> int:
+    """Set each image's "group" to that of its nearest earlier image within max_distance bits.
+
+    `candidates` are stored images sharing a band with the batch ({"dhash", "bands", "group"}).
+    Images with no match start a group with a negative placeholder id; returns how many.
+    """
+    index = {}
+    for candidate in candidates:
+        for band in candidate["bands"]:
+            index.setdefault(band, []).append(candidate)
+    new_groups = 0
+    for image in images:
+        if image["dhash"] is None:
+            image["group"] = None
+            continue
+        matches = {id(c): c for band in image["bands"] for c in index.get(band, ())}.values()
+        distance, nearest = min(((hamming(image["dhash"], c["dhash"]), c) for c in matches),
+                                key=lambda pair: pair[0], default=(None, None))
+        if nearest is not None and distance <= max_distance:
+            image["group"] = nearest["group"]
+        else:
+            new_groups += 1
+            image["group"] = -new_groups
+        for band in image["bands"]:
+            index.setdefault(band, []).append(image)
+    return new_groups
+
+
+def fetch_known(conn, digests) -> set:
+    rows = conn.execute(text(f"SELECT image_hash FROM {IMAGES_TABLE} WHERE image_hash = ANY(:digests)"),
+                        {"digests": list(digests)})
+    return {row.image_hash for row in rows}
+
+
+def fetch_candidates(conn, images) -> list:
+    """Stored images sharing a dHash band with the batch (one GIN probe per band key)."""
+    bands = sorted({band for image in images for band in image["bands"]})
+    if not bands:
+        return []
+    rows = conn.execute(text(f"""
+        SELECT DISTINCT ON (d.image_hash) d.image_hash, d.dhash, d.bands, d.image_group_id
+        FROM unnest(CAST(:bands AS BIGINT[])) AS q(band)
+        JOIN {IMAGES_TABLE} d ON d.bands @> ARRAY[q.band]
+        WHERE d.image_group_id IS NOT NULL
+    """), {"bands": bands})
+    return [{"dhash": row.dhash, "bands": row.bands, "group": row.image_group_id} for row in rows]
+
+
+def write_batch(conn, images, paths, new_groups: int):
+    """Insert new images (with real group ids) and path mappings; refresh last_seen_at of known ones."""
+    ids = conn.execute(
+        text(f"SELECT nextval('{GROUP_ID_SEQUENCE}') FROM generate_series(1, :n)"), {"n": new_groups}
+    ).scalars().all() if new_groups else []
+    for image in images:
+        if image["group"] is not None and image["group"] < 0:
+            image["group"] = ids[-image["group"] - 1]
+    if images:
+        conn.execute(text(f"""
+            INSERT INTO {IMAGES_TABLE} (image_hash, width, height, format, size_bytes, thumbnail_path,
+                                        thumbnail_bytes, dhash, bands, image_group_id)
+            SELECT image_hash, width, height, format, size_bytes, thumbnail_path, thumbnail_bytes, dhash, bands, "group"
+            FROM jsonb_to_recordset(CAST(:rows AS JSONB))
+                 AS t(image_hash TEXT, width INTEGER, height INTEGER, format TEXT, size_bytes BIGINT,
+                      thumbnail_path TEXT, thumbnail_bytes BIGINT, dhash BIGINT, bands BIGINT[], "group" BIGINT)
+            ON CONFLICT (image_hash) DO NOTHING
+        """), {"rows": json.dumps(images)})
+    conn.execute(text(f"""
+        INSERT INTO {PATHS_TABLE} (image_path, image_hash)
+        SELECT image_path, image_hash FROM jsonb_to_recordset(CAST(:rows AS JSONB)) AS t(image_path TEXT, image_hash TEXT)
+        ON CONFLICT (image_path) DO UPDATE SET image_hash = EXCLUDED.image_hash
+    """), {"rows": json.dumps([{"image_path": p["image_path"], "image_hash": p["image_hash"]} for p in paths])})
+    # A repost of a known image keeps it from being evicted as unused, and brings back an evicted original
+    conn.execute(text(f"""
+        UPDATE {IMAGES_TABLE} SET last_seen_at = CURRENT_TIMESTAMP, original_evicted_at = NULL
+        WHERE image_hash = ANY(:digests)
+    """), {"digests": sorted({p["image_hash"] for p in paths} - {i["image_hash"] for i in images})})
+
+
+def preprocess_batch(engine, executor, files, thumbnails_dir: Path = THUMBNAILS_DIR, size: int = THUMBNAIL_SIZE) -> int:
+    """Hash a batch of new image files and preprocess the distinct images not seen before; returns how many."""
+    paths = list(executor.map(hash_file, files))
+    with engine.begin() as conn:
+        known = fetch_known(conn, {p["image_hash"] for p in paths})
+    first_path = {}
+    for path in paths:
+        if path["image_hash"] not in known:
+            first_path.setdefault(path["image_hash"], Path(path["image_path"]))
+    images = list(executor.map(lambda item: preprocess_file(item[1], item[0], thumbnails_dir, size), first_path.items()))
+    unreadable = sum(1 for image in images if image["dhash"] is None)
+    PREPROCESSED.inc(len(images) - unreadable, result="new")
+    PREPROCESSED.inc(unreadable, result="unreadable")
+    PREPROCESSED.inc(len(paths) - len(images), result="known")
+    with engine.begin() as conn:
+        new_groups = assign_groups(images, fetch_candidates(conn, images))
+        write_batch(conn, images, paths, new_groups)
+    return len(images)
+
+
+def plan_eviction(images, max_bytes: int = 0, max_age_days: int = 0, now: datetime = None) -> list:
+    """Hashes of originals to evict: past the retention age, then oldest last use first until under budget.
+
+    `images` are the stored originals that still exist and have a thumbnail:
+    {"image_hash", "size_bytes", "last_seen_at"}.
+    """
+    now = now or datetime.now(timezone.utc)
+    ordered = sorted(images, key=lambda image: image["last_seen_at"])
+    total = sum(image["size_bytes"] for image in ordered)
+    evict = []
+    for image in ordered:
+        expired = max_age_days and image["last_seen_at"] < now - timedelta(days=max_age_days)
+        if expired or (max_bytes and total > max_bytes):
+            evict.append(image["image_hash"])
+            total -= image["size_bytes"]
+    return evict
+
+
+def remove_original(digest: str, paths, images_dir: Path = IMAGES_DIR) -> int:
+    """Delete an original's per-channel links and its blob; returns the bytes freed."""
+    freed = 0
+    blobs = list((images_dir / "_blobs" / digest[:2]).glob(f"{digest}*"))
+    for path in [*map(Path, paths), *blobs]:
+        try:
+            stat = path.stat()
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        if stat.st_nlink == 1:  # the last link: the bytes are actually gone
+            freed += stat.st_size
+    return freed
+
+
+def evict_originals(engine, max_bytes: int = ORIGINALS_MAX_BYTES, max_age_days: int = ORIGINALS_MAX_AGE_DAYS,
+                    images_dir: Path = IMAGES_DIR) -> int:
+    """Apply the disk budget and retention age to the originals; returns how many were evicted.
+
+    Only originals larger than their thumbnail count: evicting the rest would free nothing.
+    """
+    if not max_bytes and not max_age_days:
+        return 0
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT image_hash, size_bytes, last_seen_at FROM {IMAGES_TABLE}
+            WHERE original_evicted_at IS NULL AND thumbnail_bytes < size_bytes
+        """)).mappings().all()
+    evict = plan_eviction(rows, max_bytes, max_age_days)
+    freed = 0
+    for start in range(0, len(evict), BATCH_SIZE):
+        digests = evict[start:start + BATCH_SIZE]
+        with engine.begin() as conn:
+            paths = {}
+            for row in conn.execute(text(f"SELECT image_path, image_hash FROM {PATHS_TABLE} WHERE image_hash = ANY(:digests)"),
+                                    {"digests": digests}):
+                paths.setdefault(row.image_hash, []).append(row.image_path)
+            for digest in digests:
+                freed += remove_original(digest, paths.get(digest, []), images_dir)
+            conn.execute(text(f"UPDATE {IMAGES_TABLE} SET original_evicted_at = CURRENT_TIMESTAMP WHERE image_hash = ANY(:digests)"),
+                         {"digests": digests})
+    EVICTED.inc(len(evict))
+    EVICTED_BYTES.inc(freed)
+    logging.info(f"Evicted {len(evict)} originals ({freed / 1e6:.1f} MB); thumbnails kept")
+    return len(evict)
+
+
+def main(images_dir: Path = IMAGES_DIR, thumbnails_dir: Path = THUMBNAILS_DIR, batch_size: int = BATCH_SIZE,
+         workers: int = WORKERS, max_bytes: int = ORIGINALS_MAX_BYTES, max_age_days: int = ORIGINALS_MAX_AGE_DAYS) -> int:
+    """Preprocess every image file not seen before, then apply the retention policy; returns files scanned."""
+    engine = get_engine()
+    ensure_tables(engine)
+    with engine.connect() as conn:
+        seen = set(conn.execute(text(f"SELECT image_path FROM {PATHS_TABLE}")).scalars())
+    files = [path for path in list_image_files(images_dir) if str(path) not in seen]
+    logging.info(f"{len(files)} new image files under {images_dir}")
+
+    processed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(files), batch_size):
+            processed += preprocess_batch(engine, executor, files[start:start + batch_size], thumbnails_dir)
+            logging.info(f"Scanned {min(start + batch_size, len(files))}/{len(files)} files, {processed} new images")
+    evict_originals(engine, max_bytes, max_age_days, images_dir)
+    logging.info(f"Image preprocessing complete: {processed} new images from {len(files)} files.")
+    return len(files)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Thumbnail, hash and record new images in dim_images")
+    parser.add_argument("--images-dir", type=Path, default=IMAGES_DIR, help="image store written by the scraper")
+    parser.add_argument("--thumbnails-dir", type=Path, default=THUMBNAILS_DIR, help="where thumbnails are written")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="images per transaction")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="hash/decode threads")
+    parser.add_argument("--max-original-bytes", type=int, default=ORIGINALS_MAX_BYTES,
+                        help="evict the least recently seen originals above this many bytes (0 = no budget)")
+    parser.add_argument("--max-original-age-days", type=int, default=ORIGINALS_MAX_AGE_DAYS,
+                        help="evict originals not seen for this many days (0 = keep forever)")
+    args = parser.parse_args()
+    with record_run("image_preprocess"):
+        main(args.images_dir, args.thumbnails_dir, args.batch_size, args.workers,
+             args.max_original_bytes, args.max_original_age_days)
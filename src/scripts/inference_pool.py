@@ -0,0 +1,173 @@
+"""
+Inference runners for YOLO enrichment.
+
+LocalInference runs the model in the calling process. InferencePool starts K
+worker processes that each pin their thread count, load the model once, warm
+it up on a blank image and pull image batches from a shared queue; results stream back to the parent,
+which stays the single writer to the database. Both expose the same
+submit()/get() interface so the enrichment loop doesn't care which is used.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+from collections import deque
+
+
+def _pin_threads(threads: int):
+    """Limit BLAS/OpenMP and torch threads so K workers share the cores instead of fighting over them."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+
+def _infer(model, items, img_size: int):
+    """Decode any undecoded images and run one batched model call.
+
+    `items` are (digest, image, image_path) tuples; returns {digest: detections} for the
+    images that could be decoded.
+    """
+    from src.scripts.enrich_images_yolo import decode_image, detect_batch
+
+    decoded = []
+    for digest, image, image_path in items:
+        image = image if image is not None else decode_image(image_path, img_size)
+        if image is not None:
+            decoded.append((digest, image))
+    if not decoded:
+        return {}
+    detections = detect_batch(model, [image for _, image in decoded])
+    return {digest: found for (digest, _), found in zip(decoded, detections)}
+
+
+def _warm(model, img_size: int):
+    """Run one blank image through the model, so its first real batch doesn't pay for lazy setup."""
+    from PIL import Image
+
+    _infer(model, [("warm-up", Image.new("RGB", (img_size, img_size)), None)], img_size)
+
+
+def inference_worker(task_queue, result_queue, model_name: str, threads: int, img_size: int, ready_queue=None):
+    """Worker process: load and warm up the model once, then serve batches until a None sentinel arrives."""
+    _pin_threads(threads)
+    from src.scripts.enrich_images_yolo import load_model
+
+    model = load_model(model_name)
+    _warm(model, img_size)
+    if ready_queue is not None:
+        ready_queue.put(os.getpid())
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_id, items = task
+        try:
+            result_queue.put((batch_id, _infer(model, items, img_size), None))
+        except Exception as e:
+            result_queue.put((batch_id, None, str(e)))
+
+
+class LocalInference:
+    """Runs the model in this process (loaded on first use)."""
+
+    def __init__(self, model_name: str, img_size: int, threads: int = None):
+        self.model_name = model_name
+        self.img_size = img_size
+        self.threads = threads
+        self.model = None
+        self._done = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def warm_up(self):
+        """Load the model and run a blank image through it."""
+        self._load()
+        _warm(self.model, self.img_size)
+
+    def submit(self, batch_id, items):
+        self._load()
+        try:
+            self._done.append((batch_id, _infer(self.model, items, self.img_size), None))
+        except Exception as e:
+            self._done.append((batch_id, None, str(e)))
+
+    def get(self):
+        return self._done.popleft()
+
+    def _load(self):
+        if self.model is None:
+            if self.threads:
+                _pin_threads(self.threads)
+            from src.scripts.enrich_images_yolo import load_model
+
+            self.model = load_model(self.model_name)
+
+
+class InferencePool:
+    """K inference processes fed from one bounded task queue."""
+
+    def __init__(self, workers: int, threads_per_worker: int, model_name: str, img_size: int, result_timeout: float = 600):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.model_name = model_name
+        self.img_size = img_size
+        self.result_timeout = result_timeout
+        # spawn: torch and forked OpenMP thread pools don't mix
+        self._ctx = mp.get_context("spawn")
+        self._tasks = self._ctx.Queue(maxsize=workers * 2)
+        self._results = self._ctx.Queue()
+        self._ready = self._ctx.Queue()  # one pid per worker once its model is warm
+        self._processes = []
+
+    def __enter__(self):
+        for _ in range(self.workers):
+            process = self._ctx.Process(
+                target=inference_worker,
+                args=(self._tasks, self._results, self.model_name, self.threads_per_worker, self.img_size, self._ready),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        logging.info(f"Started {self.workers} inference workers x {self.threads_per_worker} threads")
+        return self
+
+    def __exit__(self, *exc_info):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+    def warm_up(self):
+        """Wait until every worker has loaded and warmed up its model."""
+        for _ in self._processes:
+            try:
+                self._ready.get(timeout=self.result_timeout)
+            except queue.Empty:
+                dead = [p.pid for p in self._processes if not p.is_alive()]
+                raise RuntimeError(f"Inference workers not ready within {self.result_timeout}s (dead workers: {dead})")
+
+    def submit(self, batch_id, items):
+        """Queue a batch of (digest, image, image_path); blocks while the queue is full."""
+        self._tasks.put((batch_id, items))
+
+    def get(self):
+        """Next finished batch as (batch_id, {digest: detections} or None, error)."""
+        try:
+            return self._results.get(timeout=self.result_timeout)
+        except queue.Empty:
+            dead = [p.pid for p in self._processes if not p.is_alive()]
+            raise RuntimeError(f"No inference result within {self.result_timeout}s (dead workers: {dead})")
@@ -0,0 +1,266 @@
+"""
+Pipeline instrumentation: counters, gauges, histograms and timers.
+
+One process-wide registry of named metrics, each optionally split by labels.
+The hot paths record into it: message iteration and media downloads in the
+scraper, file parsing and COPY writes in the loader, inference batches and
+enrichment writes in the YOLO step, query and request latency in the API.
+
+The API serves the registry at /metrics in the Prometheus text format. Batch
+scripts wrap their run in record_run(), which writes a JSON run record (wall
+time, status and a snapshot of every metric, with p50/p95/p99 for
+histograms) to logs/runs/<script>_<timestamp>.json when the run ends.
+
+    DOWNLOAD_SECONDS = histogram("download_seconds", "Time per image fetch attempt")
+    with timer(DOWNLOAD_SECONDS):
+        ...
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+RUNS_DIR = Path(os.getenv("METRICS_RUNS_DIR", "logs/runs"))
+
+# Seconds, from a cached API response up to a full dbt-sized batch
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """A monotonically increasing count (events, rows, bytes)."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, key, value
+
+    def snapshot(self) -> dict:
+        return {_format_labels(key) or "_": value for key, value in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+    """A value that goes up and down (queue depth, connections in use)."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    """Observations (usually seconds) counted into cumulative buckets, with sum, count and max."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., +Inf count, sum, max]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-2] += value
+            series[-1] = max(series[-1], value)
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return sum(series[:-2]) if series else 0
+
+    def quantile(self, q: float, **labels):
+        """Estimate the q-quantile (0..1) by interpolating inside its bucket, as Prometheus does."""
+        series = self._series.get(_label_key(labels))
+        return self._quantile(series, q) if series else None
+
+    def _quantile(self, series, q: float):
+        counts = series[:-2]
+        rank = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else series[-1]
+                return min(lower + (upper - lower) * (rank - seen) / count, series[-1])
+            seen += count
+        return series[-1]
+
+    def samples(self):
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-2]):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                yield f"{self.name}_bucket", key + (("le", le),), cumulative
+            yield f"{self.name}_sum", key, series[-2]
+            yield f"{self.name}_count", key, cumulative
+
+    def snapshot(self) -> dict:
+        summary = {}
+        for key, series in sorted(self._series.items()):
+            count = sum(series[:-2])
+            summary[_format_labels(key) or "_"] = {
+                "count": count,
+                "sum": round(series[-2], 6),
+                "mean": round(series[-2] / count, 6) if count else None,
+                "p50": round(self._quantile(series, 0.5), 6),
+                "p95": round(self._quantile(series, 0.95), 6),
+                "p99": round(self._quantile(series, 0.99), 6),
+                "max": round(series[-1], 6),
+            }
+        return summary
+
+
+class Registry:
+    """Metrics by name; asking for an existing name returns the same metric."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, cls, name: str, help: str = "", **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def reset(self):
+        """Zero every metric (modules keep their references, so metrics are never dropped)."""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample_name, key, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str = "") -> Counter:
+    return REGISTRY.get_or_create(Counter, name, help)
+
+
+def gauge(name: str, help: str = "") -> Gauge:
+    return REGISTRY.get_or_create(Gauge, name, help)
+
+
+def histogram(name: str, help: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.get_or_create(Histogram, name, help, buckets=buckets)
+
+
+@contextmanager
+def timer(metric: Histogram, **labels):
+    """Observe the wall time of the block (also when it raises) into `metric`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - started, **labels)
+
+
+def timed_iter(iterable, metric: Histogram, **labels):
+    """Yield from `iterable`, observing how long each item took to arrive into `metric`."""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        metric.observe(time.perf_counter() - started, **labels)
+        yield item
+
+
+@contextmanager
+def record_run(script: str, runs_dir: Path = None, registry: Registry = REGISTRY):
+    """Write a JSON record of the run (wall time, status, every metric) when the block exits."""
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    status = "failed"
+    try:
+        yield
+        status = "succeeded"
+    finally:
+        record = {
+            "script": script,
+            "status": status,
+            "started_at": started_at.isoformat(),
+            "seconds": round(time.perf_counter() - started, 3),
+            "pid": os.getpid(),
+            "metrics": registry.snapshot(),
+        }
+        runs_dir = runs_dir or RUNS_DIR
+        try:
+            runs_dir.mkdir(parents=True, exist_ok=True)
+            # Microseconds: a daemon's passes can start within the same second
+            path = runs_dir / f"{script}_{started_at.strftime('%Y%m%dT%H%M%S%f')}_{os.getpid()}.json"
+            path.write_text(json.dumps(record, indent=2))
+            logging.info(f"Run record written to {path} ({status} in {record['seconds']}s)")
+        except OSError as e:  # never let the run record fail the run
+            logging.warning(f"Could not write run record for {script}: {e}")
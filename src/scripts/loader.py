@@ -1,21 +1,22 @@
-import json
+import argparse
+import hashlib
+import io
 from pathlib import Path
-import pandas as pd
-from sqlalchemy import create_engine, text
+from typing import TYPE_CHECKING
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from sqlalchemy import column, create_engine, func, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from dotenv import load_dotenv
 import os
-from tqdm import tqdm
 import logging
 
-# Setup basic logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/loader.log"),
-        logging.StreamHandler()
-    ]
-)
+from src.scripts.data_version import bump_data_version
+from src.scripts.instrumentation import counter, histogram, record_run, timer
+from src.scripts.raw_parser import RAW_SCHEMA, iter_parsed_shards
+
+if TYPE_CHECKING:
+    import pandas as pd  # imported where a DataFrame is built; the COPY path never needs it
 
 load_dotenv()
 
@@ -28,19 +29,54 @@ DB_NAME = os.getenv("POSTGRES_DB", "medical_warehouse")
 
 # Connection string
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
+_engine = None
 
 # Staging table name
 STAGING_TABLE = "staging_telegram_messages"
+STAGING_KEY = ["channel_name", "message_id"]  # Telegram ids are only unique within a channel
+
+# Raw files already loaded (path, size, mtime, checksum)
+MANIFEST_TABLE = "loader_manifest"
+
+# COPY bulk-load path: rows per COPY/merge round trip
+COPY_BATCH_SIZE = int(os.getenv("LOADER_COPY_BATCH_SIZE", "50000"))
+COPY_TEMP_TABLE = "staging_copy_batch"
+COPY_COLUMNS = RAW_SCHEMA.names
+
+# Raw-file parsing runs in this many processes (1 = in the loader process)
+PARSE_WORKERS = int(os.getenv("LOADER_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+DB_WRITE_SECONDS = histogram("db_write_seconds", "Time per database write batch, by table")
+ROWS_WRITTEN = counter("db_rows_written_total", "Rows written, by table")
 
 # Path to raw partitioned JSON data
 RAW_DIR = Path("data/raw/telegram_messages")
+LOG_FILE = Path("logs/loader.log")
+
+def setup_logging(log_file: Path = LOG_FILE):
+    """Log to the console and to logs/loader.log (called by the CLI, not on import)."""
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
+
+def get_engine():
+    """The loader's engine, created on first use so importing the module never touches the database."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL)
+    return _engine
 
 def create_staging_table():
-    """Create the staging table if it doesn't exist."""
+    """Create the staging table if it doesn't exist, keyed on (channel_name, message_id)."""
     create_sql = """
     CREATE TABLE IF NOT EXISTS staging_telegram_messages (
-        message_id BIGINT PRIMARY KEY,
+        message_id BIGINT NOT NULL,
         channel_name TEXT NOT NULL,
         message_date TIMESTAMP WITH TIME ZONE,
         message_text TEXT,
@@ -48,68 +84,322 @@ def create_staging_table():
         image_path TEXT,
         views INTEGER,
         forwards INTEGER,
-        loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        loaded_at TIMESTAMP DEFAULT clock_timestamp(),
+        PRIMARY KEY (channel_name, message_id)
     );
     """
+    # Older databases were created with PRIMARY KEY (message_id) only
+    migrate_key_sql = """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = 'staging_telegram_messages'::regclass
+              AND contype = 'p'
+              AND array_length(conkey, 1) = 1
+        ) THEN
+            ALTER TABLE staging_telegram_messages DROP CONSTRAINT staging_telegram_messages_pkey;
+            ALTER TABLE staging_telegram_messages ADD PRIMARY KEY (channel_name, message_id);
+        END IF;
+    END $$;
+    """
+    # dbt's incremental models select rows loaded since their last run
+    loaded_at_index_sql = """
+    CREATE INDEX IF NOT EXISTS staging_telegram_messages_loaded_at_idx
+        ON staging_telegram_messages (loaded_at);
+    """
+    # loaded_at is when the row was written, not when its transaction began (CURRENT_TIMESTAMP),
+    # which keeps it close to the commit that readers' loaded_at watermarks depend on
+    loaded_at_default_sql = """
+    ALTER TABLE staging_telegram_messages ALTER COLUMN loaded_at SET DEFAULT clock_timestamp();
+    """
     try:
-        with engine.connect() as conn:
+        with get_engine().connect() as conn:
             conn.execute(text(create_sql))
+            conn.execute(text(migrate_key_sql))
+            conn.execute(text(loaded_at_index_sql))
+            conn.execute(text(loaded_at_default_sql))
             conn.commit()  # Explicit commit required for DDL in PostgreSQL
         logging.info(f"Staging table '{STAGING_TABLE}' created or already exists.")
     except Exception as e:
         logging.error(f"Failed to create staging table: {e}")
         raise
 
-def load_json_files():
-    """Collect all JSON files recursively and load into a DataFrame."""
-    json_files = list(RAW_DIR.rglob("*.json"))  # Find all message_*.json files
-    if not json_files:
+def create_manifest_table():
+    """Create the manifest of raw files that have already been loaded."""
+    create_sql = """
+    CREATE TABLE IF NOT EXISTS loader_manifest (
+        file_path TEXT PRIMARY KEY,
+        size_bytes BIGINT NOT NULL,
+        mtime DOUBLE PRECISION NOT NULL,
+        checksum TEXT NOT NULL,
+        loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text(create_sql))
+            conn.commit()
+        logging.info(f"Manifest table '{MANIFEST_TABLE}' created or already exists.")
+    except Exception as e:
+        logging.error(f"Failed to create manifest table: {e}")
+        raise
+
+def file_checksum(file_path: Path) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fetch_manifest(prefix: str = None) -> dict:
+    """Return {file_path: (size_bytes, mtime, checksum)} for every file already loaded (under `prefix`, if given)."""
+    query = "SELECT file_path, size_bytes, mtime, checksum FROM loader_manifest"
+    if prefix is not None:
+        query += " WHERE starts_with(file_path, :prefix)"
+    with get_engine().connect() as conn:
+        result = conn.execute(text(query), {"prefix": prefix})
+        return {row.file_path: (row.size_bytes, row.mtime, row.checksum) for row in result}
+
+def find_unloaded_files(raw_files, manifest: dict):
+    """Return manifest entries for raw files that are new or whose content changed since they were loaded.
+
+    Size and mtime are compared first; the checksum is only computed for files that are new or
+    look modified, so an unchanged tree is scanned without reading any file contents. Files that
+    were touched but are identical get their new mtime stored, so they are not hashed again.
+    """
+    entries, touched = [], []
+    for file_path in raw_files:
+        stat = file_path.stat()
+        known = manifest.get(str(file_path))
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime:
+            continue
+        checksum = file_checksum(file_path)
+        entry = {
+            "file_path": str(file_path),
+            "size_bytes": stat.st_size,
+            "mtime": stat.st_mtime,
+            "checksum": checksum,
+        }
+        if known and known[2] == checksum:
+            touched.append(entry)  # touched but identical
+            continue
+        entries.append(entry)
+    refresh_manifest_mtimes(touched)
+    return entries
+
+def list_raw_files():
+    """List legacy per-message JSON files and sealed NDJSON segments under RAW_DIR."""
+    # Open segments (*.jsonl.open) are still being written by the scraper and are skipped
+    return sorted(p for p in RAW_DIR.rglob("*") if p.suffix in (".json", ".jsonl") and p.is_file())
+
+def parse_entries(entries, workers: int = PARSE_WORKERS):
+    """Parse manifest entries into one Arrow table; returns (table, entries that parsed cleanly)."""
+    batches, parsed = [], []
+    for batch, shard, _ in iter_parsed_shards(entries, workers):
+        batches.append(batch)
+        parsed.extend(shard)
+    return pa.Table.from_batches(batches, schema=RAW_SCHEMA), parsed
+
+def load_json_files(raw_files=None, workers: int = PARSE_WORKERS):
+    """Load raw files (legacy JSON and NDJSON segments) into a DataFrame; defaults to everything under RAW_DIR."""
+    import pandas as pd
+
+    if raw_files is None:
+        raw_files = list_raw_files()
+    if not raw_files:
         logging.warning("No JSON files found in data/raw/telegram_messages/")
         return pd.DataFrame()
 
-    all_data = []
-    for file_path in tqdm(json_files, desc="Loading JSON files"):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                all_data.append(data)
-        except json.JSONDecodeError as e:
-            logging.error(f"Invalid JSON in {file_path}: {e}")
-        except Exception as e:
-            logging.error(f"Error reading {file_path}: {e}")
-
-    if not all_data:
+    entries = [{"file_path": str(p), "size_bytes": p.stat().st_size} for p in raw_files]
+    arrow_table, _ = parse_entries(entries, workers)
+    if arrow_table.num_rows == 0:
         logging.warning("No valid data loaded from JSON files.")
         return pd.DataFrame()
 
-    df = pd.DataFrame(all_data)
-    logging.info(f"Loaded {len(df)} messages from {len(json_files)} JSON files.")
+    df = arrow_table.to_pandas()
+    logging.info(f"Loaded {len(df)} messages from {len(raw_files)} raw files.")
     return df
 
-def load_to_postgres(df: pd.DataFrame):
-    """Load DataFrame to PostgreSQL staging table (append mode)."""
+def upsert_rows(pd_table, conn, keys, data_iter):
+    """pandas.to_sql method: insert new messages, refresh views/forwards/image_path of ones already staged."""
+    rows = [dict(zip(keys, row)) for row in data_iter]
+    target = table(STAGING_TABLE, *(column(name) for name in [*keys, "loaded_at"]))
+    stmt = pg_insert(target).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=STAGING_KEY,
+        set_={
+            "views": stmt.excluded.views,
+            "forwards": stmt.excluded.forwards,
+            "image_path": stmt.excluded.image_path,
+            "loaded_at": func.clock_timestamp(),
+        },
+    )
+    return conn.execute(stmt).rowcount
+
+def load_to_postgres(df: "pd.DataFrame"):
+    """Upsert DataFrame into the PostgreSQL staging table on (channel_name, message_id)."""
     if df.empty:
         logging.info("No data to load into database.")
         return
 
+    # A message re-scraped into several files must appear once per statement; keep the latest copy
+    df = df.drop_duplicates(subset=STAGING_KEY, keep="last")
+
     try:
-        # Append mode - safe for incremental loads
-        df.to_sql(
-            name=STAGING_TABLE,
-            con=engine,
-            if_exists="append",
-            index=False,
-            method="multi",  # faster batch insert
-            chunksize=1000   # adjust if memory issues
-        )
-        logging.info(f"Successfully loaded {len(df)} rows into {STAGING_TABLE}.")
+        with timer(DB_WRITE_SECONDS, table=STAGING_TABLE):
+            df.to_sql(
+                name=STAGING_TABLE,
+                con=get_engine(),
+                if_exists="append",
+                index=False,
+                method=upsert_rows,  # INSERT ... ON CONFLICT DO UPDATE, safe to re-run
+                chunksize=1000   # adjust if memory issues
+            )
+        ROWS_WRITTEN.inc(len(df), table=STAGING_TABLE)
+        logging.info(f"Successfully upserted {len(df)} rows into {STAGING_TABLE}.")
     except Exception as e:
         logging.error(f"Database load failed: {e}")
         raise
 
+MANIFEST_UPSERT_SQL = """
+    INSERT INTO loader_manifest (file_path, size_bytes, mtime, checksum, loaded_at)
+    VALUES (:file_path, :size_bytes, :mtime, :checksum, CURRENT_TIMESTAMP)
+    ON CONFLICT (file_path) DO UPDATE
+    SET size_bytes = EXCLUDED.size_bytes,
+        mtime = EXCLUDED.mtime,
+        checksum = EXCLUDED.checksum,
+        loaded_at = EXCLUDED.loaded_at
+"""
+
+def record_loaded_files(entries):
+    """Add (or refresh) manifest rows for files that were just loaded."""
+    if not entries:
+        return
+    with get_engine().begin() as conn:
+        conn.execute(text(MANIFEST_UPSERT_SQL), entries)
+    logging.info(f"Recorded {len(entries)} files in {MANIFEST_TABLE}.")
+
+MANIFEST_REFRESH_SQL = """
+    UPDATE loader_manifest
+    SET mtime = :mtime
+    WHERE file_path = :file_path AND checksum = :checksum
+"""
+
+def refresh_manifest_mtimes(entries):
+    """Store the new mtime of files that were touched but whose content is unchanged."""
+    if not entries:
+        return
+    with get_engine().begin() as conn:
+        conn.execute(text(MANIFEST_REFRESH_SQL), entries)
+    logging.info(f"Refreshed the mtime of {len(entries)} unchanged files in {MANIFEST_TABLE}.")
+
+def iter_copy_batches(entries, batch_size: int = COPY_BATCH_SIZE, workers: int = PARSE_WORKERS):
+    """Stream parsed rows as record batches of at most `batch_size` rows.
+
+    Yields (batch, completed) where `completed` lists the manifest entries whose last rows
+    are in this batch, so they can be recorded in the same transaction.
+    """
+    for batch, shard, _ in iter_parsed_shards(entries, workers):
+        if batch.num_rows == 0:
+            yield batch, shard
+            continue
+        for offset in range(0, batch.num_rows, batch_size):
+            is_last = offset + batch_size >= batch.num_rows
+            yield batch.slice(offset, batch_size), shard if is_last else []
+
+def copy_rows(conn, batch: pa.RecordBatch):
+    """COPY one record batch into the session's temp table as CSV (NULL unquoted, '' quoted)."""
+    buffer = io.BytesIO()
+    pa_csv.write_csv(batch, buffer, pa_csv.WriteOptions(include_header=False))
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert(
+        f"COPY {COPY_TEMP_TABLE} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+def copy_load(entries, batch_size: int = COPY_BATCH_SIZE, workers: int = PARSE_WORKERS, batches=None):
+    """Stream raw files into staging via COPY FROM STDIN and a merge, one bounded batch at a time.
+
+    Each batch is COPYed into a temp table (temp tables skip the WAL) and merged into
+    staging with the same ON CONFLICT semantics as load_to_postgres; the batch and the
+    manifest rows of the files it finishes commit together. Memory stays flat at one batch.
+    `batches` takes already parsed (batch, completed) pairs from iter_copy_batches instead.
+    """
+    columns = ", ".join(COPY_COLUMNS)
+    merge_sql = f"""
+        INSERT INTO staging_telegram_messages ({columns})
+        SELECT DISTINCT ON (channel_name, message_id) {columns}
+        FROM {COPY_TEMP_TABLE}
+        ORDER BY channel_name, message_id, seq DESC  -- latest copy of a re-scraped message wins
+        ON CONFLICT (channel_name, message_id) DO UPDATE
+        SET views = EXCLUDED.views,
+            forwards = EXCLUDED.forwards,
+            image_path = EXCLUDED.image_path,
+            loaded_at = clock_timestamp()
+    """
+    total_rows = 0
+    with get_engine().connect() as conn:
+        conn.execute(text(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {COPY_TEMP_TABLE} (
+                seq BIGSERIAL,
+                message_id BIGINT,
+                channel_name TEXT,
+                message_date TIMESTAMP WITH TIME ZONE,
+                message_text TEXT,
+                has_media BOOLEAN,
+                image_path TEXT,
+                views INTEGER,
+                forwards INTEGER
+            ) ON COMMIT DELETE ROWS
+        """))
+        conn.commit()
+
+        if batches is None:
+            batches = iter_copy_batches(entries, batch_size, workers)
+        for batch, completed in batches:
+            try:
+                with timer(DB_WRITE_SECONDS, table=STAGING_TABLE):
+                    if batch.num_rows:
+                        copy_rows(conn, batch)
+                        conn.execute(text(merge_sql))
+                    if completed:
+                        conn.execute(text(MANIFEST_UPSERT_SQL), completed)
+                    conn.commit()
+                ROWS_WRITTEN.inc(batch.num_rows, table=STAGING_TABLE)
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"COPY batch failed after {total_rows} rows: {e}")
+                raise
+            total_rows += batch.num_rows
+            logging.info(f"COPY merged {total_rows} rows so far ({len(completed)} files completed in this batch)")
+
+    logging.info(f"Successfully bulk-loaded {total_rows} rows into {STAGING_TABLE} via COPY.")
+    return total_rows
+
 if __name__ == "__main__":
-    logging.info("Starting data load to PostgreSQL staging...")
-    create_staging_table()
-    df = load_json_files()
-    load_to_postgres(df)
-    logging.info("Data load process completed.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load raw Telegram messages into PostgreSQL staging")
+    parser.add_argument("--copy", action="store_true", help="stream rows through COPY FROM STDIN in bounded batches")
+    parser.add_argument("--batch-size", type=int, default=COPY_BATCH_SIZE, help="rows per COPY batch")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="processes used to parse raw files")
+    args = parser.parse_args()
+
+    setup_logging()
+    with record_run("loader"):
+        logging.info("Starting data load to PostgreSQL staging...")
+        create_staging_table()
+        create_manifest_table()
+        new_files = find_unloaded_files(list_raw_files(), fetch_manifest())
+        logging.info(f"{len(new_files)} new or changed raw files to load.")
+        if new_files and args.copy:
+            copy_load(new_files, batch_size=args.batch_size, workers=args.workers)
+        elif new_files:
+            arrow_table, parsed_files = parse_entries(new_files, args.workers)
+            load_to_postgres(arrow_table.to_pandas())
+            # Recorded only after the upsert: a crash in between just reloads the same rows, harmlessly
+            record_loaded_files(parsed_files)
+        if new_files:
+            bump_data_version(get_engine(), "loader")
+        logging.info("Data load process completed.")
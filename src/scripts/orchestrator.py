@@ -0,0 +1,455 @@
+"""
+Local pipeline orchestrator: scrape, load, mentions, dedup, dbt, images and YOLO as one overlapping DAG.
+
+Work is tracked per raw partition (`<date>/<channel>`, the scraper's layout). The scraper seals
+a channel's segments as soon as that channel is done, and each sealed partition is loaded right
+away while other channels are still being scraped. Its images may still be downloading then, so
+the image stages hang off a second source, `downloads`, which emits a pass's partitions once the
+pass's downloads have finished. The incremental stages (mentions, dedup, dbt, images, YOLO) take
+every partition that became ready since their last run in one batch:
+
+    scrape ───> load ─┬─> mentions ─┬─> dbt ─┬─> snapshot
+                      └─> dedup ────┘        └─> yolo ─> dbt_enrichments ─> snapshot_enrichments
+    downloads ─> images ─────────────────────────┘
+
+The snapshot stages publish the dashboard's datasets (see src/scripts/dashboard_snapshot.py),
+so a partition shows up on the dashboard as soon as dbt has merged it.
+
+Each stage has its own concurrency limit. Partitions are parsed in parallel but their writes
+to staging commit one at a time, in loaded_at order, so the loaded_at watermarks of the stages
+reading staging never skip rows from a load that commits late.
+The status of every (stage, partition) is kept in pipeline_partitions. Within a run, a failed
+partition is retried with backoff. After a restart, partitions that are done are skipped and
+failed ones run again, without redoing anything that succeeded. A partition that gets new
+segments is reset downstream of the scrape and flows through again.
+
+    python -m src.scripts.orchestrator                  # one scrape pass, then drain the DAG
+    python -m src.scripts.orchestrator --interval 120   # scrape every 2 minutes; posts reach the marts in minutes
+    python -m src.scripts.orchestrator --no-scrape      # process raw partitions already on disk
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from src.scripts import loader
+from src.scripts.instrumentation import counter, histogram, record_run
+
+load_dotenv()
+
+LOAD_CONCURRENCY = int(os.getenv("ORCHESTRATOR_LOAD_CONCURRENCY", "4"))  # partitions loaded at once
+MAX_ATTEMPTS = int(os.getenv("ORCHESTRATOR_MAX_ATTEMPTS", "3"))          # tries per partition per run
+RETRY_DELAY = float(os.getenv("ORCHESTRATOR_RETRY_DELAY", "30"))         # seconds before the first retry, doubling
+DBT_PROJECT_DIR = Path(__file__).resolve().parents[2] / "medical_warehouse_dbt"
+
+STATE_TABLE = "pipeline_partitions"
+
+_STAGING_WRITES = threading.Lock()  # loads commit in loaded_at order, so watermarks don't rely on their lookback
+
+FRESHNESS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+STAGE_SECONDS = histogram("orchestrator_stage_seconds", "Time per stage run, by stage")
+PARTITION_LATENCY = histogram("orchestrator_partition_latency_seconds",
+                              "Time from a partition being sealed to each stage finishing it, by stage",
+                              buckets=FRESHNESS_BUCKETS)
+PARTITIONS = counter("orchestrator_partitions_total", "Partitions finished, by stage and status")
+
+def partition_key(date: str, channel: str) -> str:
+    return f"{date}/{channel}"
+
+
+class Stage:
+    """One node of the DAG.
+
+    `run` is called in a worker thread with a list of partition keys: one key per call, or every
+    ready key at once with `batch=True` (for incremental stages that process whatever is new
+    anyway). A `source` stage's `run` is instead a coroutine function called once with an
+    `emit(keys)` callback. `exclusive` names stages that must never run at the same time as this one.
+    """
+
+    def __init__(self, name: str, run, upstream=(), concurrency: int = 1, batch: bool = False,
+                 source: bool = False, exclusive=(), max_attempts: int = MAX_ATTEMPTS):
+        self.name = name
+        self.run = run
+        self.upstream = tuple(upstream)
+        self.concurrency = concurrency
+        self.batch = batch
+        self.source = source
+        self.exclusive = set(exclusive)
+        self.max_attempts = max_attempts
+
+
+class PartitionStore:
+    """pipeline_partitions: the last status of every (stage, partition), so a restart resumes."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def ensure_table(self):
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                    stage TEXT NOT NULL,
+                    partition_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (stage, partition_key)
+                )
+            """))
+
+    def load(self) -> dict:
+        """Return {(stage, partition_key): status}."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT stage, partition_key, status FROM {STATE_TABLE}"))
+            return {(row.stage, row.partition_key): row.status for row in rows}
+
+    def mark(self, stage: str, keys, status: str, error: str = None):
+        """Record `status` for `keys`; failures add to the attempt count, success resets it."""
+        with self.engine.begin() as conn:
+            conn.execute(text(f"""
+                INSERT INTO {STATE_TABLE} (stage, partition_key, status, attempts, last_error, updated_at)
+                SELECT :stage, k, :status, CASE WHEN :status = 'failed' THEN 1 ELSE 0 END, :error, CURRENT_TIMESTAMP
+                FROM unnest(CAST(:keys AS TEXT[])) AS k
+                ON CONFLICT (stage, partition_key) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    attempts = CASE WHEN EXCLUDED.status = 'done' THEN 0
+                                    ELSE {STATE_TABLE}.attempts + EXCLUDED.attempts END,
+                    last_error = EXCLUDED.last_error,
+                    updated_at = EXCLUDED.updated_at
+            """), {"stage": stage, "keys": list(keys), "status": status, "error": error})
+
+
+class Pipeline:
+    """Drive partitions through a DAG of stages as soon as their upstream stages finish them.
+
+    `stages` must be in topological order; when two exclusive stages both want to start, the
+    later (downstream) one goes first. Without a `store`, state lives in memory only; with one,
+    status writes run in a single background thread, in order, so they never block the event loop.
+    """
+
+    def __init__(self, stages, store=None, retry_delay: float = RETRY_DELAY):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = list(self.stages)
+        for stage in stages:
+            for other in stage.exclusive:
+                self.stages[other].exclusive.add(stage.name)
+        self.store = store
+        self.retry_delay = retry_delay
+        self.status = {}        # (stage, key) -> pending | running | retrying | done | failed
+        self.attempts = {}      # (stage, key) -> failures in this run
+        self.generation = {}    # key -> times emitted; a run that started on an older one is redone
+        self.emitted_at = {}    # key -> monotonic time its oldest unfinished data was sealed
+        self.ready = {name: {} for name in self.stages}  # ordered sets of keys waiting for each stage
+        self.running = {name: 0 for name in self.stages}
+        self._tasks = set()
+        self._retries = 0
+        self._wake = None
+        self._store_executor = None
+        self._store_writes = set()
+
+    def _descendants(self, name: str) -> list:
+        found = {name}
+        for other in self.order:
+            if found & set(self.stages[other].upstream):
+                found.add(other)
+        return [other for other in self.order if other in found and other != name]
+
+    def _mark(self, stage: str, keys, status: str, error: str = None):
+        for key in keys:
+            self.status[(stage, key)] = status
+        if self.store is not None and keys:
+            write = asyncio.get_running_loop().run_in_executor(
+                self._store_executor, self.store.mark, stage, list(keys), status, error)
+            self._store_writes.add(write)
+            write.add_done_callback(self._store_written)
+
+    def _store_written(self, write):
+        self._store_writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            logging.error(f"Could not record partition status: {write.exception()}")
+
+    def _enqueue(self, key: str):
+        """Queue `key` for every stage whose upstream stages have all finished it."""
+        for name in self.order:
+            stage = self.stages[name]
+            if stage.source or self.status.get((name, key)) not in (None, "pending"):
+                continue
+            if all(self.status.get((upstream, key)) == "done" for upstream in stage.upstream):
+                self.ready[name][key] = None
+
+    def emit(self, source: str, keys):
+        """Called by a source stage with partitions that have new data."""
+        keys = list(dict.fromkeys(keys))
+        for key in keys:
+            self.generation[key] = self.generation.get(key, 0) + 1
+            self.emitted_at.setdefault(key, time.monotonic())
+        self._mark(source, keys, "done")
+        for name in self._descendants(source):
+            reset = [key for key in keys if self.status.get((name, key)) != "running"]
+            for key in reset:
+                self.ready[name].pop(key, None)  # may no longer be ready
+            self._mark(name, reset, "pending")
+        for key in keys:
+            self._enqueue(key)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _resume(self):
+        """Queue every partition the store has not seen through to the end."""
+        if self.store is None:
+            return
+        for (name, key), status in (await asyncio.to_thread(self.store.load)).items():
+            # Failed last time: tried again now; done: never redone
+            self.status[(name, key)] = "pending" if status == "failed" else status
+        for key in {key for _, key in self.status}:
+            self._enqueue(key)
+
+    def _blocked(self, name: str) -> bool:
+        stage = self.stages[name]
+        if any(self.running[other] for other in stage.exclusive):
+            return True
+        # Let a waiting downstream stage in first, or a busy upstream one could starve it
+        return any(self.ready[other] and self.running[other] < self.stages[other].concurrency
+                   for other in stage.exclusive if self.order.index(other) > self.order.index(name))
+
+    def _start_ready(self):
+        for name in self.order:
+            stage = self.stages[name]
+            while self.ready[name] and self.running[name] < stage.concurrency and not self._blocked(name):
+                keys = list(self.ready[name]) if stage.batch else [next(iter(self.ready[name]))]
+                for key in keys:
+                    del self.ready[name][key]
+                    self.status[(name, key)] = "running"
+                self.running[name] += 1
+                generations = {key: self.generation.get(key, 0) for key in keys}
+                self._tasks.add(asyncio.create_task(self._run_stage(stage, keys, generations)))
+
+    async def _run_source(self, stage: Stage):
+        try:
+            await stage.run(lambda keys: self.emit(stage.name, keys))
+        except Exception as e:
+            logging.error(f"Source {stage.name} failed: {e}")
+        finally:
+            self._wake.set()
+
+    async def _run_stage(self, stage: Stage, keys: list, generations: dict):
+        logging.info(f"{stage.name}: starting on {len(keys)} partition(s)")
+        started = time.perf_counter()
+        error = None
+        try:
+            await asyncio.to_thread(stage.run, keys)
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage.name)
+        self.running[stage.name] -= 1
+        logging.info(f"{stage.name}: {len(keys)} partition(s) {'failed' if error else 'done'} in {elapsed:.1f}s")
+
+        try:
+            # Partitions that got new data while this ran must go through the stage again
+            stale = [key for key in keys if self.generation.get(key, 0) != generations[key]]
+            current = [key for key in keys if key not in stale]
+            self._mark(stage.name, stale, "pending")
+            if error is None:
+                self._finish(stage, current)
+            else:
+                self._fail(stage, current, error)
+            for key in stale + (current if error is None else []):
+                self._enqueue(key)
+        finally:
+            self._tasks.discard(asyncio.current_task())  # before waking run(), which checks for idle
+            self._wake.set()
+
+    def _finish(self, stage: Stage, keys: list):
+        self._mark(stage.name, keys, "done")
+        PARTITIONS.inc(len(keys), stage=stage.name, status="done")
+        now = time.monotonic()
+        for key in keys:
+            self.attempts.pop((stage.name, key), None)
+            if key in self.emitted_at:
+                PARTITION_LATENCY.observe(now - self.emitted_at[key], stage=stage.name)
+                if all(self.status.get((name, key)) == "done" for name in self.order):
+                    del self.emitted_at[key]
+
+    def _fail(self, stage: Stage, keys: list, error: Exception):
+        logging.error(f"{stage.name}: {error}")
+        self._mark(stage.name, keys, "failed", str(error))
+        PARTITIONS.inc(len(keys), stage=stage.name, status="failed")
+        loop = asyncio.get_running_loop()
+        for key in keys:
+            attempts = self.attempts[(stage.name, key)] = self.attempts.get((stage.name, key), 0) + 1
+            if attempts >= stage.max_attempts:
+                logging.error(f"{stage.name}: giving up on {key} after {attempts} attempts")
+                continue
+            self.status[(stage.name, key)] = "retrying"
+            self._retries += 1
+            loop.call_later(self.retry_delay * 2 ** (attempts - 1), self._retry, stage.name, key)
+
+    def _retry(self, name: str, key: str):
+        self._retries -= 1
+        if self.status.get((name, key)) == "retrying":  # not reset by a newer emit meanwhile
+            self.status[(name, key)] = "pending"
+            self._enqueue(key)
+        self._wake.set()
+
+    async def run(self) -> dict:
+        """Run the sources and every stage until no work is left; returns {stage: failed keys}."""
+        self._wake = asyncio.Event()
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="partition-store")
+        try:
+            await self._resume()
+            sources = [asyncio.create_task(self._run_source(stage)) for stage in self.stages.values() if stage.source]
+            while True:
+                self._start_ready()
+                if not self._tasks and not self._retries and all(task.done() for task in sources):
+                    break
+                self._wake.clear()
+                await self._wake.wait()
+        finally:
+            await asyncio.gather(*self._store_writes, return_exceptions=True)
+            self._store_executor.shutdown()
+        failed = {name: sorted(key for (stage, key), status in self.status.items()
+                               if stage == name and status == "failed") for name in self.order}
+        return {name: keys for name, keys in failed.items() if keys}
+
+
+def partition_files(key: str, raw_dir: Path = None) -> list:
+    """Sealed raw files of one partition (open segments are still being written)."""
+    partition_dir = (raw_dir or loader.RAW_DIR) / key
+    return sorted(p for p in partition_dir.glob("*") if p.suffix in (".json", ".jsonl") and p.is_file())
+
+
+def load_partitions(keys):
+    """Load the new or changed files of each partition; the manifest makes a repeat a no-op."""
+    for key in keys:
+        prefix = str(loader.RAW_DIR / key) + os.sep
+        entries = loader.find_unloaded_files(partition_files(key), loader.fetch_manifest(prefix))
+        if not entries:
+            continue
+        batches = list(loader.iter_copy_batches(entries, workers=1))  # one partition: parsed in this thread
+        with _STAGING_WRITES:
+            loader.copy_load(entries, batches=batches)
+
+
+def unloaded_partitions() -> list:
+    """Partitions on disk holding raw files the loader has not seen (e.g. written by a standalone scraper run)."""
+    entries = loader.find_unloaded_files(loader.list_raw_files(), loader.fetch_manifest())
+    return sorted({str(Path(entry["file_path"]).parent.relative_to(loader.RAW_DIR).as_posix()) for entry in entries})
+
+
+def run_dbt(select: str = None):
+    command = ["dbt", "run", "--project-dir", str(DBT_PROJECT_DIR)]
+    if select:
+        command += ["--select", select]
+    subprocess.run(command, check=True, stdout=sys.stderr)
+
+
+def build_stages(scrape: bool = True, backfill: bool = False, limit: int = 100, channels=None, telegram=None,
+                 interval: float = None, yolo_runner=None, load_concurrency: int = LOAD_CONCURRENCY) -> list:
+    """The pipeline DAG; YOLO and the dbt run that merges its results are left out without `yolo_runner`."""
+    from src.scripts import dashboard_snapshot, dedup_messages, image_preprocess, product_mentions, scraper
+    from src.scripts.raw_sink import recover_open_segments
+
+    downloaded = asyncio.Queue()  # partition lists whose images are on disk; None once scraping ends
+
+    async def source(emit):
+        try:
+            recover_open_segments(loader.RAW_DIR)
+            leftover = unloaded_partitions()  # left over from a crash or a standalone scraper run
+            emit(leftover)
+            downloaded.put_nowait(leftover)
+            if scrape:
+                await scraper.main(backfill=backfill, limit=limit, channels=channels, telegram=telegram,
+                                   interval=interval, on_seal=lambda key: emit([partition_key(*key)]),
+                                   on_downloaded=lambda keys: downloaded.put_nowait(
+                                       [partition_key(*key) for key in keys]))
+        finally:
+            downloaded.put_nowait(None)
+
+    async def downloads(emit):
+        while (keys := await downloaded.get()) is not None:
+            emit(keys)
+
+    stages = [
+        Stage("scrape", source, source=True),
+        Stage("downloads", downloads, source=True),
+        Stage("load", load_partitions, upstream=["scrape"], concurrency=load_concurrency),
+        Stage("mentions", lambda keys: product_mentions.main(), upstream=["load"], batch=True),
+        Stage("dedup", lambda keys: dedup_messages.main(), upstream=["load"], batch=True),
+        Stage("images", lambda keys: image_preprocess.main(), upstream=["downloads"], batch=True),
+        Stage("dbt", lambda keys: run_dbt(), upstream=["mentions", "dedup"], batch=True),
+        Stage("snapshot", lambda keys: dashboard_snapshot.main(), upstream=["dbt"], batch=True),
+    ]
+    if yolo_runner is not None:
+        from src.scripts import enrich_images_yolo
+
+        stages += [
+            Stage("yolo", lambda keys: enrich_images_yolo.main(runner=yolo_runner), upstream=["dbt", "images"],
+                  batch=True),
+            # Merges the detections into fct_messages and the marts built on it
+            Stage("dbt_enrichments", lambda keys: run_dbt("fct_messages+"), upstream=["yolo"],
+                  exclusive=["dbt"], batch=True),
+            Stage("snapshot_enrichments", lambda keys: dashboard_snapshot.main(), upstream=["dbt_enrichments"],
+                  exclusive=["snapshot"], batch=True),
+        ]
+    return stages
+
+
+async def main(scrape: bool = True, backfill: bool = False, limit: int = 100, channels=None, telegram=None,
+               interval: float = None, yolo: bool = True, load_concurrency: int = LOAD_CONCURRENCY) -> dict:
+    """Run the pipeline once (or, with `interval`, until interrupted); returns {stage: failed partitions}."""
+    loader.create_staging_table()
+    loader.create_manifest_table()
+    store = PartitionStore(loader.get_engine())
+    store.ensure_table()
+
+    runner = None
+    if yolo:
+        from src.scripts.enrich_images_yolo import make_runner, warm_up
+
+        runner = make_runner()
+    with runner if runner is not None else nullcontext():
+        if runner is not None:
+            await asyncio.to_thread(warm_up, runner)
+        stages = build_stages(scrape, backfill, limit, channels, telegram, interval, runner, load_concurrency)
+        failed = await Pipeline(stages, store).run()
+    for name, keys in failed.items():
+        logging.error(f"{name}: {len(keys)} partition(s) failed and will be retried on the next run: {keys[:10]}")
+    return failed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler()]
+    )
+    parser = argparse.ArgumentParser(description="Run scrape → load → mentions/dedup → dbt → images/YOLO as a DAG")
+    parser.add_argument("--interval", type=float, help="keep scraping every INTERVAL seconds instead of once")
+    parser.add_argument("--no-scrape", action="store_true", help="only process raw partitions already on disk")
+    parser.add_argument("--backfill", action="store_true", help="walk older history instead of fetching new messages")
+    parser.add_argument("--no-yolo", action="store_true", help="skip YOLO enrichment and the dbt run that merges it")
+    parser.add_argument("--load-concurrency", type=int, default=LOAD_CONCURRENCY, help="partitions loaded at once")
+    args = parser.parse_args()
+
+    # In --interval mode every scrape pass writes its own run record, which includes these metrics
+    with record_run("orchestrator") if args.interval is None else nullcontext():
+        try:
+            failed = asyncio.run(main(scrape=not args.no_scrape, backfill=args.backfill, interval=args.interval,
+                                      yolo=not args.no_yolo, load_concurrency=args.load_concurrency))
+        except KeyboardInterrupt:
+            logging.info("Orchestrator stopped")
+            failed = {}
+    sys.exit(1 if failed else 0)
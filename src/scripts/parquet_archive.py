@@ -0,0 +1,348 @@
+"""
+Columnar Parquet archive of the raw messages and the warehouse marts.
+
+Heavy historical analytics read these files (see src/scripts/archive_query.py)
+instead of scanning Postgres alongside the API:
+
+    data/archive/messages/month=YYYY-MM/part-*.parquet   raw messages, deduplicated
+    data/archive/marts/<table>/[month=YYYY-MM/]*.parquet  copies of the marts
+
+Raw files are archived incrementally. Files not seen before (by size and
+mtime, tracked in _manifest.json) are parsed with the loader's parser and
+appended to their month as delta files, then every month that received
+deltas is compacted into one file. Compaction deduplicates on (channel_name,
+message_id), with the latest copy winning as in the loader, and sorts by
+channel and date. Row groups therefore carry tight min/max statistics, and a
+channel or date filter skips most of a file without reading it. Only
+touched months are rewritten, so memory is bounded by one month of
+messages. Before the compacted file is moved into place, the files it
+replaces are listed in the month's _compaction.json; if a run dies before
+removing them, the next run does, so a month never keeps two copies.
+
+Marts are re-exported in full on every run through a server-side cursor.
+fct_messages and agg_channel_daily are partitioned by month.
+
+    python -m src.scripts.parquet_archive             # raw messages, then marts
+    python -m src.scripts.parquet_archive --skip-marts
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from src.scripts.database import get_engine
+from src.scripts.instrumentation import counter, histogram, record_run, timer
+from src.scripts.raw_parser import RAW_SCHEMA, iter_parsed_shards
+from src.scripts.raw_sink import RAW_DIR
+
+load_dotenv()
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "data/archive"))
+ROW_GROUP_ROWS = int(os.getenv("ARCHIVE_ROW_GROUP_ROWS", "100000"))  # rows per row group (one min/max per column)
+FETCH_ROWS = int(os.getenv("ARCHIVE_FETCH_ROWS", "50000"))           # rows per server-side cursor fetch
+PARSE_WORKERS = int(os.getenv("LOADER_PARSE_WORKERS", str(os.cpu_count() or 1)))
+COMPRESSION = "zstd"
+UNKNOWN_MONTH = "unknown"  # messages without a parseable date
+COMPACTION_JOURNAL = "_compaction.json"  # files a month's new part replaces, until they are removed
+
+MESSAGE_KEY = ["channel_name", "message_id"]
+MESSAGE_SORT = [("channel_name", "ascending"), ("message_date", "ascending")]
+
+# Mart -> (SQL expression for its month partition or None, ORDER BY for the export)
+MARTS = {
+    "fct_messages": ("to_char(date_key, 'YYYY-MM')", "message_timestamp"),
+    "fct_product_mentions": (None, "channel_name, message_id"),
+    "message_clusters": (None, "channel_name, message_id"),
+    "agg_channel_daily": ("to_char(date_key, 'YYYY-MM')", "date_key, channel_name"),
+    "agg_channel_weekly": (None, None),
+    "dim_channels": (None, None),
+    "dim_dates": (None, None),
+}
+
+# Postgres data_type -> (Arrow type, cast applied in the export SELECT); others are exported as text
+PG_TYPES = {
+    "smallint": (pa.int32(), None),
+    "integer": (pa.int32(), None),
+    "bigint": (pa.int64(), None),
+    "real": (pa.float64(), "float8"),
+    "double precision": (pa.float64(), None),
+    "numeric": (pa.float64(), "float8"),
+    "boolean": (pa.bool_(), None),
+    "text": (pa.string(), None),
+    "character varying": (pa.string(), None),
+    "date": (pa.date32(), None),
+    "timestamp with time zone": (pa.timestamp("us", tz="UTC"), None),
+    "timestamp without time zone": (pa.timestamp("us"), None),
+    "ARRAY": (pa.list_(pa.string()), "text[]"),
+}
+SKIPPED_TYPES = {"tsvector", "bytea"}  # search indexes and signatures: Postgres-only
+
+ARCHIVED_ROWS = counter("archive_rows_written_total", "Rows written to the Parquet archive, by dataset")
+COMPACT_SECONDS = histogram("archive_compact_seconds", "Time to compact one month of raw messages")
+
+
+def messages_dir(archive_dir: Path = None) -> Path:
+    return (archive_dir or ARCHIVE_DIR) / "messages"
+
+
+def marts_dir(archive_dir: Path = None) -> Path:
+    return (archive_dir or ARCHIVE_DIR) / "marts"
+
+
+def load_manifest(archive_dir: Path = None) -> dict:
+    """{raw file path: [size, mtime]} for every raw file already archived."""
+    path = (archive_dir or ARCHIVE_DIR) / "_manifest.json"
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(manifest: dict, archive_dir: Path = None):
+    path = (archive_dir or ARCHIVE_DIR) / "_manifest.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def find_unarchived_files(raw_dir: Path, manifest: dict) -> list:
+    """Sealed raw files (legacy JSON and NDJSON segments) that are new or changed since they were archived."""
+    entries = []
+    for path in sorted(p for p in Path(raw_dir).rglob("*") if p.suffix in (".json", ".jsonl") and p.is_file()):
+        stat = path.stat()
+        if manifest.get(str(path)) != [stat.st_size, stat.st_mtime]:
+            entries.append({"file_path": str(path), "size_bytes": stat.st_size, "mtime": stat.st_mtime})
+    return entries
+
+
+def month_keys(batch) -> pa.Array:
+    """'YYYY-MM' of each message_date, UNKNOWN_MONTH where it is missing."""
+    return pc.fill_null(pc.strftime(batch.column("message_date"), format="%Y-%m"), UNKNOWN_MONTH)
+
+
+def write_deltas(batch: pa.RecordBatch, archive_dir: Path, run_id: str, shard: int) -> set:
+    """Append one parsed shard to its months as delta files; returns the months touched."""
+    table = pa.Table.from_batches([batch], schema=RAW_SCHEMA)
+    months = month_keys(table)
+    touched = set()
+    for month in pc.unique(months).to_pylist():
+        part = table.filter(pc.equal(months, month))
+        path = messages_dir(archive_dir) / f"month={month}" / f"delta-{run_id}-{shard:05d}.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(part, path, compression=COMPRESSION)
+        touched.add(month)
+    return touched
+
+
+def deduplicate(table: pa.Table, key=MESSAGE_KEY) -> pa.Table:
+    """Keep the last row of every key (rows later in the table are newer copies)."""
+    if table.num_rows == 0:
+        return table
+    table = table.append_column("__row", pa.array(np.arange(table.num_rows)))
+    last = table.group_by(key, use_threads=False).aggregate([("__row", "max")])
+    return table.take(last["__row_max"]).drop_columns(["__row"])
+
+
+def finish_compaction(directory: Path):
+    """Remove the files an interrupted compaction of `directory` already replaced."""
+    journal = directory / COMPACTION_JOURNAL
+    if not journal.exists():
+        return
+    pending = json.loads(journal.read_text(encoding="utf-8"))
+    if (directory / pending["part"]).exists():  # the new part made it into place; the old files are copies
+        for name in pending["replaces"]:
+            (directory / name).unlink(missing_ok=True)
+        logging.info(f"Finished an interrupted compaction of {directory}")
+    for tmp_path in directory.glob(".part-*.parquet.tmp"):
+        tmp_path.unlink()
+    journal.unlink()
+
+
+def compact_month(month: str, archive_dir: Path = None) -> int:
+    """Rewrite one month's base and delta files as a single deduplicated, sorted file."""
+    directory = messages_dir(archive_dir) / f"month={month}"
+    finish_compaction(directory)
+    files = sorted(directory.glob("*.parquet"), key=lambda p: (not p.name.startswith("part-"), p.name))
+    if not files:
+        return 0
+    with timer(COMPACT_SECONDS):
+        # The base part first, then deltas in run order, so the newest copy of a message wins
+        table = pa.concat_tables([pq.read_table(f, schema=RAW_SCHEMA) for f in files])
+        table = deduplicate(table).sort_by(MESSAGE_SORT)
+        tmp_path = directory / f".part-{uuid.uuid4().hex}.parquet.tmp"
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_ROWS, compression=COMPRESSION,
+                       write_statistics=True)
+        part = f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet"
+        journal_tmp = directory / f"{COMPACTION_JOURNAL}.tmp"
+        journal_tmp.write_text(json.dumps({"part": part, "replaces": [f.name for f in files]}), encoding="utf-8")
+        os.replace(journal_tmp, directory / COMPACTION_JOURNAL)
+        os.replace(tmp_path, directory / part)
+        for f in files:
+            f.unlink()
+        (directory / COMPACTION_JOURNAL).unlink()
+    ARCHIVED_ROWS.inc(table.num_rows, dataset="messages")
+    logging.info(f"Compacted messages for {month}: {table.num_rows} rows from {len(files)} files")
+    return table.num_rows
+
+
+def archive_raw(raw_dir: Path = RAW_DIR, archive_dir: Path = None, workers: int = PARSE_WORKERS) -> int:
+    """Archive new raw files and compact the months they touched; returns the messages parsed."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    for journal in sorted(messages_dir(archive_dir).glob(f"month=*/{COMPACTION_JOURNAL}")):
+        finish_compaction(journal.parent)
+    manifest = load_manifest(archive_dir)
+    entries = find_unarchived_files(raw_dir, manifest)
+    if not entries:
+        logging.info("No new raw files to archive.")
+        return 0
+
+    logging.info(f"Archiving {len(entries)} new or changed raw files")
+    run_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    touched, parsed_rows = set(), 0
+    archived = []
+    for shard, (batch, parsed, _) in enumerate(iter_parsed_shards(entries, workers)):
+        if batch.num_rows:
+            touched |= write_deltas(batch, archive_dir, run_id, shard)
+            parsed_rows += batch.num_rows
+        archived.extend(parsed)
+
+    for month in sorted(touched):
+        compact_month(month, archive_dir)
+    # Saved last: after a crash the same files are archived again, and compaction drops the copies
+    for entry in archived:
+        manifest[entry["file_path"]] = [entry["size_bytes"], entry["mtime"]]
+    save_manifest(manifest, archive_dir)
+    logging.info(f"Archived {parsed_rows} messages into {len(touched)} month partitions")
+    return parsed_rows
+
+
+def mart_columns(conn, table: str) -> list:
+    """(name, Arrow type, SELECT expression) for each exportable column of a mart, or [] if it doesn't exist."""
+    rows = conn.execute(text("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table
+        ORDER BY ordinal_position
+    """), {"table": table}).fetchall()
+    columns = []
+    for name, data_type in rows:
+        if data_type in SKIPPED_TYPES:
+            continue
+        arrow_type, cast = PG_TYPES.get(data_type, (pa.string(), "text"))
+        columns.append((name, arrow_type, f'"{name}"::{cast}' if cast else f'"{name}"'))
+    return columns
+
+
+def iter_mart_batches(conn, table: str, columns: list, month_sql: str = None, order_by: str = None):
+    """Stream a mart as record batches of FETCH_ROWS rows through a server-side cursor.
+
+    With `month_sql` each row also gets a "month" column to partition on.
+    """
+    schema = pa.schema([pa.field(name, arrow_type) for name, arrow_type, _ in columns])
+    select = [expression for _, _, expression in columns]
+    if month_sql:
+        schema = schema.append(pa.field("month", pa.string()))
+        select.append(f"COALESCE({month_sql}, '{UNKNOWN_MONTH}')")
+
+    cursor = conn.connection.cursor(name=f"archive_{table}")  # server-side: rows arrive FETCH_ROWS at a time
+    cursor.execute(f"SELECT {', '.join(select)} FROM {table}" + (f" ORDER BY {order_by}" if order_by else ""))
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+    finally:
+        cursor.close()
+
+
+def archive_mart(engine, table: str, archive_dir: Path = None) -> int:
+    """Export one mart to marts/<table>/, replacing the previous export; returns the rows written."""
+    month_sql, order_by = MARTS[table]
+    target = marts_dir(archive_dir) / table
+    tmp_target = target.with_name(f".{table}.tmp")
+    shutil.rmtree(tmp_target, ignore_errors=True)
+    rows = 0
+
+    with engine.connect() as conn:
+        columns = mart_columns(conn, table)
+        if not columns:
+            logging.warning(f"Skipping {table}: not in the warehouse yet")
+            return 0
+        schema = pa.schema([pa.field(name, arrow_type) for name, arrow_type, _ in columns])
+        if month_sql:
+            schema = schema.append(pa.field("month", pa.string()))
+
+        def counted():
+            nonlocal rows
+            for batch in iter_mart_batches(conn, table, columns, month_sql, order_by):
+                rows += batch.num_rows
+                yield batch
+
+        ds.write_dataset(
+            counted(), tmp_target, schema=schema, format="parquet",
+            partitioning=ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive") if month_sql else None,
+            basename_template="part-{i}.parquet",
+            file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+            max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=min(ROW_GROUP_ROWS, FETCH_ROWS),
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        conn.rollback()  # ends the transaction the named cursor ran in
+
+    if not rows:
+        tmp_target.mkdir(parents=True, exist_ok=True)
+        pq.write_table(schema.empty_table(), tmp_target / "part-0.parquet")  # keep the schema queryable
+    # Swap in the new export so readers never see a half-written mart; the old name is unique, so
+    # an export left behind by an interrupted run can't block the rename
+    old = target.with_name(f".{table}.old-{uuid.uuid4().hex[:8]}")
+    if target.exists():
+        os.replace(target, old)
+    os.replace(tmp_target, target)
+    for stale in target.parent.glob(f".{table}.old*"):  # this run's, and any an earlier run left
+        shutil.rmtree(stale, ignore_errors=True)
+    ARCHIVED_ROWS.inc(rows, dataset=table)
+    logging.info(f"Archived {rows} rows of {table}")
+    return rows
+
+
+def archive_marts(engine, archive_dir: Path = None, tables=None) -> dict:
+    """Export every mart in MARTS (or `tables`); returns {table: rows}."""
+    return {table: archive_mart(engine, table, archive_dir) for table in (tables or MARTS)}
+
+
+def main(skip_raw: bool = False, skip_marts: bool = False, raw_dir: Path = RAW_DIR, archive_dir: Path = None,
+         workers: int = PARSE_WORKERS) -> dict:
+    summary = {}
+    if not skip_raw:
+        summary["messages"] = archive_raw(raw_dir, archive_dir, workers)
+    if not skip_marts:
+        summary["marts"] = archive_marts(get_engine(), archive_dir)
+    logging.info(f"Parquet archive updated in {archive_dir or ARCHIVE_DIR}: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Archive raw messages and marts as partitioned Parquet")
+    parser.add_argument("--skip-raw", action="store_true", help="don't archive new raw files")
+    parser.add_argument("--skip-marts", action="store_true", help="don't re-export the marts (no database needed)")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR, help="raw message directory")
+    parser.add_argument("--archive-dir", type=Path, default=ARCHIVE_DIR, help="archive root")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="processes used to parse raw files")
+    args = parser.parse_args()
+    with record_run("parquet_archive"):
+        main(args.skip_raw, args.skip_marts, args.raw_dir, args.archive_dir, args.workers)
@@ -0,0 +1,282 @@
+"""
+Product/drug mention extraction into fct_product_mentions.
+
+Runs after the loader. Every alias in the lexicon (product_lexicon.yml) is
+compiled into one Aho-Corasick automaton, so each message is scanned once in
+time linear in its length however many aliases there are. Messages are read
+from staging in batches, and each batch's mentions replace any earlier ones
+for the same messages. Only messages loaded since the previous run are
+scanned (plus a short lookback window, for loads that committed late), unless
+the lexicon changed, in which case everything is re-scanned.
+A full re-scan deletes the old mentions and writes the new ones in a single
+transaction, so readers keep seeing the previous mentions until it commits.
+Top-products queries then become indexed aggregates over fct_product_mentions
+instead of ILIKE scans over message_text.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+
+import yaml
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from src.scripts.data_version import bump_data_version
+from src.scripts.database import get_engine
+
+load_dotenv()
+
+LEXICON_PATH = Path(os.getenv("PRODUCT_LEXICON", Path(__file__).with_name("product_lexicon.yml")))
+BATCH_SIZE = int(os.getenv("MENTION_BATCH_SIZE", "5000"))  # messages scanned and written per transaction
+# Messages loaded this long before the watermark are scanned again: a load that committed after
+# the previous scan may carry a loaded_at older than what that scan saw
+WATERMARK_LOOKBACK = int(os.getenv("WATERMARK_LOOKBACK_SECONDS", "300"))
+
+MENTIONS_TABLE = "fct_product_mentions"
+STATE_TABLE = "product_mention_state"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(value: str) -> str:
+    """Case-fold and collapse whitespace, so aliases match however a message is spaced or capitalised."""
+    return _WHITESPACE.sub(" ", value.casefold()).strip()
+
+
+def load_lexicon(path: Path = LEXICON_PATH) -> dict:
+    """Read the lexicon file: {product: {"category": str, "aliases": [str, ...]}}."""
+    with open(path, encoding="utf-8") as f:
+        lexicon = yaml.safe_load(f) or {}
+    for product, entry in lexicon.items():
+        entry.setdefault("category", None)
+        entry["aliases"] = [str(alias) for alias in entry.get("aliases") or [product]]
+    return lexicon
+
+
+def lexicon_version(lexicon: dict) -> str:
+    """Stable hash of the lexicon contents; a new version triggers a full re-scan."""
+    return hashlib.sha256(json.dumps(lexicon, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher: finds every occurrence of every pattern in one pass over the text."""
+
+    def __init__(self, patterns: dict):
+        """`patterns` maps pattern string -> value reported for its matches."""
+        self._goto = [{}]    # state -> {char: next state}
+        self._fail = [0]     # state -> longest proper suffix state
+        self._output = [[]]  # state -> [(pattern length, value)] ending here
+        for pattern, value in patterns.items():
+            self._add(pattern, value)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, value):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((len(pattern), value))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter_matches(self, value: str):
+        """Yield (start, end, pattern value) for every match, including overlapping ones."""
+        state = 0
+        for index, char in enumerate(value):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, pattern_value in self._output[state]:
+                yield index + 1 - length, index + 1, pattern_value
+
+
+class ProductMatcher:
+    """Finds the lexicon products mentioned in a message, matching aliases on whole words."""
+
+    def __init__(self, lexicon: dict):
+        self.categories = {product: entry["category"] for product, entry in lexicon.items()}
+        aliases = {}
+        for product, entry in lexicon.items():
+            for alias in entry["aliases"]:
+                aliases[normalize(alias)] = product
+        self._automaton = AhoCorasick(aliases)
+
+    def find(self, message_text: str) -> list:
+        """Sorted unique products mentioned in one message."""
+        if not message_text:
+            return []
+        value = normalize(message_text)
+        found = set()
+        for start, end, product in self._automaton.iter_matches(value):
+            # Whole words only: "pill" must not match "pillow", nor "zinc" match "zincite"
+            if (start == 0 or not value[start - 1].isalnum()) and (end == len(value) or not value[end].isalnum()):
+                found.add(product)
+        return sorted(found)
+
+
+def ensure_tables(engine):
+    """Create the mentions fact table, its indexes and the extraction state table."""
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {MENTIONS_TABLE} (
+                channel_name TEXT NOT NULL,
+                message_id BIGINT NOT NULL,
+                product TEXT NOT NULL,
+                category TEXT,
+                date_key DATE,
+                PRIMARY KEY (channel_name, message_id, product)
+            )
+        """))
+        # Top-products style aggregates: overall, per day range, per channel
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {MENTIONS_TABLE}_product_idx ON {MENTIONS_TABLE} (product)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {MENTIONS_TABLE}_date_product_idx ON {MENTIONS_TABLE} (date_key, product)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {MENTIONS_TABLE}_channel_product_idx ON {MENTIONS_TABLE} (channel_name, product)"))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                lexicon_version TEXT PRIMARY KEY,
+                last_loaded_at TIMESTAMP,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.commit()
+
+
+def fetch_watermark(engine, version: str):
+    """loaded_at of the newest message scanned with this lexicon version (None: scan everything)."""
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(f"SELECT last_loaded_at FROM {STATE_TABLE} WHERE lexicon_version = :version"),
+            {"version": version},
+        ).fetchone()
+    return row.last_loaded_at if row else None
+
+
+def save_watermark(engine, version: str, last_loaded_at):
+    """Record the scan position; states for other lexicon versions are obsolete and dropped."""
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {STATE_TABLE} WHERE lexicon_version != :version"), {"version": version})
+        conn.execute(text(f"""
+            INSERT INTO {STATE_TABLE} (lexicon_version, last_loaded_at, updated_at)
+            VALUES (:version, :last_loaded_at, CURRENT_TIMESTAMP)
+            ON CONFLICT (lexicon_version) DO UPDATE SET
+                last_loaded_at = EXCLUDED.last_loaded_at,
+                updated_at = EXCLUDED.updated_at
+        """), {"version": version, "last_loaded_at": last_loaded_at})
+
+
+def iter_message_batches(engine, since=None, batch_size: int = BATCH_SIZE, lookback: int = WATERMARK_LOOKBACK):
+    """Stream staging messages loaded after `since` minus `lookback` seconds in lists of `batch_size` rows."""
+    query = text(f"""
+        SELECT channel_name, message_id, (message_date::TIMESTAMP)::DATE AS date_key, message_text, loaded_at
+        FROM staging_telegram_messages
+        {"WHERE loaded_at > CAST(:since AS TIMESTAMP) - make_interval(secs => :lookback)" if since is not None else ""}
+        ORDER BY loaded_at
+    """)
+    with engine.connect().execution_options(stream_results=True, yield_per=batch_size) as conn:
+        result = conn.execute(query, {"since": since, "lookback": lookback} if since is not None else {})
+        for partition in result.partitions():
+            yield partition
+
+
+def extract_batch(matcher: ProductMatcher, messages) -> list:
+    """Mention rows for a batch of staging rows."""
+    return [
+        {
+            "channel_name": message.channel_name,
+            "message_id": int(message.message_id),
+            "product": product,
+            "category": matcher.categories[product],
+            "date_key": message.date_key.isoformat() if message.date_key else None,
+        }
+        for message in messages
+        for product in matcher.find(message.message_text)
+    ]
+
+
+def write_mentions(conn, messages, mentions) -> bool:
+    """Replace the mentions of a batch of messages (re-scans are idempotent); True if they changed."""
+    keys = [{"channel_name": m.channel_name, "message_id": int(m.message_id)} for m in messages]
+    deleted = conn.execute(text(f"""
+        DELETE FROM {MENTIONS_TABLE} p
+        USING jsonb_to_recordset(CAST(:keys AS JSONB)) AS k(channel_name TEXT, message_id BIGINT)
+        WHERE p.channel_name = k.channel_name AND p.message_id = k.message_id
+        RETURNING p.channel_name, p.message_id, p.product, p.category, p.date_key
+    """), {"keys": json.dumps(keys)}).fetchall()
+    if mentions:
+        conn.execute(text(f"""
+            INSERT INTO {MENTIONS_TABLE} (channel_name, message_id, product, category, date_key)
+            SELECT channel_name, message_id, product, category, date_key
+            FROM jsonb_to_recordset(CAST(:rows AS JSONB))
+                 AS t(channel_name TEXT, message_id BIGINT, product TEXT, category TEXT, date_key DATE)
+        """), {"rows": json.dumps(mentions, ensure_ascii=False)})
+    old = {(r.channel_name, r.message_id, r.product, r.category, r.date_key.isoformat() if r.date_key else None)
+           for r in deleted}
+    return old != {tuple(m.values()) for m in mentions}
+
+
+def main(full: bool = False, batch_size: int = BATCH_SIZE):
+    engine = get_engine()
+    ensure_tables(engine)
+    lexicon = load_lexicon()
+    version = lexicon_version(lexicon)
+    matcher = ProductMatcher(lexicon)
+
+    since = None if full else fetch_watermark(engine, version)
+    if since is None:
+        logging.info(f"Full scan with lexicon {version} ({len(lexicon)} products)")
+    else:
+        logging.info(f"Scanning messages loaded after {since} with lexicon {version}")
+
+    scanned = found = 0
+    changed = since is None
+    last_loaded_at = since
+    # New lexicon (or --full): mentions from the old one are stale. They are replaced in one transaction
+    # (DELETE, not TRUNCATE, which would lock readers out) so the table is never empty to readers.
+    with engine.begin() if since is None else nullcontext() as rescan:
+        if rescan is not None:
+            rescan.execute(text(f"DELETE FROM {MENTIONS_TABLE}"))
+        for messages in iter_message_batches(engine, since, batch_size):
+            mentions = extract_batch(matcher, messages)
+            with nullcontext(rescan) if rescan is not None else engine.begin() as conn:
+                changed |= write_mentions(conn, messages, mentions)
+            scanned += len(messages)
+            found += len(mentions)
+            last_loaded_at = messages[-1].loaded_at  # batches arrive in loaded_at order
+            logging.info(f"Scanned {scanned} messages, {found} product mentions")
+
+    # Saved only at the end: a crash mid-run re-scans from the old watermark, which is harmless
+    save_watermark(engine, version, last_loaded_at)
+    if changed:  # the lookback re-scans some messages on every run; that alone changes nothing
+        bump_data_version(engine, "product_mentions")
+    logging.info(f"Product mention extraction complete: {found} mentions in {scanned} messages.")
+    return scanned
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Extract product/drug mentions into fct_product_mentions")
+    parser.add_argument("--full", action="store_true", help="re-scan every message, not just newly loaded ones")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="messages per batch")
+    args = parser.parse_args()
+    main(full=args.full, batch_size=args.batch_size)
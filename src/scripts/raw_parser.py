@@ -0,0 +1,194 @@
+"""
+Parallel parsing of raw Telegram files into Arrow record batches.
+
+The file list is split into shards of roughly equal size; each shard is parsed
+in a worker process (orjson is used when installed, json otherwise) into one
+typed record batch, so the loader never holds a list of Python dicts for the
+whole corpus. Throughput is logged per shard.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+
+from src.scripts.instrumentation import counter, histogram
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    JSON_DECODE_ERRORS = (orjson.JSONDecodeError, ValueError)
+except ImportError:  # orjson is optional; fall back to the standard library
+    _loads = json.loads
+    JSON_DECODE_ERRORS = (json.JSONDecodeError,)
+
+RAW_SCHEMA = pa.schema([
+    ("message_id", pa.int64()),
+    ("channel_name", pa.string()),
+    ("message_date", pa.timestamp("us", tz="UTC")),
+    ("message_text", pa.string()),
+    ("has_media", pa.bool_()),
+    ("image_path", pa.string()),
+    ("views", pa.int64()),
+    ("forwards", pa.int64()),
+])
+
+SHARD_BYTES = int(os.getenv("LOADER_SHARD_BYTES", str(64 * 1024 * 1024)))
+
+SHARD_SECONDS = histogram("parse_shard_seconds", "Time to read and parse one shard of raw files")
+PARSED_ROWS = counter("parse_rows_total", "Messages parsed from raw files")
+PARSED_BYTES = counter("parse_bytes_total", "Raw file bytes parsed")
+FAILED_FILES = counter("parse_failed_files_total", "Raw files that could not be read")
+
+
+def read_raw_file(file_path: Path):
+    """Return the message records in one raw file (one for a message_*.json, many for a segment)."""
+    data = Path(file_path).read_bytes()
+    if Path(file_path).suffix == ".json":
+        return [_loads(data)]
+
+    records = []
+    for line_no, line in enumerate(data.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            records.append(_loads(line))
+        except JSON_DECODE_ERRORS as e:
+            logging.error(f"Invalid JSON in {file_path} line {line_no}: {e}")
+    return records
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def records_to_batch(records) -> pa.RecordBatch:
+    """Convert message records into one typed record batch with RAW_SCHEMA."""
+    columns = {name: [] for name in RAW_SCHEMA.names}
+    for record in records:
+        for name in RAW_SCHEMA.names:
+            columns[name].append(record.get(name))
+    columns["message_date"] = [_parse_date(value) for value in columns["message_date"]]
+    return pa.RecordBatch.from_pydict(columns, schema=RAW_SCHEMA)
+
+
+def parse_shard(file_paths):
+    """Worker entry point: parse a shard of raw files into (record batch, stats).
+
+    Files that cannot be read, or whose values do not fit RAW_SCHEMA (e.g. views "1.2K"),
+    are listed in stats["failed"] and left out of the batch.
+    """
+    started = time.perf_counter()
+    parsed, size, failed = [], 0, []
+    for file_path in file_paths:
+        try:
+            parsed.append((file_path, read_raw_file(file_path)))
+            size += os.path.getsize(file_path)
+        except Exception as e:
+            failed.append(file_path)
+            logging.error(f"Error reading {file_path}: {e}")
+    try:
+        batch = records_to_batch([record for _, records in parsed for record in records])
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Rare: find the offending files one by one, keep the rest of the shard
+        good = []
+        for file_path, records in parsed:
+            try:
+                records_to_batch(records)
+                good.extend(records)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                failed.append(file_path)
+                logging.error(f"Error converting {file_path}: {e}")
+        batch = records_to_batch(good)
+    stats = {
+        "files": len(file_paths),
+        "rows": batch.num_rows,
+        "bytes": size,
+        "failed": failed,
+        "seconds": time.perf_counter() - started,
+    }
+    return batch, stats
+
+
+def plan_shards(entries, shard_bytes: int = SHARD_BYTES):
+    """Group manifest entries (dicts with file_path and size_bytes) into shards of about `shard_bytes`."""
+    shards, current, current_bytes = [], [], 0
+    for entry in entries:
+        current.append(entry)
+        current_bytes += entry.get("size_bytes") or 0
+        if current_bytes >= shard_bytes:
+            shards.append(current)
+            current, current_bytes = [], 0
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _log_shard(index: int, stats: dict):
+    seconds = max(stats["seconds"], 1e-9)
+    logging.info(
+        f"Shard {index}: {stats['rows']} rows from {stats['files']} files in {stats['seconds']:.2f}s "
+        f"({stats['rows'] / seconds:,.0f} rows/s, {stats['bytes'] / seconds / 1e6:.1f} MB/s)"
+    )
+
+
+def iter_parsed_shards(entries, workers: int = None, shard_bytes: int = SHARD_BYTES):
+    """Parse entries shard by shard, yielding (record batch, shard entries, stats) in input order.
+
+    The yielded shard entries leave out files that failed to read, so callers never mark
+    them as loaded and the next run retries them.
+
+    With more than one worker, shards are parsed in a process pool with at most two shards
+    in flight per worker, which keeps memory bounded regardless of corpus size.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = plan_shards(entries, shard_bytes)
+    totals = {"rows": 0, "bytes": 0}
+    started = time.perf_counter()
+
+    def _results():
+        if workers <= 1:
+            for shard in shards:
+                yield shard, parse_shard([entry["file_path"] for entry in shard])
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for shard in shards:
+                pending.append((shard, executor.submit(parse_shard, [entry["file_path"] for entry in shard])))
+                if len(pending) >= workers * 2:
+                    done_shard, future = pending.popleft()
+                    yield done_shard, future.result()
+            while pending:
+                done_shard, future = pending.popleft()
+                yield done_shard, future.result()
+
+    for index, (shard, (batch, stats)) in enumerate(_results()):
+        _log_shard(index, stats)
+        # Recorded here rather than in parse_shard, which may run in a worker process
+        SHARD_SECONDS.observe(stats["seconds"])
+        PARSED_ROWS.inc(stats["rows"])
+        PARSED_BYTES.inc(stats["bytes"])
+        if stats["failed"]:
+            FAILED_FILES.inc(len(stats["failed"]))
+        for key in totals:
+            totals[key] += stats[key]
+        yield batch, [entry for entry in shard if entry["file_path"] not in stats["failed"]], stats
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    logging.info(
+        f"Parsed {totals['rows']} rows ({totals['bytes'] / 1e6:.1f} MB) in {len(shards)} shards "
+        f"with {workers} workers: {totals['rows'] / elapsed:,.0f} rows/s wall clock"
+    )
@@ -0,0 +1,158 @@
+"""
+Append-only raw message sink.
+
+Instead of one pretty-printed JSON file per message, messages are appended as
+compact newline-delimited JSON to one open segment per partition, keeping the
+existing layout:
+
+    data/raw/telegram_messages/<date>/<channel>/segment_<opened>_<id>.jsonl
+
+<opened> is the opening time to the nanosecond, strictly increasing within a
+process, so a partition's segments sort in the order they were written. The
+loader and the archive rely on that order to let the latest copy of a
+message win.
+
+A segment is written as `<name>.jsonl.open` and atomically renamed to `.jsonl`
+when it rolls (size or age limit) or the sink closes, so readers only ever
+see complete segments. An `on_seal` callback hears about every sealed
+segment's partition, so a downstream stage can load it right away.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+RAW_DIR = Path("data/raw/telegram_messages")
+OPEN_SUFFIX = ".open"
+
+_opened_lock = threading.Lock()
+_last_opened_ns = 0
+
+
+def segment_timestamp() -> str:
+    """UTC time as YYYYMMDDTHHMMSS plus nine digits of nanoseconds; never repeats or goes back in a process."""
+    global _last_opened_ns
+    with _opened_lock:
+        _last_opened_ns = max(time.time_ns(), _last_opened_ns + 1)
+        now_ns = _last_opened_ns
+    seconds, nanos = divmod(now_ns, 1_000_000_000)
+    return f"{datetime.fromtimestamp(seconds, timezone.utc):%Y%m%dT%H%M%S}{nanos:09d}"
+
+
+class RawSink:
+    """Batches raw message records into rolling NDJSON segments per date/channel partition."""
+
+    def __init__(
+        self,
+        raw_dir: Path = RAW_DIR,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_age: float = 300.0,
+        max_open: int = 64,
+        on_seal=None,
+    ):
+        self.raw_dir = raw_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_open = max_open
+        self.on_seal = on_seal  # called with (date, channel) after each segment is sealed
+        self.segments_written = 0
+        self._open = OrderedDict()  # (date, channel) -> segment state, least recently used first
+        self._last_sweep = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record: dict):
+        """Append one message record to its partition's current segment."""
+        key = (record["message_date"][:10], record["channel_name"])
+        segment = self._open.get(key)
+        if segment is None:
+            segment = self._open_segment(key)
+        self._open.move_to_end(key)
+
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        segment["file"].write(line)
+        segment["bytes"] += len(line.encode("utf-8"))
+
+        if segment["bytes"] >= self.max_bytes:
+            self._roll(key)
+        if time.monotonic() - self._last_sweep >= 1.0:
+            self._roll_expired()
+
+    def flush(self):
+        """Push buffered records to disk, e.g. before a checkpoint that covers them is saved."""
+        for segment in self._open.values():
+            segment["file"].flush()
+            os.fsync(segment["file"].fileno())
+
+    def close(self):
+        """Seal every open segment."""
+        for key in list(self._open):
+            self._roll(key)
+        logging.info(f"Raw sink closed: {self.segments_written} segments written")
+
+    def seal(self, channel_name: str):
+        """Seal the open segments of one channel, e.g. as soon as its scrape finishes."""
+        for key in [k for k in self._open if k[1] == channel_name]:
+            self._roll(key)
+
+    def _open_segment(self, key):
+        if len(self._open) >= self.max_open:
+            self._roll(next(iter(self._open)))  # least recently written partition
+
+        date_str, channel_name = key
+        partition_dir = self.raw_dir / date_str / channel_name
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        final_path = partition_dir / f"segment_{segment_timestamp()}_{uuid.uuid4().hex[:8]}.jsonl"
+        open_path = final_path.with_name(final_path.name + OPEN_SUFFIX)
+
+        segment = {
+            "file": open(open_path, "w", encoding="utf-8"),
+            "open_path": open_path,
+            "final_path": final_path,
+            "bytes": 0,
+            "opened_at": time.monotonic(),
+        }
+        self._open[key] = segment
+        return segment
+
+    def _roll(self, key):
+        segment = self._open.pop(key)
+        segment["file"].flush()
+        os.fsync(segment["file"].fileno())
+        segment["file"].close()
+        os.replace(segment["open_path"], segment["final_path"])
+        self.segments_written += 1
+        logging.info(f"Sealed raw segment {segment['final_path']} ({segment['bytes']} bytes)")
+        if self.on_seal is not None:
+            self.on_seal(key)
+
+    def _roll_expired(self):
+        now = time.monotonic()
+        self._last_sweep = now
+        for key in [k for k, s in self._open.items() if now - s["opened_at"] >= self.max_age]:
+            self._roll(key)
+
+
+def recover_open_segments(raw_dir: Path = RAW_DIR) -> int:
+    """Seal segments left open by a crashed run, dropping a trailing partial line."""
+    recovered = 0
+    for open_path in raw_dir.rglob(f"*.jsonl{OPEN_SUFFIX}"):
+        data = open_path.read_bytes()
+        if data and not data.endswith(b"\n"):
+            data = data[: data.rfind(b"\n") + 1]
+            open_path.write_bytes(data)
+        os.replace(open_path, open_path.with_name(open_path.name[: -len(OPEN_SUFFIX)]))
+        recovered += 1
+    if recovered:
+        logging.warning(f"Recovered {recovered} raw segments left open by a previous run")
+    return recovered
@@ -0,0 +1,81 @@
+"""
+Concurrent channel scheduler for the Telegram scraper.
+
+Runs several channel scrapes at once under a concurrency limit and a shared
+request budget. A channel that hits a flood wait is parked on its own and
+resumed from its saved progress, while the other channels keep going.
+"""
+
+import asyncio
+import logging
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by every channel: `rate` requests/second, bursts up to `burst`."""
+
+    def __init__(self, rate: float = 1.0, burst: int = 5):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until one request token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChannelScheduler:
+    """Scrape many channels concurrently, parking only the ones that are flood-limited.
+
+    `scrape` is a coroutine function called as `scrape(channel, progress)`. It must keep
+    `progress` (a dict owned by the scheduler) up to date so that a retry after a flood
+    wait continues where the previous attempt stopped.
+    """
+
+    def __init__(self, scrape, concurrency: int = 4, flood_errors=(), max_flood_retries: int = 5):
+        self.scrape = scrape
+        self.concurrency = concurrency
+        self.flood_errors = tuple(flood_errors)
+        self.max_flood_retries = max_flood_retries
+        self._semaphore = None
+
+    async def _run_channel(self, channel: str):
+        progress = {}
+        for attempt in range(self.max_flood_retries + 1):
+            async with self._semaphore:
+                try:
+                    await self.scrape(channel, progress)
+                    return progress
+                except self.flood_errors as e:
+                    wait = getattr(e, "seconds", 0)
+            if attempt == self.max_flood_retries:
+                break
+            # Sleep outside the semaphore so the slot goes to another channel
+            logging.warning(f"Parking @{channel} for {wait}s after flood wait (attempt {attempt + 1})")
+            await asyncio.sleep(wait)
+        logging.error(f"Giving up on @{channel} after {self.max_flood_retries} flood waits")
+        return progress
+
+    async def run(self, channels):
+        """Scrape all channels and return {channel: progress}."""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._run_channel(channel) for channel in channels), return_exceptions=True
+        )
+        progress_by_channel = {}
+        for channel, result in zip(channels, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Failed processing channel {channel}: {result}")
+                result = {}
+            progress_by_channel[channel] = result
+        return progress_by_channel
@@ -1,5 +1,6 @@
 import asyncio
 import json
+from contextlib import nullcontext
 import os
 from datetime import datetime
 from pathlib import Path
@@ -8,15 +9,21 @@ from dotenv import load_dotenv
 from telethon import TelegramClient
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 from telethon.errors import FloodWaitError, ChannelPrivateError
+import argparse
 import aiofiles
 
+from src.scripts.downloads import DownloadPool, fetch_image, finish_failed_downloads, load_failed_downloads
+from src.scripts.instrumentation import REGISTRY, counter, histogram, record_run, timer
+from src.scripts.raw_sink import RawSink, recover_open_segments
+from src.scripts.checkpoints import load_checkpoint, save_checkpoint
+from src.scripts.scheduler import ChannelScheduler, RateLimiter
+
 # Load environment variables
 load_dotenv()
 
-# Telegram API credentials from .env
-API_ID = int(os.getenv("TELEGRAM_API_ID"))
-API_HASH = os.getenv("TELEGRAM_API_HASH")
+# Telegram API credentials from .env (read when the client is created, not at import)
 PHONE = os.getenv("TELEGRAM_PHONE")
+SESSION_NAME = "scraper_session"
 
 # List of channels to scrape (without the @ prefix)
 CHANNELS = [
@@ -28,31 +35,70 @@ CHANNELS = [
     # Add more from Telegram search or et.tgstat.com/medicine if needed
 ]
 
+# Concurrency and shared request budget (all channels together)
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "4"))
+REQUESTS_PER_SECOND = float(os.getenv("SCRAPER_REQUESTS_PER_SECOND", "1.0"))
+REQUEST_BURST = int(os.getenv("SCRAPER_REQUEST_BURST", "5"))
+MAX_FLOOD_RETRIES = int(os.getenv("SCRAPER_MAX_FLOOD_RETRIES", "5"))
+PAGE_SIZE = 100  # messages per get_messages request
+DOWNLOAD_WORKERS = int(os.getenv("SCRAPER_DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("SCRAPER_DOWNLOAD_QUEUE_SIZE", "200"))  # backpressure on message iteration
+DOWNLOAD_RETRIES = int(os.getenv("SCRAPER_DOWNLOAD_RETRIES", "3"))
+DOWNLOADS_PER_SECOND = float(os.getenv("SCRAPER_DOWNLOADS_PER_SECOND", "10"))  # separate budget for media fetches
+SEGMENT_MAX_BYTES = int(os.getenv("SCRAPER_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024)))  # roll raw segments by size...
+SEGMENT_MAX_AGE = float(os.getenv("SCRAPER_SEGMENT_MAX_AGE", "300"))  # ...or by age in seconds
+BACKFILL_PAGES = int(os.getenv("SCRAPER_BACKFILL_PAGES", "10"))  # pages per channel per backfill run
+DAEMON_INTERVAL = float(os.getenv("SCRAPER_DAEMON_INTERVAL", "900"))  # seconds between passes in --daemon mode
+
 # Directories
 RAW_DIR = Path("data/raw/telegram_messages")
 IMAGES_DIR = Path("data/raw/images")
 LOGS_DIR = Path("logs")
-LOGS_DIR.mkdir(exist_ok=True)
 
-# Logging setup
-logging.basicConfig(
-    filename=LOGS_DIR / "scraper.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+def setup_logging(logs_dir: Path = LOGS_DIR):
+    """Log to logs/scraper.log (called by the CLI, not on import)."""
+    logs_dir.mkdir(exist_ok=True)
+    logging.basicConfig(
+        filename=logs_dir / "scraper.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+SAVED_MESSAGES = counter("scraper_messages_total", "Messages saved, by channel")
+PAGE_SECONDS = histogram("scraper_page_seconds", "get_messages latency per page of history")
+MESSAGE_SECONDS = histogram("scraper_message_seconds", "Time to save one message, including queueing its image")
+FLOOD_WAITS = counter("scraper_flood_waits_total", "FloodWaitErrors raised to the scheduler, by channel")
+
+# Telegram client used by every scrape function; main() sets it, to the Telethon client or to
+# anything with the same calls (src/scripts/fake_telegram.py replays channels offline)
+client = None
 
-# Telethon client
-client = TelegramClient("scraper_session", API_ID, API_HASH)
+def create_client(session: str = SESSION_NAME):
+    """The Telethon client, from TELEGRAM_API_ID / TELEGRAM_API_HASH in .env."""
+    api_id, api_hash = os.getenv("TELEGRAM_API_ID"), os.getenv("TELEGRAM_API_HASH")
+    if not api_id or not api_hash:
+        raise RuntimeError("TELEGRAM_API_ID and TELEGRAM_API_HASH must be set in .env to scrape Telegram")
+    # flood_sleep_threshold=0: every flood wait goes to the scheduler, which parks only the
+    # affected channel instead of blocking inside the call
+    return TelegramClient(session, int(api_id), api_hash, flood_sleep_threshold=0)
 
-async def download_image(message, channel_name: str, message_date: datetime):
-    """Download image if present and return path."""
+async def throttle(rate_limiter):
+    """Take a token from the shared request budget, if one is in use."""
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+
+async def download_image(message, channel_name: str, message_date: datetime, rate_limiter=None, downloads=None,
+                         on_done=None):
+    """Return the image path for a message with image media, fetching it if needed.
+
+    With a download pool the fetch is queued and the path returned straight away, so text
+    ingestion never waits on media; `on_done` hears whether the queued download succeeded.
+    Without a pool the image is downloaded inline and None is returned if that fails.
+    """
     if not message.media:
         return None
 
-    img_dir = IMAGES_DIR / channel_name
-    img_dir.mkdir(parents=True, exist_ok=True)
-
     file_ext = ".jpg"
     if isinstance(message.media, MessageMediaPhoto):
         file_ext = ".jpg"
@@ -62,88 +108,321 @@ async def download_image(message, channel_name: str, message_date: datetime):
         return None  # Skip non-image media
 
     filename = f"{message.id}_{message_date.strftime('%Y%m%d_%H%M%S')}{file_ext}"
-    filepath = img_dir / filename
+    filepath = IMAGES_DIR / channel_name / filename
 
     if filepath.exists():
         logging.info(f"Image already downloaded: {filepath}")
         return str(filepath)
 
+    if downloads is not None:
+        await downloads.submit(channel_name, message, filepath, on_done=on_done)
+        return str(filepath)
+
     try:
-        await message.download_media(file=str(filepath))
+        await throttle(rate_limiter)
+        await fetch_image(message, filepath, IMAGES_DIR)
         logging.info(f"Downloaded image: {filepath}")
         return str(filepath)
+    except FloodWaitError:
+        raise  # let the scheduler park the channel
     except Exception as e:
         logging.error(f"Image download failed for msg {message.id} in {channel_name}: {e}")
         return None
 
-async def scrape_channel(channel_username: str, limit: int = 100):
-    """Scrape messages from one channel."""
-    try:
-        entity = await client.get_entity(channel_username)
-        channel_name = (entity.username or entity.title).replace(" ", "_").lower()
+def message_record(message, channel_name: str, image_path) -> dict:
+    """The raw record of one message."""
+    return {
+        "message_id": message.id,
+        "channel_name": channel_name,
+        "message_date": message.date.isoformat(),
+        "message_text": message.message,
+        "has_media": message.media is not None,
+        "image_path": image_path,
+        "views": message.views or 0,
+        "forwards": message.forwards or 0,
+    }
+
+def write_correction(data: dict, sink=None):
+    """Record a message again after its image_path changed; the loader keeps the latest copy."""
+    if sink is not None:
+        sink.write(data)
+        return
+    json_path = RAW_DIR / data["message_date"][:10] / data["channel_name"] / f"message_{data['message_id']}.json"
+    json_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+async def retry_failed_downloads(downloads, rate_limiter=None, sink=None):
+    """Re-queue image downloads that failed in earlier runs; a message whose image arrives is re-recorded with its path."""
+    jobs_by_channel = {}
+    for job in load_failed_downloads():
+        jobs_by_channel.setdefault(job["channel"], []).append(job)
+
+    for channel, jobs in jobs_by_channel.items():
+        try:
+            await throttle(rate_limiter)
+            entity = await client.get_entity(channel)
+            await throttle(rate_limiter)
+            messages = await client.get_messages(entity, ids=[job["message_id"] for job in jobs])
+        except Exception as e:
+            logging.error(f"Could not re-fetch failed downloads for {channel}: {e}")
+            for job in jobs:
+                downloads.mark_failed(channel, job["message_id"], Path(job["target"]), e)
+            continue
+        for job, message in zip(jobs, messages):
+            if message is None or not message.media:
+                logging.warning(f"Dropping failed download for msg {job['message_id']} in {channel}: media gone")
+                continue
+            def restore_path(ok, message=message, target=job["target"]):
+                if ok:
+                    write_correction(message_record(message, channel, target), sink)
+
+            await downloads.submit(channel, message, Path(job["target"]), on_done=restore_path)
+        logging.info(f"Re-queued {len(jobs)} failed image downloads for {channel}")
+
+async def save_message(message, channel_name: str, rate_limiter=None, downloads=None, sink=None):
+    """Record the message (in the raw sink, or as its own JSON file without one), fetching or queueing its image."""
+    msg_date = message.date
+
+    def drop_path(ok):
+        if not ok:  # the queued download gave up: don't point at a file that isn't there
+            write_correction(message_record(message, channel_name, None), sink)
+
+    image_path = await download_image(message, channel_name, msg_date, rate_limiter, downloads, on_done=drop_path)
+    data = message_record(message, channel_name, image_path)
+
+    if sink is not None:
+        sink.write(data)
+        return data
 
-        logging.info(f"Starting scrape for @{channel_username} (display name: {channel_name})")
+    # Legacy layout: one JSON file per message
+    partition_dir = RAW_DIR / msg_date.strftime("%Y-%m-%d") / channel_name
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    json_path = partition_dir / f"message_{message.id}.json"
+    async with aiofiles.open(json_path, "w", encoding="utf-8") as f:
+        await f.write(json.dumps(data, ensure_ascii=False))
 
-        messages_data = []
+    return data
 
-        async for message in client.iter_messages(entity, limit=limit):
-            if message.message is None:
-                continue  # Skip empty messages
+async def walk_history(entity, channel_name: str, progress: dict, rate_limiter=None, downloads=None, sink=None, min_id: int = 0, max_messages: int = None):
+    """Page backwards from `progress["offset_id"]` (0 = newest), saving every message above `min_id`.
 
-            msg_date = message.date
-            date_str = msg_date.strftime("%Y-%m-%d")
-            partition_dir = RAW_DIR / date_str / channel_name
-            partition_dir.mkdir(parents=True, exist_ok=True)
+    Updates `progress` after each message so a retry never skips or repeats work, and returns
+    True when the walk reached `min_id` or the start of the channel (rather than `max_messages`).
+    """
+    messages_data = progress.setdefault("messages", [])
+    progress.setdefault("fetched", 0)
+    while max_messages is None or progress["fetched"] < max_messages:
+        batch_size = PAGE_SIZE if max_messages is None else min(PAGE_SIZE, max_messages - progress["fetched"])
+        await throttle(rate_limiter)
+        with timer(PAGE_SECONDS):
+            page = await client.get_messages(
+                entity, limit=batch_size, offset_id=progress.get("offset_id", 0), min_id=min_id
+            )
+        for message in page:
+            if message.message is not None:  # Skip empty messages
+                with timer(MESSAGE_SECONDS):
+                    messages_data.append(await save_message(message, channel_name, rate_limiter, downloads, sink))
+                SAVED_MESSAGES.inc(channel=channel_name)
+                logging.info(f"Saved message {message.id} from {channel_name}")
 
-            image_path = await download_image(message, channel_name, msg_date)
+            # Only advance once the message is fully handled, so a resume never skips it
+            progress["max_id"] = max(progress.get("max_id", 0), message.id)
+            progress["offset_id"] = message.id
+            progress["fetched"] += 1
 
-            data = {
-                "message_id": message.id,
-                "channel_name": channel_name,
-                "message_date": msg_date.isoformat(),
-                "message_text": message.message,
-                "has_media": message.media is not None,
-                "image_path": image_path,
-                "views": message.views or 0,
-                "forwards": message.forwards or 0,
-            }
+        if len(page) < batch_size:
+            return True
+    return False
+
+def channel_name_of(entity) -> str:
+    """Normalised channel name used in raw records and partition paths."""
+    return (entity.username or entity.title).replace(" ", "_").lower()
+
+async def resolve_channel(channel_username: str, progress: dict, rate_limiter=None):
+    """Resolve (once per progress dict) the channel entity and its normalised name."""
+    if "entity" not in progress:
+        await throttle(rate_limiter)
+        progress["entity"] = await client.get_entity(channel_username)
+    entity = progress["entity"]
+    return entity, channel_name_of(entity)
+
+async def scrape_channel(channel_username: str, limit: int = 100, progress: dict = None, rate_limiter=None, downloads=None, sink=None):
+    """Scrape messages newer than the channel's checkpoint.
+
+    A channel without a checkpoint gets its latest `limit` messages; after that only messages
+    above `last_message_id` are fetched. The checkpoint is saved only once the whole new range
+    is stored, so an interrupted run never leaves a gap below the high-water mark.
+
+    `progress` holds the resolved entity, the last processed message id and the messages
+    collected so far; on FloodWaitError it is left intact and the error is re-raised, so
+    calling again with the same dict resumes where the previous attempt stopped.
+    """
+    progress = {} if progress is None else progress
+    messages_data = progress.setdefault("messages", [])
+    try:
+        checkpoint = progress.setdefault("checkpoint", load_checkpoint(channel_username))
+        entity, channel_name = await resolve_channel(channel_username, progress, rate_limiter)
+        last_message_id = checkpoint.get("last_message_id", 0)
 
-            messages_data.append(data)
+        if progress.get("offset_id"):
+            logging.info(f"Resuming scrape for @{channel_username} below message {progress['offset_id']}")
+        else:
+            logging.info(f"Starting scrape for @{channel_username} (display name: {channel_name}) above message {last_message_id}")
 
-            # Save each message as individual JSON (easy for partitioning & idempotency)
-            json_path = partition_dir / f"message_{message.id}.json"
-            async with aiofiles.open(json_path, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        reached_end = await walk_history(
+            entity, channel_name, progress, rate_limiter, downloads, sink,
+            min_id=last_message_id,
+            max_messages=None if last_message_id else limit,
+        )
 
-            logging.info(f"Saved message {message.id} from @{channel_username}")
+        checkpoint["last_message_id"] = max(last_message_id, progress.get("max_id", 0))
+        if not last_message_id:
+            # First scrape of this channel: backfill continues below the oldest message we got
+            checkpoint["backfill_cursor"] = progress.get("offset_id")
+            checkpoint["backfill_complete"] = reached_end
+        if sink is not None:
+            sink.flush()  # the checkpoint must never get ahead of the raw data
+        save_checkpoint(channel_username, checkpoint)
 
         logging.info(f"Finished scraping @{channel_username} - {len(messages_data)} messages collected")
-        return messages_data
 
+    except FloodWaitError as e:
+        FLOOD_WAITS.inc(channel=channel_username)
+        logging.warning(f"Flood wait for @{channel_username}: {e.seconds} seconds")
+        raise
     except ChannelPrivateError:
         logging.error(f"Channel @{channel_username} is private or inaccessible")
-    except FloodWaitError as e:
-        logging.warning(f"Flood wait for @{channel_username}: sleeping {e.seconds} seconds")
-        await asyncio.sleep(e.seconds)
     except Exception as e:
         logging.error(f"Error scraping @{channel_username}: {e}")
-    return []
+    return messages_data
+
+async def backfill_channel(channel_username: str, pages: int = BACKFILL_PAGES, progress: dict = None, rate_limiter=None, downloads=None, sink=None):
+    """Walk older history below the channel's backfill cursor, at most `pages` pages per run."""
+    progress = {} if progress is None else progress
+    messages_data = progress.setdefault("messages", [])
+    try:
+        checkpoint = progress.setdefault("checkpoint", load_checkpoint(channel_username))
+        if checkpoint.get("backfill_complete"):
+            logging.info(f"Backfill already complete for @{channel_username}")
+            return messages_data
+
+        entity, channel_name = await resolve_channel(channel_username, progress, rate_limiter)
+        progress.setdefault("offset_id", checkpoint.get("backfill_cursor") or 0)
+        logging.info(f"Backfilling @{channel_username} below message {progress['offset_id'] or 'latest'}")
+
+        reached_end = await walk_history(
+            entity, channel_name, progress, rate_limiter, downloads, sink, max_messages=pages * PAGE_SIZE
+        )
+
+        checkpoint["backfill_cursor"] = progress.get("offset_id") or None
+        checkpoint["backfill_complete"] = reached_end
+        if not checkpoint.get("last_message_id"):
+            checkpoint["last_message_id"] = progress.get("max_id", 0)
+        if sink is not None:
+            sink.flush()  # the checkpoint must never get ahead of the raw data
+        save_checkpoint(channel_username, checkpoint)
+
+        logging.info(f"Backfilled @{channel_username} - {len(messages_data)} messages collected")
+
+    except FloodWaitError as e:
+        FLOOD_WAITS.inc(channel=channel_username)
+        logging.warning(f"Flood wait for @{channel_username}: {e.seconds} seconds")
+        raise
+    except ChannelPrivateError:
+        logging.error(f"Channel @{channel_username} is private or inaccessible")
+    except Exception as e:
+        logging.error(f"Error backfilling @{channel_username}: {e}")
+    return messages_data
 
-async def main():
+async def main(backfill: bool = False, pages: int = BACKFILL_PAGES, limit: int = 100, channels=None, telegram=None,
+               interval: float = None, passes: int = None, on_seal=None, on_downloaded=None):
+    """Scrape `channels` (default CHANNELS) through `telegram`, or the Telethon client if None.
+
+    With `interval` (daemon mode) the client, download pool and request budget stay up and the
+    channels are scraped again every `interval` seconds, `passes` times or until interrupted.
+    Each pass seals its raw segments for the loader and writes its own run record.
+
+    A channel's segments are sealed as soon as its scrape finishes; `on_seal` is called with
+    the (date, channel) partition of every sealed segment (see src/scripts/orchestrator.py).
+    Image downloads may still be queued then; `on_downloaded` is called at the end of each pass,
+    once its downloads have finished, with the partitions sealed during that pass.
+    """
+    global client
+    client = telegram if telegram is not None else create_client()
     await client.start(phone=PHONE)
     logging.info("Telegram client started successfully")
 
-    all_data = []
-    for channel in CHANNELS:
-        try:
-            channel_data = await scrape_channel(channel, limit=100)  # Increase to 500/None for more data
-            all_data.extend(channel_data)
-            await asyncio.sleep(15)  # Pause between channels to reduce flood risk
-        except Exception as e:
-            logging.error(f"Failed processing channel {channel}: {e}")
+    rate_limiter = RateLimiter(rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST)
+
+    recover_open_segments(RAW_DIR)
+    sealed = {}  # partitions sealed this pass, in order
+
+    def seal_callback(key):
+        sealed[key] = None
+        if on_seal is not None:
+            on_seal(key)
+
+    sink = RawSink(RAW_DIR, max_bytes=SEGMENT_MAX_BYTES, max_age=SEGMENT_MAX_AGE, on_seal=seal_callback)
+
+    try:
+        async with DownloadPool(
+            workers=DOWNLOAD_WORKERS,
+            queue_size=DOWNLOAD_QUEUE_SIZE,
+            max_retries=DOWNLOAD_RETRIES,
+            rate_limiter=RateLimiter(rate=DOWNLOADS_PER_SECOND, burst=DOWNLOAD_WORKERS),
+            flood_errors=(FloodWaitError,),
+            images_dir=IMAGES_DIR,
+        ) as downloads:
+            async def scrape(channel, progress):
+                if backfill:
+                    await backfill_channel(channel, pages=pages, progress=progress, rate_limiter=rate_limiter, downloads=downloads, sink=sink)
+                else:
+                    await scrape_channel(channel, limit=limit, progress=progress, rate_limiter=rate_limiter, downloads=downloads, sink=sink)  # first-run depth per channel
+                if "entity" in progress:
+                    sink.seal(channel_name_of(progress["entity"]))  # loadable now, not at the end of the pass
+
+            scheduler = ChannelScheduler(
+                scrape,
+                concurrency=SCRAPE_CONCURRENCY,
+                flood_errors=(FloodWaitError,),
+                max_flood_retries=MAX_FLOOD_RETRIES,
+            )
+            completed = 0
+            while True:
+                with record_run("scraper") if interval is not None else nullcontext():
+                    await retry_failed_downloads(downloads, rate_limiter, sink)
+                    results = await scheduler.run(channels or CHANNELS)
+                    await downloads.drain()  # the pass's images are on disk before its segments are sealed
+                    finish_failed_downloads()  # the retried jobs all downloaded or were queued again
+                    sink.close()  # seal this pass's segments so the loader can pick them up
+                    if on_downloaded is not None and sealed:
+                        on_downloaded(list(sealed))
+                    sealed.clear()
+                total = sum(len(progress.get("messages", [])) for progress in results.values())
+                logging.info(f"Scraping completed. Total messages: {total}")
+                completed += 1
+                if interval is None or (passes is not None and completed >= passes):
+                    break
+                REGISTRY.reset()  # each pass's run record covers that pass only
+                logging.info(f"Next pass in {interval:.0f}s")
+                await asyncio.sleep(interval)
+    finally:
+        sink.close()  # after the download pool has finished
 
     await client.disconnect()
-    logging.info(f"Scraping completed. Total messages: {len(all_data)}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape Telegram channels into data/raw/")
+    parser.add_argument("--backfill", action="store_true", help="walk older history instead of fetching new messages")
+    parser.add_argument("--pages", type=int, default=BACKFILL_PAGES, help="pages per channel per backfill run")
+    parser.add_argument("--daemon", action="store_true", help="stay connected and scrape again every --interval seconds")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL, help="seconds between passes in --daemon mode")
+    args = parser.parse_args()
+    setup_logging()
+    if args.daemon:
+        try:
+            asyncio.run(main(backfill=args.backfill, pages=args.pages, interval=args.interval))
+        except KeyboardInterrupt:
+            logging.info("Scraper daemon stopped")
+    else:
+        with record_run("scraper"):
+            asyncio.run(main(backfill=args.backfill, pages=args.pages))
@@ -0,0 +1,29 @@
+"""
+SQL shared by the API, the dashboard snapshot and the Parquet archive.
+
+The same question must get the same answer from Postgres and from the
+archive's DuckDB views, so the query text lives here once. It is plain SQL
+that both engines run.
+"""
+
+# Copies of one promotion share a message_clusters id (src/scripts/dedup_messages.py) and count
+# once; messages not clustered yet count individually
+DISTINCT_POSTS = "COUNT(DISTINCT c.message_cluster_id) + COUNT(*) FILTER (WHERE c.message_cluster_id IS NULL)"
+
+
+def top_products_sql(limit: str = ":limit", where: str = "", clustered: bool = True) -> str:
+    """Most mentioned products from fct_product_mentions `p`: count is distinct posts, mention_count every message.
+
+    `limit` is the bind placeholder (or a number), `where` an optional WHERE clause on `p`.
+    Without `clustered` (no message_clusters to join), count is every message too.
+    """
+    join = "LEFT JOIN message_clusters c ON c.channel_name = p.channel_name AND c.message_id = p.message_id"
+    return f"""
+        SELECT p.product, p.category, {DISTINCT_POSTS if clustered else "COUNT(*)"} AS count, COUNT(*) AS mention_count
+        FROM fct_product_mentions p
+        {join if clustered else ""}
+        {where}
+        GROUP BY p.product, p.category
+        ORDER BY count DESC, p.product
+        LIMIT {limit}
+    """
@@ -0,0 +1,238 @@
+"""
+Synthetic Telegram data in the scraper's raw layout.
+
+Generates realistic-looking channel messages (product promotions in English
+and Amharic, reposts of the same promotion across channels, health tips,
+image-only posts) and their images, written exactly as the scraper writes
+them: NDJSON segments under data/raw/telegram_messages/<date>/<channel>/ and
+images under data/raw/images/<channel>/, hard-linked to content-addressed
+blobs. The loader, dbt models, enrichment and API can then be exercised and
+benchmarked at any scale without a Telegram account.
+
+    python -m src.scripts.synthetic_data --messages 1000000 --channels 50
+
+Output is deterministic for a given seed. Only a pool of distinct images is
+rendered; messages reuse them, as promotions do, so 10M messages need a few
+hundred image files on disk plus one hard link per image message.
+"""
+
+import argparse
+import io
+import logging
+import math
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from src.scripts.downloads import IMAGES_DIR, store_image
+from src.scripts.product_mentions import load_lexicon
+from src.scripts.raw_sink import RAW_DIR, RawSink
+
+# Real channels first, so dim_channels categories are populated; then synthetic ones whose
+# names fall into the same categories
+BASE_CHANNELS = ["lobelia4cosmetics", "tikvahethiopia", "medicalethiopia", "Thequorachannel"]
+CHANNEL_STEMS = ["lobelia_beauty", "tikvah_pharma", "medical_store", "doctor_online", "addis_pharmacy"]
+BRANCHES = ["Bole", "Piassa", "Megenagna", "CMC", "Sarbet", "Mexico", "Kazanchis", "Ayat"]
+
+PROMO_TEMPLATES = [
+    "{product} {dose} now available at our {branch} branch. Price {price} birr. Call {phone}",
+    "✅ {product} and {product2} in stock 📦 Delivery all over Addis Ababa ☎️ {phone}",
+    "Original {product} imported from {origin}. Limited quantity, {price} birr only! Order: {phone}",
+    "{product} በ{price} ብር ይገኛል። {branch} ቅርንጫፍ ይምጡ ወይም ይደውሉ {phone}",
+    "New arrival: {product} {dose} 🔥 Wholesale and retail. Inbox or call {phone} #{tag}",
+]
+TIP_TEMPLATES = [
+    "Health tip: do not take {product} on an empty stomach. Ask your pharmacist before combining medicines.",
+    "Did you know? Overuse of {product} can be harmful. Always follow the dose on the label.",
+    "የጤና ምክር: {product} ከመውሰድዎ በፊት ሐኪምዎን ያማክሩ።",
+    "Join our free webinar on {topic} this {day} at {hour}:00. Link in bio.",
+]
+TOPICS = ["diabetes care", "child nutrition", "skin care in dry season", "antibiotic resistance", "hypertension"]
+ORIGINS = ["UK", "India", "Germany", "Turkey", "USA"]
+DOSES = ["250mg", "500mg", "1000mg", "100ml", "50g", "30 tablets"]
+DAYS = ["Monday", "Wednesday", "Friday", "Saturday"]
+
+
+def channel_names(count: int) -> list:
+    """`count` channel handles: the real ones, then numbered synthetic ones."""
+    names = BASE_CHANNELS[:count]
+    for i in range(count - len(names)):
+        names.append(f"{CHANNEL_STEMS[i % len(CHANNEL_STEMS)]}_{i // len(CHANNEL_STEMS) + 1:02d}")
+    return names
+
+
+def render_images(count: int, rng: random.Random, size: int = 320) -> list:
+    """`count` distinct JPEGs of product-ish shapes (bottles, boxes, blister packs) on plain backgrounds."""
+    images = []
+    for _ in range(count):
+        img = Image.new("RGB", (size, size), tuple(rng.randint(150, 255) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(1, 4)):
+            x, y = rng.randint(0, size - 80), rng.randint(0, size - 120)
+            w, h = rng.randint(40, 120), rng.randint(60, 180)
+            color = tuple(rng.randint(0, 200) for _ in range(3))
+            if rng.random() < 0.5:
+                draw.rectangle([x, y, x + w, y + h], fill=color)
+            else:
+                draw.ellipse([x, y, x + w, y + h], fill=color)
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=80)
+        images.append(buffer.getvalue())
+    return images
+
+
+class MessageFactory:
+    """Builds message texts from the product lexicon, including near-duplicate reposts."""
+
+    def __init__(self, rng: random.Random, lexicon: dict = None, repost_ratio: float = 0.15):
+        self.rng = rng
+        self.repost_ratio = repost_ratio
+        lexicon = lexicon if lexicon is not None else load_lexicon()
+        self.aliases = [alias for entry in lexicon.values() for alias in entry["aliases"]]
+        self._recent_promos = deque(maxlen=500)
+
+    def _fill(self, template: str) -> str:
+        rng = self.rng
+        return template.format(
+            product=rng.choice(self.aliases),
+            product2=rng.choice(self.aliases),
+            dose=rng.choice(DOSES),
+            branch=rng.choice(BRANCHES),
+            price=rng.randrange(50, 5000, 10),
+            phone=f"09{rng.randint(10000000, 99999999)}",
+            origin=rng.choice(ORIGINS),
+            tag=rng.choice(["pharmacy", "addis", "health", "sale"]),
+            topic=rng.choice(TOPICS),
+            day=rng.choice(DAYS),
+            hour=rng.randint(8, 20),
+        )
+
+    def text(self) -> str:
+        """One message text; empty for image-only posts."""
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.05:
+            return ""
+        if self._recent_promos and roll < 0.05 + self.repost_ratio:
+            # Another channel copies a recent promotion, sometimes with a different price or emoji
+            text = rng.choice(self._recent_promos)
+            if rng.random() < 0.5:
+                text += rng.choice([" 🔥", " 📞", " ✅", " Hurry up!"])
+            return text
+        if roll < 0.8:
+            text = self._fill(rng.choice(PROMO_TEMPLATES))
+            self._recent_promos.append(text)
+            return text
+        return self._fill(rng.choice(TIP_TEMPLATES))
+
+
+def iter_messages(
+    messages: int,
+    channels: int = 20,
+    days: int = 365,
+    start: datetime = datetime(2025, 1, 1, tzinfo=timezone.utc),
+    image_ratio: float = 0.3,
+    unique_images: int = 200,
+    repost_ratio: float = 0.15,
+    seed: int = 42,
+):
+    """Yield `messages` synthetic (record, image bytes or None) pairs in time order.
+
+    Records are in the raw layout with image_path left as None. Messages are
+    spread evenly over `days` from `start`; channel activity is skewed, as in
+    real data, so a few channels post most messages.
+    """
+    rng = random.Random(seed)
+    names = channel_names(channels)
+    weights = [1 / math.sqrt(rank + 1) for rank in range(len(names))]
+    next_id = {name: rng.randint(1000, 50000) for name in names}
+    factory = MessageFactory(rng, repost_ratio=repost_ratio)
+    image_pool = render_images(unique_images, rng) if image_ratio > 0 and unique_images > 0 else []
+    step = timedelta(days=days) / max(messages, 1)
+
+    for i in range(messages):
+        channel = rng.choices(names, weights)[0]
+        message_id = next_id[channel]
+        next_id[channel] += rng.randint(1, 3)
+        message_date = start + step * i + timedelta(seconds=rng.randint(0, 59))
+        image = rng.choice(image_pool) if image_pool and rng.random() < image_ratio else None
+        views = int(rng.lognormvariate(6, 1.2))
+        record = {
+            "message_id": message_id,
+            "channel_name": channel,
+            "message_date": message_date.isoformat(),
+            "message_text": factory.text(),
+            "has_media": image is not None or rng.random() < 0.03,  # a few videos/documents without image_path
+            "image_path": None,
+            "views": views,
+            "forwards": int(views * rng.random() * 0.05),
+        }
+        yield record, image
+
+
+def generate(
+    messages: int,
+    channels: int = 20,
+    days: int = 365,
+    start: datetime = datetime(2025, 1, 1, tzinfo=timezone.utc),
+    image_ratio: float = 0.3,
+    unique_images: int = 200,
+    repost_ratio: float = 0.15,
+    seed: int = 42,
+    raw_dir: Path = RAW_DIR,
+    images_dir: Path = IMAGES_DIR,
+) -> dict:
+    """Write `messages` synthetic messages (and their images) and return a summary."""
+    started = time.perf_counter()
+    image_count = 0
+    channel_set = set()
+    records = iter_messages(messages, channels, days, start, image_ratio, unique_images, repost_ratio, seed)
+    with RawSink(raw_dir) as sink:
+        for i, (record, image) in enumerate(records):
+            if image is not None:
+                message_date = datetime.fromisoformat(record["message_date"])
+                target = images_dir / record["channel_name"] / f"{record['message_id']}_{message_date.strftime('%Y%m%d_%H%M%S')}.jpg"
+                store_image(image, target, images_dir)
+                record["image_path"] = str(target)
+                image_count += 1
+            channel_set.add(record["channel_name"])
+            sink.write(record)
+            if (i + 1) % 100000 == 0:
+                logging.info(f"Generated {i + 1}/{messages} messages")
+
+    seconds = time.perf_counter() - started
+    summary = {"messages": messages, "images": image_count, "channels": len(channel_set), "seconds": round(seconds, 3)}
+    logging.info(f"Synthetic data written to {raw_dir}: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate synthetic Telegram messages and images in the raw layout")
+    parser.add_argument("--messages", type=int, default=10000, help="number of messages")
+    parser.add_argument("--channels", type=int, default=20, help="number of channels")
+    parser.add_argument("--days", type=int, default=365, help="days the messages are spread over")
+    parser.add_argument("--start", default="2025-01-01", help="date of the first message (YYYY-MM-DD)")
+    parser.add_argument("--image-ratio", type=float, default=0.3, help="fraction of messages with an image")
+    parser.add_argument("--unique-images", type=int, default=200, help="distinct images rendered and reused")
+    parser.add_argument("--repost-ratio", type=float, default=0.15, help="fraction of messages copying a recent promotion")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (same seed, same data)")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR, help="raw message directory")
+    parser.add_argument("--images-dir", type=Path, default=IMAGES_DIR, help="image directory")
+    args = parser.parse_args()
+    generate(
+        args.messages,
+        channels=args.channels,
+        days=args.days,
+        start=datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc),
+        image_ratio=args.image_ratio,
+        unique_images=args.unique_images,
+        repost_ratio=args.repost_ratio,
+        seed=args.seed,
+        raw_dir=args.raw_dir,
+        images_dir=args.images_dir,
+    )
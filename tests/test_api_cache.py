@@ -0,0 +1,84 @@
+# tests/test_api_cache.py
+"""Tests for the API response cache, ETags and data-version invalidation (database faked)"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api.main as api
+
+
+@pytest.fixture
+def client(monkeypatch):
+    state = {"version": 1, "queries": 0}
+
+    async def fake_version():
+        return state["version"]
+
+    async def fake_fetch_all(query, params=None):
+        state["queries"] += 1
+        return [{"product": "paracetamol", "category": "Pain & Fever", "count": 3, "limit": (params or {}).get("limit")}]
+
+    monkeypatch.setattr(api.data_version, "current", fake_version)
+    monkeypatch.setattr(api, "fetch_all", fake_fetch_all)
+    api.response_cache.clear()
+    with TestClient(api.app) as test_client:
+        yield test_client, state
+
+
+def test_repeated_requests_are_served_from_cache(client):
+    test_client, state = client
+
+    first = test_client.get("/top-products?limit=5")
+    second = test_client.get("/top-products?limit=5")
+    other = test_client.get("/top-products?limit=6")
+
+    assert first.json() == second.json() and first.json()[0]["limit"] == 5
+    assert other.json()[0]["limit"] == 6
+    assert state["queries"] == 2
+
+
+def test_etag_revalidation_and_data_version_invalidation(client):
+    test_client, state = client
+    etag = test_client.get("/top-products").headers["etag"]
+
+    assert test_client.get("/top-products", headers={"If-None-Match": etag}).status_code == 304
+    assert state["queries"] == 1
+
+    state["version"] = 2  # a load or dbt run bumped the data version
+    refreshed = test_client.get("/top-products", headers={"If-None-Match": etag})
+
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+    assert state["queries"] == 2
+
+
+def test_auto_search_reports_full_text_when_the_fuzzy_fallback_fails(client, monkeypatch):
+    from sqlalchemy.exc import ProgrammingError
+
+    test_client, _ = client
+
+    async def fetch_all(query, params=None):
+        if "<%" in query:
+            raise ProgrammingError(query, params, Exception("operator does not exist: text <% text"))
+        return []
+
+    monkeypatch.setattr(api, "fetch_all", fetch_all)
+    response = test_client.get("/search?q=paracetmol")
+
+    assert response.status_code == 200
+    assert response.json()["mode"] == "fts" and response.json()["items"] == []
+
+
+def test_export_format_query_parameter_selects_the_encoding(client, monkeypatch):
+    test_client, _ = client
+
+    async def stream_rows(query, params=None):
+        yield [{"channel_name": "a", "message_id": 1, "product": "insulin", "category": "drug", "date_key": "2026-01-03"}]
+
+    monkeypatch.setattr(api, "stream_rows", stream_rows)
+    response = test_client.get("/export/mentions?format=csv")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="mentions.csv"' in response.headers["content-disposition"]
+    assert test_client.get("/export/mentions?format=xml").status_code == 422
@@ -0,0 +1,73 @@
+# tests/test_api_queries.py
+"""Tests for keyset cursors, filters and export encoders (no database needed)"""
+
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from fastapi import HTTPException
+
+from src.api import queries
+from src.api.export import csv_chunks, ndjson_chunks
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    cursor = queries.encode_cursor([datetime(2026, 1, 3, 10, 30), "lobelia4cosmetics", 42])
+
+    assert queries.decode_cursor(cursor, 3) == ["2026-01-03T10:30:00", "lobelia4cosmetics", 42]
+    for bad in ["garbage!", queries.encode_cursor([1, 2])]:
+        with pytest.raises(HTTPException) as exc:
+            queries.decode_cursor(bad, 3)
+        assert exc.value.status_code == 400
+
+
+def test_cursor_with_wrongly_typed_values_is_a_400():
+    for query, values in ((queries.messages_query, [1, "x", 2]),
+                          (queries.messages_query, ["2026-01-03T10:30:00", "a", "not-an-id"]),
+                          (queries.mentions_query, [["a"], 1, "insulin"])):
+        with pytest.raises(HTTPException) as exc:
+            query([], {}, queries.encode_cursor(values), limit=10)
+        assert exc.value.status_code == 400
+
+
+def test_messages_query_continues_after_cursor_row():
+    rows = [{"message_timestamp": datetime(2026, 1, 3, 10, i), "channel_name": "a", "message_id": i} for i in range(3, 0, -1)]
+    cursor = queries.next_cursor(rows, 2, queries.MESSAGE_KEY)
+    assert queries.next_cursor(rows[:2], 2, queries.MESSAGE_KEY) is None
+
+    clauses, params = queries.message_filters(channel="a", date_from=date(2026, 1, 1), detected_object="bottle")
+    query, params = queries.messages_query(clauses, params, cursor, limit=3)
+
+    assert "(f.message_timestamp, f.channel_name, f.message_id) < (:after_timestamp" in query
+    assert "f.detected_objects @> ARRAY" in query and "LIMIT :limit" in query
+    assert params["after_timestamp"] == datetime(2026, 1, 3, 10, 2) and params["after_id"] == 2
+    assert params["channel"] == "a" and params["limit"] == 3
+
+
+def test_export_encoders_stream_batches():
+    async def batches():
+        yield [{"channel_name": "a", "message_id": 1, "detected_objects": ["bottle", "person"], "date_key": date(2026, 1, 1)}]
+        yield [{"channel_name": "b", "message_id": 2, "detected_objects": None, "date_key": None}]
+
+    async def collect(chunks):
+        return [chunk async for chunk in chunks]
+
+    columns = ["channel_name", "message_id", "detected_objects", "date_key"]
+    csv_out = asyncio.run(collect(csv_chunks(batches(), columns)))
+    ndjson_out = asyncio.run(collect(ndjson_chunks(batches())))
+
+    assert csv_out == ["channel_name,message_id,detected_objects,date_key\r\n", "a,1,bottle;person,2026-01-01\r\n", "b,2,,\r\n"]
+    assert ndjson_out[0] == '{"channel_name": "a", "message_id": 1, "detected_objects": ["bottle", "person"], "date_key": "2026-01-01"}\n'
+
+
+def test_search_query_ranks_full_text_or_trigram_matches():
+    clauses, params = queries.message_filters(channel="tikvahethiopia")
+
+    fts, fts_params = queries.search_query(clauses, params, "paracetamol", limit=20)
+    fuzzy, _ = queries.search_query(clauses, params, "paracetmol", limit=20, fuzzy=True)
+
+    assert "f.search_vector @@ websearch_to_tsquery" in fts and "ts_rank_cd" in fts
+    assert "<% f.message_text" in fuzzy and "word_similarity" in fuzzy
+    assert fts_params["q"] == "paracetamol" and fts_params["channel"] == "tikvahethiopia"
+    # Snippets are only built for the rows that survive the LIMIT
+    assert fts.index("LIMIT :limit") < fts.rindex(") top")
@@ -0,0 +1,18 @@
+# tests/test_checkpoints.py
+"""Tests for per-channel scrape checkpoints"""
+
+from src.scripts.checkpoints import checkpoint_path, load_checkpoint, save_checkpoint
+
+
+def test_missing_checkpoint_is_empty(tmp_path):
+    assert load_checkpoint("lobelia4cosmetics", tmp_path) == {}
+
+
+def test_checkpoint_round_trip(tmp_path):
+    save_checkpoint("Lobelia4Cosmetics", {"last_message_id": 250, "backfill_cursor": 151}, tmp_path)
+
+    checkpoint = load_checkpoint("lobelia4cosmetics", tmp_path)
+    assert checkpoint["last_message_id"] == 250
+    assert checkpoint["backfill_cursor"] == 151
+    assert "updated_at" in checkpoint
+    assert not checkpoint_path("lobelia4cosmetics", tmp_path).with_suffix(".json.tmp").exists()
@@ -0,0 +1,67 @@
+# tests/test_dashboard_snapshot.py
+"""Tests for the dashboard snapshot (downsampling, publishing) and the dashboard reading it (no database)"""
+
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+from src.scripts import dashboard_snapshot
+from src.scripts.dashboard_snapshot import downsample, latest_snapshot, load_snapshot, publish
+
+APP = Path(__file__).resolve().parents[1] / "dashboard" / "app.py"
+
+
+def _frames(days=3):
+    start = date(2025, 1, 1)
+    return {
+        "top_products": pd.DataFrame({"product": ["paracetamol", "insulin"], "category": ["drug", "drug"],
+                                      "count": [5, 3], "mention_count": [7, 3]}),
+        "visual_stats": pd.DataFrame({"channel_category": ["Cosmetics"], "total_objects": [12],
+                                      "avg_objects": [1.5], "messages_with_images": [8]}),
+        "monthly_volume": pd.DataFrame({"year": [2025], "month": [1], "count": [30], "year_month": ["2025-01"]}),
+        "daily_volume": downsample(pd.DataFrame({"date_key": [start + timedelta(days=i) for i in range(days)],
+                                                 "count": [10] * days})),
+        "channels": pd.DataFrame({"channel_name": ["lobelia4cosmetics", "tikvahethiopia"]}),
+    }
+
+
+def test_downsample_keeps_daily_rate_and_bounds_points():
+    days = pd.date_range("2024-01-01", periods=1000, freq="D").date
+    df = pd.DataFrame({"date_key": days, "count": [4] * 1000}).drop(index=[10, 11])  # two days without posts
+
+    small = downsample(df, max_points=2000)
+    assert len(small) == 1000 and small["bucket_days"].iloc[0] == 1
+    assert small["count"].sum() == 4 * 998
+
+    coarse = downsample(df, max_points=100)
+    assert len(coarse) == 100 and coarse["bucket_days"].iloc[0] == 10
+    assert coarse["count"].iloc[1] == 4 * 8 / 10  # mean per day; the missing days count as zero
+    assert (coarse["count"].drop(index=1) == 4).all()
+
+
+def test_publish_switches_latest_and_prunes_old_snapshots(tmp_path):
+    assert latest_snapshot(tmp_path) is None
+    for version in (1, 2, 3, 4):
+        publish(_frames(), version, tmp_path, keep=2)
+
+    assert latest_snapshot(tmp_path) == "v4"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["LATEST", "v3", "v4"]
+    snapshot = load_snapshot("v4", tmp_path)
+    assert snapshot["manifest"]["version"] == 4
+    assert snapshot["top_products"]["product"].tolist() == ["paracetamol", "insulin"]
+    assert snapshot["manifest"]["datasets"]["channels"] == 2
+
+
+def test_dashboard_renders_from_snapshot_without_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dashboard_snapshot, "SNAPSHOT_DIR", tmp_path / "snapshots")
+    publish(_frames(days=40), 7, tmp_path / "snapshots")
+
+    app = AppTest.from_file(str(APP), default_timeout=30).run()
+
+    assert not app.exception
+    assert "Data version 7" in app.caption[0].value
+    assert app.dataframe[0].value["product"].tolist() == ["paracetamol", "insulin"]
+    assert app.selectbox[0].options == ["All channels", "lobelia4cosmetics", "tikvahethiopia"]
@@ -0,0 +1,60 @@
+# tests/test_dedup_messages.py
+"""Tests for near-duplicate clustering (no database needed)"""
+
+import numpy as np
+
+from src.scripts.dedup_messages import MinHasher, assign_clusters, shingles, similarity
+
+PROMO = ("Augmentin 625mg now in stock at our Bole branch, original product imported from UK, "
+         "limited quantity, call 0911223344 or order on Telegram today")
+
+
+def _messages(hasher, texts):
+    sets = [shingles(t) for t in texts]
+    signatures = hasher.signatures(sets)
+    return [
+        {"key": ("channel", i), "signature": signature, "bands": bands.tolist()}
+        for i, (signature, bands) in enumerate(zip(signatures, hasher.band_keys(signatures)))
+    ]
+
+
+def test_shingles_ignore_case_punctuation_and_links():
+    assert shingles("Vitamin C, 1000mg!! https://t.me/x @pharma") == {"vitamin c 1000mg"}
+    assert shingles("a b c d") == {"a b c", "b c d"}
+    assert shingles("  ") == set()
+
+
+def test_signatures_estimate_jaccard_similarity():
+    hasher = MinHasher()
+    copy, reworded, other = _messages(hasher, [
+        PROMO,
+        PROMO.replace("Bole", "Piassa") + " 🔥",
+        "Face masks and hand sanitizer available wholesale, delivery across Addis Ababa",
+    ])[:3]
+    original = hasher.signatures([shingles(PROMO)])[0]
+
+    assert copy["signature"].dtype == np.uint32 and np.array_equal(copy["signature"], original)
+    assert similarity(original, reworded["signature"]) > 0.7
+    assert similarity(original, other["signature"]) < 0.2
+
+
+def test_assign_clusters_groups_reposts_and_joins_or_merges_existing_clusters():
+    hasher = MinHasher()
+    first, repost, other = _messages(hasher, [PROMO, PROMO + " 🔥", "Zinc syrup for kids, 200 birr"])
+    empty = {"key": ("channel", 3), "signature": None, "bands": []}  # media-only post
+
+    groups, merges = assign_clusters([first, repost, other, empty], [])
+    assert [[m["key"] for m, _ in members] for _, members in groups] == [
+        [("channel", 0), ("channel", 1)], [("channel", 2)], [("channel", 3)]
+    ]
+    assert all(cluster_id is None for cluster_id, _ in groups) and merges == {}
+    # An exact repost's bands are already indexed for its cluster
+    (_, first_bands), (_, repost_bands) = groups[0][1]
+    assert first_bands == first["bands"] and len(repost_bands) < len(repost["bands"])
+
+    stored = [
+        {"key": ("a", 1), "cluster_id": 7, "signature": first["signature"], "bands": first["bands"]},
+        {"key": ("b", 2), "cluster_id": 3, "signature": first["signature"], "bands": first["bands"]},
+    ]
+    groups, merges = assign_clusters([repost], stored)
+    assert groups[0][0] == 3 and merges == {3: [7]}
@@ -0,0 +1,80 @@
+# tests/test_downloads.py
+"""Tests for the bounded image download pool (fake messages, no Telegram)"""
+
+import asyncio
+import json
+
+from src.scripts.downloads import DownloadPool, finish_failed_downloads, load_failed_downloads, store_image
+
+
+class FakeMessage:
+    def __init__(self, message_id, payload, fail=False):
+        self.id = message_id
+        self.payload = payload
+        self.fail = fail
+
+    async def download_media(self, file=None):
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("network error")
+        return self.payload
+
+
+def test_store_image_deduplicates_by_content(tmp_path):
+    first = tmp_path / "lobelia4cosmetics" / "1.jpg"
+    second = tmp_path / "tikvahethiopia" / "9.jpg"
+
+    assert store_image(b"promo", first, tmp_path) is True
+    assert store_image(b"promo", second, tmp_path) is False
+    assert second.read_bytes() == b"promo"
+    assert len(list((tmp_path / "_blobs").rglob("*.jpg"))) == 1
+
+
+async def test_pool_downloads_concurrently_and_queues_failures(tmp_path):
+    failed_path = tmp_path / "failed.jsonl"
+    pool = DownloadPool(workers=4, queue_size=2, max_retries=1, retry_backoff=0,
+                        images_dir=tmp_path, failed_path=failed_path)
+
+    async with pool:
+        for i in range(8):
+            await pool.submit("chan", FakeMessage(i, bytes([i])), tmp_path / "chan" / f"{i}.jpg")
+        await pool.submit("chan", FakeMessage(99, b"", fail=True), tmp_path / "chan" / "99.jpg")
+
+    assert pool.stats["downloaded"] == 8
+    assert pool.stats["failed"] == 1
+    jobs = [json.loads(line) for line in failed_path.read_text().splitlines()]
+    assert jobs[0]["message_id"] == 99
+
+    assert load_failed_downloads(failed_path)[0]["message_id"] == 99
+    assert not failed_path.exists(), "Failed queue should be consumed once loaded"
+    finish_failed_downloads(failed_path)
+    assert load_failed_downloads(failed_path) == []
+
+
+def test_failed_downloads_survive_a_run_interrupted_mid_retry(tmp_path):
+    failed_path = tmp_path / "failed.jsonl"
+    failed_path.write_text(json.dumps({"channel": "chan", "message_id": 1, "target": "1.jpg"}) + "\n")
+    assert [job["message_id"] for job in load_failed_downloads(failed_path)] == [1]
+
+    # The run dies before the retry drains; meanwhile another failure was queued
+    failed_path.write_text(json.dumps({"channel": "chan", "message_id": 2, "target": "2.jpg"}) + "\n"
+                           + json.dumps({"channel": "chan", "message_id": 1, "target": "1.jpg"}) + "\n")
+    assert sorted(job["message_id"] for job in load_failed_downloads(failed_path)) == [1, 2]
+
+    finish_failed_downloads(failed_path)
+    assert load_failed_downloads(failed_path) == []
+
+
+async def test_on_done_reports_each_download_result(tmp_path):
+    results = {}
+    pool = DownloadPool(workers=2, max_retries=0, images_dir=tmp_path, failed_path=tmp_path / "failed.jsonl")
+
+    async with pool:
+        for i, fail in ((1, False), (2, True)):
+            await pool.submit("chan", FakeMessage(i, b"img", fail=fail), tmp_path / "chan" / f"{i}.jpg",
+                              on_done=lambda ok, i=i: results.__setitem__(i, ok))
+        await pool.drain()
+        await pool.submit("chan", FakeMessage(3, b"img"), tmp_path / "chan" / "1.jpg",  # already on disk
+                          on_done=lambda ok: results.__setitem__(3, ok))
+
+    assert results == {1: True, 2: False, 3: True}
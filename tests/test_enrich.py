@@ -0,0 +1,209 @@
+# tests/test_enrich.py
+"""Tests for batched YOLO enrichment helpers (fake model, no ultralytics needed)"""
+
+import contextlib
+from types import SimpleNamespace
+
+from PIL import Image
+
+from src.scripts.enrich_images_yolo import decode_image, detect_batch, iter_decoded_batches, prepare_image, summarize
+
+
+def _write_image(path, size=(1280, 720)):
+    Image.new("RGB", size, "white").save(path)
+    return str(path)
+
+
+def test_decode_shrinks_to_model_size(tmp_path):
+    img = decode_image(_write_image(tmp_path / "a.jpg"), img_size=640)
+    assert max(img.size) == 640
+    assert decode_image(str(tmp_path / "missing.jpg")) is None
+
+
+def test_batches_keep_order_and_drop_unreadable_images(tmp_path):
+    rows = [{"message_id": i, "image_path": _write_image(tmp_path / f"{i}.jpg", (64, 64))} for i in range(5)]
+    rows.insert(2, {"message_id": 99, "image_path": str(tmp_path / "missing.jpg")})
+
+    batches = list(iter_decoded_batches(rows, batch_size=2, workers=2))
+
+    assert [[row["message_id"] for row, _ in batch] for batch in batches] == [[0, 1], [2], [3, 4]]
+
+
+def test_detect_batch_keeps_full_detections_and_summary_dedupes():
+    def fake_model(images, **kwargs):
+        box = lambda cls, conf: SimpleNamespace(cls=cls, conf=conf, xyxyn=[SimpleNamespace(tolist=lambda: [0.1, 0.2, 0.5, 0.6])])
+        boxes = [box(0, 0.9), box(39, 0.8), box(39, 0.7)]
+        return [SimpleNamespace(names={0: "person", 39: "bottle"}, boxes=boxes) for _ in images]
+
+    [detections] = detect_batch(fake_model, [object()])
+    assert len(detections) == 3
+    assert detections[1] == {"class": "bottle", "confidence": 0.8, "bbox": [0.1, 0.2, 0.5, 0.6]}
+
+    enrichment = summarize({"channel_name": "lobelia4cosmetics", "message_id": 7}, detections)
+    assert enrichment["detected_objects"] == ["bottle", "person"]
+    assert enrichment["object_count"] == 2
+
+
+def test_prepare_image_skips_decoding_on_cache_hit(tmp_path):
+    class FakeCache:
+        def get(self, digest):
+            return [{"class": "bottle"}] if digest == hit_digest else None
+
+    from src.scripts.detection_cache import image_digest
+
+    hit_path = _write_image(tmp_path / "hit.jpg", (32, 32))
+    hit_digest = image_digest(open(hit_path, "rb").read())
+    miss_path = _write_image(tmp_path / "miss.jpg", (48, 48))
+
+    hit = prepare_image({"image_path": hit_path}, cache=FakeCache())
+    miss = prepare_image({"image_path": miss_path}, cache=FakeCache())
+
+    assert hit["cached"] and hit["image"] is None and hit["digest"] == hit_digest
+    assert not miss["cached"] and miss["image"].size == (48, 48)
+
+
+def test_local_inference_decodes_from_path_and_reports_errors(tmp_path, monkeypatch):
+    import src.scripts.enrich_images_yolo as enrich
+    from src.scripts.inference_pool import LocalInference
+
+    monkeypatch.setattr(enrich, "load_model", lambda name: "model")
+    monkeypatch.setattr(enrich, "detect_batch", lambda model, images: [[{"class": "bottle", "size": img.size}] for img in images])
+    path = _write_image(tmp_path / "a.jpg", (1280, 720))
+
+    with LocalInference("fake.pt", img_size=320) as runner:
+        runner.submit(0, [("d1", None, path), ("d2", None, str(tmp_path / "missing.jpg"))])
+        runner.submit(1, [("d3", "not-an-image", path)])
+        batch_id, inferred, error = runner.get()
+        assert batch_id == 0 and error is None
+        assert inferred == {"d1": [{"class": "bottle", "size": (320, 180)}]}
+        batch_id, inferred, error = runner.get()
+        assert batch_id == 1 and inferred is None and error
+
+
+def test_daemon_warms_up_once_runs_a_pass_per_data_version_and_survives_db_errors(monkeypatch):
+    import threading
+
+    import src.scripts.enrich_images_yolo as enrich
+
+    loads = []
+    monkeypatch.setattr(enrich, "load_model", lambda name: loads.append(name) or "model")
+    monkeypatch.setattr(enrich, "detect_batch", lambda model, images: [[] for _ in images])
+    monkeypatch.setattr(enrich, "get_engine", lambda: "engine")
+    monkeypatch.setattr(enrich, "record_run", lambda script: contextlib.nullcontext())
+    from sqlalchemy.exc import OperationalError
+
+    versions = iter([1, 1, None, 2, 2, 2, 3])
+
+    def read_data_version(engine):
+        version = next(versions)
+        if version is None:
+            raise OperationalError("SELECT version", {}, Exception("server closed the connection"))
+        return version
+
+    monkeypatch.setattr(enrich, "read_data_version", read_data_version)
+    stop = threading.Event()
+    passes = []
+
+    def fake_main(use_cache, runner, engine):
+        assert runner.model == "model"  # warm before the first pass
+        passes.append(engine)
+        if len(passes) == 3:
+            stop.set()
+
+    monkeypatch.setattr(enrich, "main", fake_main)
+    enrich.serve(poll_seconds=0, workers=1, stop=stop)
+
+    assert loads == [enrich.MODEL_NAME]
+    assert passes == ["engine"] * 3
+
+
+def test_unreadable_images_get_a_marker_row(tmp_path, monkeypatch):
+    import pandas as pd
+
+    import src.scripts.enrich_images_yolo as enrich
+
+    rows = [{"channel_name": "a", "message_id": i, "image_path": _write_image(tmp_path / f"{i}.jpg", (32, 32)),
+             "image_hash": None, "thumbnail_path": None} for i in range(2)]
+    rows.append({"channel_name": "a", "message_id": 9, "image_path": str(tmp_path / "missing.jpg"),
+                 "image_hash": None, "thumbnail_path": None})
+    written = []
+    monkeypatch.setattr(enrich, "ensure_enrichment_table", lambda engine: None)
+    monkeypatch.setattr(enrich, "ensure_image_tables", lambda engine: None)
+    monkeypatch.setattr(enrich, "select_pending", lambda engine: pd.DataFrame(rows))
+    monkeypatch.setattr(enrich, "write_enrichments", lambda engine, enrichments, model_version: written.extend(enrichments))
+    monkeypatch.setattr(enrich, "load_model", lambda name: "model")
+    # The worker can't decode message 1's image either
+    monkeypatch.setattr(enrich, "detect_batch", lambda model, images: [[{"class": "bottle"}] for _ in images])
+    monkeypatch.setattr(enrich, "decode_image", lambda path, img_size=640, data=None: None if path.endswith("1.jpg") else "image")
+
+    assert enrich.main(use_cache=False, workers=1, engine="engine") == 3
+
+    by_id = {row["message_id"]: row for row in written}
+    assert by_id[0]["detected_objects"] == ["bottle"]
+    assert by_id[1]["detected_objects"] is None and by_id[9]["detected_objects"] is None
+    assert by_id[9]["object_count"] == 0
+
+
+def test_batches_look_up_cached_detections_once_per_batch(tmp_path):
+    from src.scripts.detection_cache import image_digest
+
+    rows = [{"message_id": i, "image_path": _write_image(tmp_path / f"{i}.jpg", (40 + i, 40))} for i in range(4)]
+    hit_digest = image_digest(open(rows[1]["image_path"], "rb").read())
+    lookups = []
+
+    def lookup(digests):
+        lookups.append(len(digests))
+        return {hit_digest: [{"class": "bottle"}]} if hit_digest in digests else {}
+
+    batches = list(iter_decoded_batches(rows, batch_size=2, workers=2, lookup=lookup))
+
+    assert lookups == [2, 2]
+    [(_, miss), (_, hit)] = batches[0]
+    assert hit["cached"] and hit["image"] is None and hit["detections"] == [{"class": "bottle"}]
+    assert not miss["cached"] and miss["image"].size == (40, 40)
+
+
+def test_failed_inference_batch_still_writes_its_cache_hits(tmp_path, monkeypatch):
+    import pandas as pd
+
+    import src.scripts.enrich_images_yolo as enrich
+    from src.scripts.detection_cache import image_digest
+
+    rows = [{"channel_name": "a", "message_id": i, "image_path": _write_image(tmp_path / f"{i}.jpg", (32 + i, 32)),
+             "image_hash": None, "thumbnail_path": None} for i in range(3)]
+    hit_digest = image_digest(open(rows[0]["image_path"], "rb").read())
+
+    class FakeCache:
+        def __init__(self, engine, model_version):
+            pass
+
+        def ensure_table(self):
+            pass
+
+        def get_many(self, digests):
+            return {hit_digest: [{"class": "bottle"}]}
+
+        def put_many(self, detections):
+            pass
+
+        def touch(self, digests):
+            pass
+
+        def stats(self):
+            return {}
+
+    written = []
+    monkeypatch.setattr(enrich, "DetectionCache", FakeCache)
+    monkeypatch.setattr(enrich, "ensure_enrichment_table", lambda engine: None)
+    monkeypatch.setattr(enrich, "ensure_image_tables", lambda engine: None)
+    monkeypatch.setattr(enrich, "select_pending", lambda engine: pd.DataFrame(rows))
+    monkeypatch.setattr(enrich, "write_enrichments", lambda engine, enrichments, model_version: written.extend(enrichments))
+    monkeypatch.setattr(enrich, "load_model", lambda name: "model")
+
+    def broken_model(model, images):
+        raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(enrich, "detect_batch", broken_model)
+
+    assert enrich.main(use_cache=True, workers=1, engine="engine") == 1
+    assert written == [enrich.summarize(rows[0], [{"class": "bottle"}])]
@@ -0,0 +1,82 @@
+# tests/test_image_preprocess.py
+"""Tests for image preprocessing: thumbnails, dHash grouping and original eviction (no database)"""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from PIL import Image
+
+from src.scripts.detection_cache import image_digest
+from src.scripts.downloads import store_image
+from src.scripts.enrich_images_yolo import prepare_image
+from src.scripts.image_preprocess import (
+    assign_groups, band_keys, hamming, list_image_files, plan_eviction, preprocess_file, remove_original,
+)
+
+
+def _photo(seed, size=(1600, 1200)):
+    """A smooth random 'photo' (noise would make every dHash bit a coin flip)."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+
+
+def _save(image, path, **kwargs):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(path, "JPEG", **kwargs)
+    return path
+
+
+def test_preprocess_writes_model_sized_thumbnail_and_groups_copies(tmp_path):
+    original = _save(_photo(1), tmp_path / "a.jpg", quality=95)
+    copy = _save(_photo(1).resize((800, 600)), tmp_path / "b.jpg", quality=60)  # re-posted, smaller, re-encoded
+    other = _save(_photo(2), tmp_path / "c.jpg")
+    (tmp_path / "d.jpg").write_bytes(b"not an image")
+
+    images = [preprocess_file(path, f"{i:02d}" * 32, tmp_path / "thumbs", size=640)
+              for i, path in enumerate([original, copy, other, tmp_path / "d.jpg"])]
+
+    first = images[0]
+    assert (first["width"], first["height"], first["format"]) == (1600, 1200, "JPEG")
+    with Image.open(first["thumbnail_path"]) as thumbnail:
+        assert thumbnail.size == (640, 480)
+    assert hamming(images[0]["dhash"], images[1]["dhash"]) <= 3 < hamming(images[0]["dhash"], images[2]["dhash"])
+    assert images[3]["thumbnail_path"] is None and images[3]["size_bytes"] == 12
+    small = preprocess_file(copy, "ff" * 32, tmp_path / "thumbs", size=800)  # already fits: linked, not re-encoded
+    assert small["thumbnail_bytes"] == small["size_bytes"]
+
+    stored = {"dhash": images[0]["dhash"], "bands": band_keys(images[0]["dhash"]), "group": 7}
+    new_groups = assign_groups(images[1:], [stored])
+    assert new_groups == 1
+    assert [image["group"] for image in images[1:]] == [7, -1, None]
+
+
+def test_eviction_plan_applies_age_then_budget_oldest_first():
+    now = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    images = [
+        {"image_hash": "old", "size_bytes": 100, "last_seen_at": now - timedelta(days=90)},
+        {"image_hash": "mid", "size_bytes": 300, "last_seen_at": now - timedelta(days=10)},
+        {"image_hash": "new", "size_bytes": 300, "last_seen_at": now - timedelta(days=1)},
+    ]
+
+    assert plan_eviction(images, now=now) == []
+    assert plan_eviction(images, max_age_days=30, now=now) == ["old"]
+    assert plan_eviction(images, max_bytes=400, now=now) == ["old", "mid"]
+
+
+def test_evicted_original_is_served_from_its_thumbnail(tmp_path):
+    images_dir = tmp_path / "images"
+    target = images_dir / "lobelia4cosmetics" / "1_20260101_080000.jpg"
+    data = _save(_photo(3), tmp_path / "upload.jpg").read_bytes()
+    store_image(data, target, images_dir)
+    assert list_image_files(images_dir) == [target]  # the blob store is not listed
+
+    digest = image_digest(data)
+    image = preprocess_file(target, digest, tmp_path / "thumbs")
+    assert remove_original(digest, [str(target)], images_dir) == len(data)
+    assert not target.exists() and not list((images_dir / "_blobs").rglob("*.jpg"))
+
+    row = {"image_path": str(target), "image_hash": digest, "thumbnail_path": image["thumbnail_path"]}
+    prepared = prepare_image(row, img_size=640)
+    assert prepared["digest"] == digest
+    assert prepared["image"].size == (640, 480)
@@ -0,0 +1,72 @@
+# tests/test_instrumentation.py
+"""Tests for the shared metrics registry, run records and the API /metrics endpoint"""
+
+import json
+
+from fastapi.testclient import TestClient
+
+from src.scripts.instrumentation import Counter, Histogram, Registry, record_run, timed_iter, timer
+
+
+def test_metrics_render_in_prometheus_text_format():
+    registry = Registry()
+    rows = registry.get_or_create(Counter, "rows_total", "Rows written")
+    seconds = registry.get_or_create(Histogram, "write_seconds", buckets=(0.1, 1))
+    rows.inc(5, table="staging")
+    rows.inc(2, table="staging")
+    seconds.observe(0.05)
+    seconds.observe(0.5)
+    seconds.observe(3)
+
+    text = registry.render()
+    assert "# HELP rows_total Rows written\n# TYPE rows_total counter\n" in text
+    assert 'rows_total{table="staging"} 7\n' in text
+    assert 'write_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'write_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'write_seconds_bucket{le="+Inf"} 3\n' in text
+    assert "write_seconds_count 3\n" in text
+    assert registry.get_or_create(Counter, "rows_total") is rows
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram("latency_seconds", buckets=(0.01, 0.1, 1))
+    for _ in range(90):
+        histogram.observe(0.005)
+    for _ in range(10):
+        histogram.observe(0.5)
+
+    assert histogram.quantile(0.5) <= 0.01
+    assert 0.1 < histogram.quantile(0.99) <= 0.5
+    assert histogram.quantile(0.5, stage="unknown") is None
+
+
+def test_run_record_has_status_and_metric_snapshot(tmp_path):
+    registry = Registry()
+    seconds = registry.get_or_create(Histogram, "batch_seconds")
+    try:
+        with record_run("loader", runs_dir=tmp_path, registry=registry):
+            with timer(seconds, table="staging"):
+                pass
+            for _ in timed_iter(range(3), seconds, table="parse"):
+                pass
+            raise RuntimeError("database gone")
+    except RuntimeError:
+        pass
+
+    [path] = tmp_path.glob("loader_*.json")
+    record = json.loads(path.read_text())
+    assert record["status"] == "failed"
+    assert record["metrics"]["batch_seconds"]['{table="staging"}']["count"] == 1
+    assert record["metrics"]["batch_seconds"]['{table="parse"}']["count"] == 3
+
+
+def test_api_serves_metrics():
+    from src.api.main import app
+
+    with TestClient(app) as client:
+        client.get("/")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'api_request_seconds_count{method="GET",route="/",status="200"}' in response.text
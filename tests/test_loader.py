@@ -16,4 +16,98 @@ def test_loader_connection_string_format(mock_create_engine):
     expected_end = "@localhost:5432/medical_warehouse"
 
     assert DATABASE_URL.startswith(expected_start), "Wrong user/protocol"
-    assert DATABASE_URL.endswith(expected_end), "Wrong host/port/DB name"
\ No newline at end of file
+    assert DATABASE_URL.endswith(expected_end), "Wrong host/port/DB name"
+
+@patch("src.scripts.loader.create_engine")
+def test_loader_reads_segments_and_legacy_files(mock_create_engine, tmp_path, monkeypatch):
+    """Loader picks up NDJSON segments next to legacy per-message files"""
+    from src.scripts import loader
+    from src.scripts.raw_sink import RawSink
+
+    partition = tmp_path / "2026-01-01" / "lobelia4cosmetics"
+    partition.mkdir(parents=True)
+    (partition / "message_1.json").write_text(
+        '{"message_id": 1, "channel_name": "lobelia4cosmetics", "message_date": "2026-01-01T08:00:00+00:00"}'
+    )
+    with RawSink(tmp_path) as sink:
+        for message_id in (2, 3):
+            sink.write({"message_id": message_id, "channel_name": "lobelia4cosmetics",
+                        "message_date": "2026-01-01T09:00:00+00:00"})
+
+    monkeypatch.setattr(loader, "RAW_DIR", tmp_path)
+    df = loader.load_json_files()
+
+    assert sorted(df["message_id"]) == [1, 2, 3]
+    assert len(list(partition.glob("segment_*.jsonl"))) == 1
+
+
+@patch("src.scripts.loader.create_engine")
+def test_find_unloaded_files_skips_manifest_entries(mock_create_engine, tmp_path):
+    """Only new or changed files are picked up; touched-but-identical files are skipped"""
+    import os
+    from src.scripts.loader import file_checksum, find_unloaded_files
+
+    loaded = tmp_path / "segment_a.jsonl"
+    loaded.write_text('{"message_id": 1}\n')
+    touched = tmp_path / "segment_b.jsonl"
+    touched.write_text('{"message_id": 2}\n')
+    new = tmp_path / "segment_c.jsonl"
+    new.write_text('{"message_id": 3}\n')
+
+    manifest = {
+        str(loaded): (loaded.stat().st_size, loaded.stat().st_mtime, file_checksum(loaded)),
+        str(touched): (touched.stat().st_size, 0.0, file_checksum(touched)),
+    }
+    os.utime(touched)
+
+    with patch("src.scripts.loader.refresh_manifest_mtimes") as refresh:
+        entries = find_unloaded_files([loaded, touched, new], manifest)
+    assert [entry["file_path"] for entry in entries] == [str(new)]
+    assert entries[0]["checksum"] == file_checksum(new)
+    # The touched file's new mtime is stored, so the next scan skips it without hashing it again
+    [refreshed] = refresh.call_args.args[0]
+    assert refreshed["file_path"] == str(touched) and refreshed["mtime"] == touched.stat().st_mtime
+
+
+@patch("src.scripts.loader.create_engine")
+def test_copy_batches_are_bounded_and_track_completed_files(mock_create_engine, tmp_path):
+    """COPY batches never exceed batch_size; files are completed with the batch holding their shard's last row"""
+    from pathlib import Path
+    from src.scripts.loader import COPY_COLUMNS, iter_copy_batches
+
+    entries = []
+    for name, count in (("a", 3), ("b", 4)):
+        segment = tmp_path / f"segment_{name}.jsonl"
+        segment.write_text("".join(
+            f'{{"message_id": {i}, "channel_name": "{name}", "message_date": "2026-01-01"}}\n' for i in range(count)
+        ))
+        entries.append({"file_path": str(segment), "size_bytes": segment.stat().st_size})
+
+    batches = list(iter_copy_batches(entries, batch_size=3, workers=1))
+
+    assert [batch.num_rows for batch, _ in batches] == [3, 3, 1]
+    assert [[Path(e["file_path"]).name for e in done] for _, done in batches] == [
+        [], [], ["segment_a.jsonl", "segment_b.jsonl"]
+    ]
+    assert batches[0][0].schema.names == COPY_COLUMNS
+
+
+def test_importing_pipeline_scripts_has_no_side_effects(tmp_path):
+    """No engine, log file, Telegram client, pandas or model is set up until a script actually runs"""
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    repo = Path(__file__).resolve().parents[1]
+    check = (
+        "import sys\n"
+        "from src.scripts import enrich_images_yolo, loader, scraper\n"
+        "assert loader._engine is None and scraper.client is None\n"
+        "print(sorted(m for m in ('pandas', 'ultralytics', 'torch') if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", check], cwd=tmp_path, capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": str(repo)})
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+    assert not (tmp_path / "logs").exists()
@@ -0,0 +1,158 @@
+# tests/test_orchestrator.py
+"""Tests for the pipeline DAG: overlap, per-partition retries and resume, concurrency limits (no database)"""
+
+import asyncio
+import threading
+import time
+
+from src.scripts.orchestrator import Pipeline, Stage
+
+
+class MemoryStore:
+    """PartitionStore stand-in that keeps statuses in a dict."""
+
+    def __init__(self):
+        self.rows = {}
+        self.mark_threads = set()
+
+    def load(self):
+        return dict(self.rows)
+
+    def mark(self, stage, keys, status, error=None):
+        self.mark_threads.add(threading.get_ident())
+        for key in keys:
+            self.rows[(stage, key)] = status
+
+
+class Recorder:
+    """Stage function that records its calls, and the most calls it saw running at once."""
+
+    def __init__(self, fail=(), delay=0.0):
+        self.calls, self.fail, self.delay = [], dict.fromkeys(fail, 0), delay
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, keys):
+        with self._lock:
+            self.calls.append(list(keys))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            for key in keys:
+                if key in self.fail:
+                    self.fail[key] += 1
+                    raise RuntimeError(f"bad partition {key}")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def keys(self):
+        return [key for call in self.calls for key in call]
+
+
+def _source(*waves, between=None):
+    async def run(emit):
+        for i, wave in enumerate(waves):
+            emit(wave)
+            if between and i < len(waves) - 1:
+                await between()
+    return run
+
+
+async def test_downstream_starts_before_the_source_finishes():
+    load, publish = Recorder(), Recorder()
+    published = threading.Event()
+
+    def publish_and_signal(keys):
+        publish(keys)
+        published.set()
+
+    # The source only emits its second partition once the first one reached the end of the DAG
+    source = _source(["2026-01-01/a"], ["2026-01-01/b"],
+                     between=lambda: asyncio.to_thread(published.wait, 5))
+    stages = [
+        Stage("scrape", source, source=True),
+        Stage("load", load, upstream=["scrape"]),
+        Stage("publish", publish_and_signal, upstream=["load"], batch=True),
+    ]
+
+    assert await Pipeline(stages).run() == {}
+    assert publish.calls[0] == ["2026-01-01/a"]
+    assert sorted(publish.keys()) == ["2026-01-01/a", "2026-01-01/b"]
+
+
+async def test_failed_partitions_retry_then_resume_without_redoing_the_rest():
+    store = MemoryStore()
+    keys = ["2026-01-01/a", "2026-01-01/b", "2026-01-02/a"]
+    load, publish = Recorder(fail=["2026-01-01/b"]), Recorder()
+
+    def stages(source):
+        return [
+            Stage("scrape", source, source=True),
+            Stage("load", load, upstream=["scrape"], concurrency=2, max_attempts=2),
+            Stage("publish", publish, upstream=["load"], batch=True),
+        ]
+
+    failed = await Pipeline(stages(_source(keys)), store, retry_delay=0.01).run()
+
+    assert failed == {"load": ["2026-01-01/b"]}
+    assert load.fail["2026-01-01/b"] == 2  # retried once within the run
+    assert sorted(publish.keys()) == ["2026-01-01/a", "2026-01-02/a"]
+
+    # Next run: the bad partition is fixed, nothing new is scraped; only it goes through again
+    load.fail.clear()
+    load.calls.clear()
+    publish.calls.clear()
+    assert await Pipeline(stages(_source()), store).run() == {}
+    assert load.calls == [["2026-01-01/b"]]
+    assert publish.calls == [["2026-01-01/b"]]
+    assert all(status == "done" for status in store.rows.values())
+    assert threading.get_ident() not in store.mark_threads  # status writes stay off the event loop
+
+
+async def test_concurrency_limits_batching_and_exclusive_stages():
+    keys = [f"2026-01-{day:02d}/a" for day in range(1, 9)]
+    load, mentions, dbt, dbt_enrichments = Recorder(delay=0.02), Recorder(), Recorder(delay=0.02), Recorder(delay=0.02)
+    overlapped = []
+
+    def guarded(recorder, other):
+        def run(batch):
+            if other.active:
+                overlapped.append(recorder)
+            recorder(batch)
+        return run
+
+    stages = [
+        Stage("scrape", _source(keys), source=True),
+        Stage("load", load, upstream=["scrape"], concurrency=3),
+        Stage("mentions", mentions, upstream=["load"], batch=True),
+        Stage("dbt", guarded(dbt, dbt_enrichments), upstream=["mentions"], batch=True),
+        Stage("dbt_enrichments", guarded(dbt_enrichments, dbt), upstream=["load"], batch=True, exclusive=["dbt"]),
+    ]
+
+    assert await Pipeline(stages).run() == {}
+    assert load.max_active == 3
+    assert sorted(load.keys()) == sorted(mentions.keys()) == sorted(dbt.keys()) == keys
+    assert len(mentions.calls) < len(keys)  # partitions that were ready together went in one batch
+    assert not overlapped
+
+
+async def test_partition_emitted_again_while_running_goes_through_again():
+    load = Recorder(delay=0.05)
+    emitted = threading.Event()
+
+    async def source(emit):
+        emit(["2026-01-01/a"])
+        await asyncio.sleep(0.01)  # the first load is now running
+        emit(["2026-01-01/a"])
+        emitted.set()
+
+    stages = [
+        Stage("scrape", source, source=True),
+        Stage("load", load, upstream=["scrape"]),
+    ]
+
+    assert await Pipeline(stages).run() == {}
+    assert emitted.is_set()
+    assert load.calls == [["2026-01-01/a"], ["2026-01-01/a"]]
@@ -0,0 +1,121 @@
+# tests/test_parquet_archive.py
+"""Tests for the Parquet archive (raw compaction, manifest) and the DuckDB query helper"""
+
+from datetime import date
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.scripts.archive_query import ArchiveQuery
+from src.scripts.parquet_archive import (archive_raw, find_unarchived_files, load_manifest, messages_dir,
+                                         save_manifest)
+from src.scripts.raw_sink import RawSink
+from src.scripts.synthetic_data import generate
+
+
+def _archive(tmp_path, messages=400):
+    raw_dir, archive_dir = tmp_path / "raw", tmp_path / "archive"
+    generate(messages, channels=4, days=90, unique_images=3, seed=3, raw_dir=raw_dir, images_dir=tmp_path / "images")
+    return raw_dir, archive_dir, archive_raw(raw_dir, archive_dir, workers=1)
+
+
+def test_raw_messages_compact_into_one_file_per_month(tmp_path):
+    raw_dir, archive_dir, parsed = _archive(tmp_path)
+
+    assert parsed == 400
+    months = sorted(messages_dir(archive_dir).glob("month=*"))
+    assert len(months) >= 3
+    for month in months:
+        [part] = month.glob("*.parquet")
+        assert part.name.startswith("part-")
+        metadata = pq.ParquetFile(part).metadata
+        assert metadata.row_group(0).column(0).statistics.has_min_max
+    # Nothing new: the manifest skips every file already archived
+    assert archive_raw(raw_dir, archive_dir, workers=1) == 0
+
+
+def test_newer_copy_of_a_message_replaces_the_archived_one(tmp_path):
+    raw_dir, archive_dir, _ = _archive(tmp_path)
+    archive = ArchiveQuery(archive_dir)
+    [(channel, message_id, message_date, total)] = archive.sql(
+        "SELECT channel_name, message_id, strftime(message_date, '%Y-%m-%dT%H:%M:%S'), COUNT(*) OVER () "
+        "FROM messages ORDER BY channel_name, message_id LIMIT 1"
+    ).itertuples(index=False)
+
+    with RawSink(raw_dir / "late") as sink:
+        sink.write({"message_id": int(message_id), "channel_name": channel, "message_date": message_date,
+                    "message_text": "edited", "has_media": False, "image_path": None, "views": 999,
+                    "forwards": 0})
+    assert archive_raw(raw_dir, archive_dir, workers=1) == 1
+
+    archive = ArchiveQuery(archive_dir)
+    assert archive.sql("SELECT COUNT(*) AS n FROM messages")["n"][0] == total
+    row = archive.sql("SELECT message_text, views FROM messages WHERE channel_name = ? AND message_id = ?",
+                      [channel, int(message_id)])
+    assert row.to_dict("records") == [{"message_text": "edited", "views": 999}]
+
+
+def test_compaction_interrupted_before_removing_old_files_is_finished_next_run(tmp_path, monkeypatch):
+    raw_dir, archive_dir, _ = _archive(tmp_path)
+    total = ArchiveQuery(archive_dir).sql("SELECT COUNT(*) AS n FROM messages")["n"][0]
+    [(channel, message_id, message_date)] = ArchiveQuery(archive_dir).sql(
+        "SELECT channel_name, message_id, strftime(message_date, '%Y-%m-%dT%H:%M:%S') FROM messages LIMIT 1"
+    ).itertuples(index=False)
+    with RawSink(raw_dir / "late") as sink:
+        sink.write({"message_id": int(message_id), "channel_name": channel, "message_date": message_date,
+                    "message_text": "edited", "has_media": False, "image_path": None, "views": 1,
+                    "forwards": 0})
+
+    unlink = Path.unlink
+
+    def crash_on_parquet(path, *args, **kwargs):
+        if path.suffix == ".parquet":
+            raise OSError("killed mid-compaction")
+        return unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "unlink", crash_on_parquet)
+    try:
+        archive_raw(raw_dir, archive_dir, workers=1)
+    except OSError:
+        pass
+    monkeypatch.setattr(Path, "unlink", unlink)
+    assert list(messages_dir(archive_dir).glob("month=*/_compaction.json"))
+
+    # Even with no new raw files to archive, the next run drops the copies the crash left behind
+    manifest = load_manifest(archive_dir)
+    for entry in find_unarchived_files(raw_dir, manifest):
+        manifest[entry["file_path"]] = [entry["size_bytes"], entry["mtime"]]
+    save_manifest(manifest, archive_dir)
+    assert archive_raw(raw_dir, archive_dir, workers=1) == 0
+    assert not list(messages_dir(archive_dir).glob("month=*/_compaction.json"))
+    assert ArchiveQuery(archive_dir).sql("SELECT COUNT(*) AS n FROM messages")["n"][0] == total
+
+
+def test_queries_prune_by_month_and_read_marts(tmp_path):
+    _, archive_dir, _ = _archive(tmp_path)
+    marts = archive_dir / "marts"
+    (marts / "agg_channel_daily" / "month=2025-01").mkdir(parents=True)
+    (marts / "dim_dates").mkdir()
+    (marts / "fct_product_mentions").mkdir()
+    pq.write_table(pa.table({"channel_name": ["a", "b"], "date_key": [date(2025, 1, 6)] * 2, "message_count": [3, 4]}),
+                   marts / "agg_channel_daily" / "month=2025-01" / "part-0.parquet")
+    pq.write_table(pa.table({"date_key": [date(2025, 1, 6)], "year": [2025], "month": [1], "week": [2],
+                             "day_name": ["Monday"], "is_weekend": [False]}), marts / "dim_dates" / "part-0.parquet")
+    pq.write_table(pa.table({"channel_name": ["a", "a", "b"], "message_id": [1, 2, 3],
+                             "date_key": [date(2025, 1, 6)] * 3, "product": ["paracetamol", "paracetamol", "insulin"],
+                             "category": ["drug", "drug", "drug"]}), marts / "fct_product_mentions" / "part-0.parquet")
+
+    archive = ArchiveQuery(archive_dir)
+    assert {"messages", "agg_channel_daily", "dim_dates", "fct_product_mentions"} <= set(archive.views)
+    assert archive.trends(date_from="2025-01-01")["message_count"].tolist() == [7]
+    assert archive.trends(date_from="2025-02-01").empty
+    assert archive.top_products(limit=1)[["product", "count"]].to_dict("records") == [
+        {"product": "paracetamol", "count": 2}
+    ]
+
+    everything = archive.daily_volume()
+    first_day = everything["date_key"].min()
+    one_day = archive.daily_volume(date_from=first_day, date_to=first_day)
+    assert one_day["message_count"].sum() == everything.loc[everything["date_key"] == first_day, "message_count"].sum()
+    assert everything["message_count"].sum() == 400
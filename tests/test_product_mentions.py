@@ -0,0 +1,35 @@
+# tests/test_product_mentions.py
+"""Tests for the product lexicon matcher (no database needed)"""
+
+from src.scripts.product_mentions import AhoCorasick, ProductMatcher, lexicon_version, load_lexicon
+
+
+def test_aho_corasick_finds_overlapping_patterns_in_one_pass():
+    automaton = AhoCorasick({"he": "he", "she": "she", "his": "his", "hers": "hers"})
+
+    matches = sorted(automaton.iter_matches("ushers"))
+
+    assert matches == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_matcher_uses_aliases_whole_words_and_amharic():
+    matcher = ProductMatcher({
+        "paracetamol": {"category": "Pain & Fever", "aliases": ["paracetamol", "panadol", "ፓራሲታሞል"]},
+        "vitamin d": {"category": "Vitamins", "aliases": ["vitamin d", "vitamin d3"]},
+        "zinc": {"category": "Vitamins", "aliases": ["zinc"]},
+    })
+
+    assert matcher.find("PANADOL 500mg, Vitamin\n D3 and ፓራሲታሞል ያለን።") == ["paracetamol", "vitamin d"]
+    assert matcher.find("zincite crystals and vitamin drops") == []
+    assert matcher.find(None) == []
+    assert matcher.categories["zinc"] == "Vitamins"
+
+
+def test_shipped_lexicon_loads_and_version_tracks_changes():
+    lexicon = load_lexicon()
+    matcher = ProductMatcher(lexicon)
+
+    assert matcher.find("Augmentin and a face mask") == ["amoxicillin", "face mask"]
+    version = lexicon_version(lexicon)
+    lexicon["zinc"]["aliases"].append("zn")
+    assert lexicon_version(lexicon) != version
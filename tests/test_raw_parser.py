@@ -0,0 +1,53 @@
+# tests/test_raw_parser.py
+"""Tests for sharded parsing of raw files into Arrow record batches"""
+
+import pyarrow as pa
+
+from src.scripts.raw_parser import RAW_SCHEMA, iter_parsed_shards, plan_shards, records_to_batch
+
+
+def test_records_become_typed_batch():
+    batch = records_to_batch([
+        {"message_id": 7, "channel_name": "tikvahethiopia", "message_date": "2026-01-01T03:00:00+03:00",
+         "message_text": "", "has_media": True, "image_path": None, "views": 12, "forwards": 0},
+        {"message_id": 8, "channel_name": "tikvahethiopia", "message_date": "not a date"},
+    ])
+
+    assert batch.schema == RAW_SCHEMA
+    assert batch.column("message_date")[0].value == 1767225600000000  # 2026-01-01T00:00:00Z in us
+    assert batch.column("message_date")[1].as_py() is None
+    assert batch.column("message_text").to_pylist() == ["", None]
+
+
+def test_plan_shards_groups_by_size():
+    entries = [{"file_path": str(i), "size_bytes": 40} for i in range(5)]
+    assert [len(shard) for shard in plan_shards(entries, shard_bytes=100)] == [3, 2]
+
+
+def test_unreadable_files_are_left_out_of_the_shard(tmp_path):
+    good = tmp_path / "segment_a.jsonl"
+    good.write_text('{"message_id": 1, "channel_name": "a"}\n{"message_id": 2, "channel_name": "a"}\n')
+    entries = [
+        {"file_path": str(good), "size_bytes": good.stat().st_size},
+        {"file_path": str(tmp_path / "missing.jsonl"), "size_bytes": 0},
+    ]
+
+    [(batch, parsed, stats)] = list(iter_parsed_shards(entries, workers=1))
+
+    assert isinstance(batch, pa.RecordBatch) and batch.num_rows == 2
+    assert parsed == entries[:1]
+    assert stats["failed"] == [entries[1]["file_path"]]
+
+
+def test_file_with_unconvertible_values_fails_alone(tmp_path):
+    good = tmp_path / "segment_a.jsonl"
+    good.write_text('{"message_id": 1, "channel_name": "a", "views": 10}\n')
+    bad = tmp_path / "segment_b.jsonl"
+    bad.write_text('{"message_id": 2, "channel_name": "a", "views": "1.2K"}\n')
+    entries = [{"file_path": str(path), "size_bytes": path.stat().st_size} for path in (good, bad)]
+
+    [(batch, parsed, stats)] = list(iter_parsed_shards(entries, workers=1))
+
+    assert batch.column("message_id").to_pylist() == [1]
+    assert parsed == entries[:1]
+    assert stats["failed"] == [str(bad)]
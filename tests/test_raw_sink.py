@@ -0,0 +1,56 @@
+# tests/test_raw_sink.py
+"""Tests for the append-only NDJSON raw sink"""
+
+import json
+
+from src.scripts.raw_sink import RawSink, recover_open_segments
+
+
+def _record(message_id, date="2026-01-01", channel="tikvahethiopia"):
+    return {"message_id": message_id, "channel_name": channel, "message_date": f"{date}T10:00:00+00:00"}
+
+
+def test_segments_roll_by_size_and_keep_partition_layout(tmp_path):
+    with RawSink(tmp_path, max_bytes=200) as sink:
+        for i in range(10):
+            sink.write(_record(i))
+        sink.write(_record(99, date="2026-01-02"))
+        assert list(tmp_path.rglob("*.jsonl.open")), "Segments stay hidden until sealed"
+
+    segments = sorted((tmp_path / "2026-01-01" / "tikvahethiopia").glob("segment_*.jsonl"))
+    assert len(segments) > 1
+    ids = [json.loads(line)["message_id"] for seg in segments for line in seg.read_text().splitlines()]
+    assert sorted(ids) == list(range(10))
+    assert list((tmp_path / "2026-01-02" / "tikvahethiopia").glob("segment_*.jsonl"))
+    assert not list(tmp_path.rglob("*.open"))
+
+
+def test_recover_open_segments_drops_partial_line(tmp_path):
+    partition = tmp_path / "2026-01-01" / "tikvahethiopia"
+    partition.mkdir(parents=True)
+    (partition / "segment_x.jsonl.open").write_text('{"message_id": 1}\n{"message_id": 2, "chan')
+
+    assert recover_open_segments(tmp_path) == 1
+    assert (partition / "segment_x.jsonl").read_text() == '{"message_id": 1}\n'
+
+
+def test_seal_one_channel_and_report_sealed_partitions(tmp_path):
+    sealed = []
+    with RawSink(tmp_path, on_seal=sealed.append) as sink:
+        sink.write(_record(1))
+        sink.write(_record(2, channel="lobelia4cosmetics"))
+        sink.seal("tikvahethiopia")
+        assert sealed == [("2026-01-01", "tikvahethiopia")]
+        assert list((tmp_path / "2026-01-01" / "lobelia4cosmetics").glob("*.open"))
+
+    assert sealed == [("2026-01-01", "tikvahethiopia"), ("2026-01-01", "lobelia4cosmetics")]
+
+
+def test_segments_sort_in_the_order_they_were_written(tmp_path):
+    with RawSink(tmp_path) as sink:
+        for i in range(50):  # all within the same second, as a correction written right after a seal is
+            sink.write(_record(i))
+            sink.seal("tikvahethiopia")
+
+    segments = sorted((tmp_path / "2026-01-01" / "tikvahethiopia").glob("segment_*.jsonl"))
+    assert [json.loads(seg.read_text())["message_id"] for seg in segments] == list(range(50))
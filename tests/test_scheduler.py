@@ -0,0 +1,67 @@
+# tests/test_scheduler.py
+"""Tests for the concurrent channel scheduler (no Telegram connection needed)"""
+
+import asyncio
+import time
+
+from src.scripts.scheduler import ChannelScheduler, RateLimiter
+
+
+class FakeFloodWait(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"wait {seconds}s")
+        self.seconds = seconds
+
+
+async def test_flood_wait_parks_only_the_affected_channel():
+    """A flooded channel resumes from its progress while the others finish"""
+    calls = []
+
+    async def scrape(channel, progress):
+        calls.append(channel)
+        progress.setdefault("messages", [])
+        if channel == "slow" and not progress.get("flooded"):
+            progress["messages"].append(1)
+            progress["flooded"] = True
+            raise FakeFloodWait(0)
+        progress["messages"].append(len(progress["messages"]) + 1)
+
+    scheduler = ChannelScheduler(scrape, concurrency=2, flood_errors=(FakeFloodWait,))
+    results = await scheduler.run(["slow", "a", "b"])
+
+    assert results["slow"]["messages"] == [1, 2], "Flooded channel should resume, not restart"
+    assert results["a"]["messages"] == [1]
+    assert calls.count("slow") == 2
+
+
+async def test_concurrency_limit_is_respected():
+    running = 0
+    peak = 0
+
+    async def scrape(channel, progress):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await ChannelScheduler(scrape, concurrency=3).run([f"c{i}" for i in range(10)])
+    assert peak == 3
+
+
+async def test_gives_up_after_max_flood_retries():
+    async def scrape(channel, progress):
+        raise FakeFloodWait(0)
+
+    scheduler = ChannelScheduler(scrape, flood_errors=(FakeFloodWait,), max_flood_retries=2)
+    results = await scheduler.run(["stuck"])
+    assert results["stuck"] == {}
+
+
+async def test_rate_limiter_spaces_requests_after_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        await limiter.acquire()
+    # 2 tokens free, then 2 more at 50/s -> at least ~40ms
+    assert time.monotonic() - start >= 0.035
@@ -0,0 +1,110 @@
+# tests/test_scraper.py
+"""Tests for the scraper against the in-memory Telegram stand-in (no network, no credentials)"""
+
+from src.scripts import scraper
+from src.scripts.checkpoints import load_checkpoint
+from src.scripts.downloads import DownloadPool
+from src.scripts.fake_telegram import FakeTelegramClient
+from src.scripts.raw_parser import read_raw_file
+from src.scripts.raw_sink import RawSink
+
+
+def _saved(raw_dir):
+    return [r for path in raw_dir.rglob("*.jsonl") for r in read_raw_file(path)]
+
+
+async def test_fake_client_pages_like_telegram():
+    fake = FakeTelegramClient.synthetic(200, channels=1, image_ratio=0)
+    entity = await fake.get_entity("LOBELIA4COSMETICS")
+    newest = await fake.get_messages(entity, limit=50)
+    older = await fake.get_messages(entity, limit=50, offset_id=newest[-1].id)
+    above = await fake.get_messages(entity, limit=500, min_id=newest[10].id)
+
+    assert [m.id for m in newest] == sorted((m.id for m in newest), reverse=True)
+    assert older[0].id < newest[-1].id
+    assert [m.id for m in above] == [m.id for m in newest[:10]]
+    assert fake.stats["requests"] == 4
+
+
+async def test_scrape_channel_downloads_concurrently(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake = FakeTelegramClient.synthetic(150, channels=1, image_ratio=0.5, unique_images=3, media_latency=0.01)
+    monkeypatch.setattr(scraper, "client", fake)
+
+    async with DownloadPool(workers=4, images_dir=scraper.IMAGES_DIR) as downloads:
+        with RawSink(scraper.RAW_DIR) as sink:
+            messages = await scraper.scrape_channel("lobelia4cosmetics", limit=1000, downloads=downloads, sink=sink)
+
+    assert len(messages) == len(_saved(scraper.RAW_DIR)) == 150
+    assert load_checkpoint("lobelia4cosmetics")["last_message_id"] == max(m["message_id"] for m in messages)
+    assert fake.stats["downloads"] == sum(1 for m in messages if m["image_path"]) > 0
+    assert fake.stats["max_concurrent_downloads"] > 1
+
+
+async def test_flood_waits_resume_and_private_channels_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper, "REQUESTS_PER_SECOND", 1000.0)
+    monkeypatch.setattr(scraper, "DOWNLOADS_PER_SECOND", 1000.0)
+    fake = FakeTelegramClient.synthetic(400, channels=3, image_ratio=0, flood_every=4, flood_seconds=0,
+                                        private=["medicalethiopia"])
+
+    await scraper.main(limit=1000, channels=["lobelia4cosmetics", "tikvahethiopia", "medicalethiopia"], telegram=fake)
+
+    saved = _saved(scraper.RAW_DIR)
+    keys = [(r["channel_name"], r["message_id"]) for r in saved]
+    assert fake.stats["flood_waits"] > 0
+    assert len(keys) == len(set(keys))  # resumed after each flood wait without repeating messages
+    assert {r["channel_name"] for r in saved} == {"lobelia4cosmetics", "tikvahethiopia"}
+    assert len(saved) == fake.stats["messages"]
+
+
+async def test_daemon_passes_seal_segments_and_only_fetch_new_messages(tmp_path, monkeypatch):
+    from src.scripts import instrumentation
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(instrumentation, "RUNS_DIR", tmp_path / "runs")
+    monkeypatch.setattr(scraper, "REQUESTS_PER_SECOND", 1000.0)
+    monkeypatch.setattr(scraper, "DOWNLOADS_PER_SECOND", 1000.0)
+    fake = FakeTelegramClient.synthetic(120, channels=2, image_ratio=0.3, unique_images=2)
+
+    await scraper.main(limit=1000, channels=fake.channels, telegram=fake, interval=0, passes=2)
+
+    assert len(_saved(scraper.RAW_DIR)) == fake.stats["messages"] == 120
+    assert not list(scraper.RAW_DIR.rglob("*.open"))  # sealed for the loader after every pass
+    assert len(list((tmp_path / "runs").glob("scraper_*.json"))) == 2
+
+
+async def test_on_downloaded_fires_once_the_pass_images_are_on_disk(tmp_path, monkeypatch):
+    from pathlib import Path
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper, "REQUESTS_PER_SECOND", 1000.0)
+    monkeypatch.setattr(scraper, "DOWNLOADS_PER_SECOND", 1000.0)
+    fake = FakeTelegramClient.synthetic(60, channels=2, image_ratio=0.5, media_latency=0.01)
+    sealed, downloaded = [], []
+
+    def check(keys):
+        images = [r["image_path"] for r in _saved(scraper.RAW_DIR) if r["image_path"]]
+        assert images and all(Path(path).exists() for path in images)
+        downloaded.append(keys)
+
+    await scraper.main(limit=1000, channels=fake.channels, telegram=fake, on_seal=sealed.append, on_downloaded=check)
+
+    assert len(downloaded) == 1 and sorted(downloaded[0]) == sorted(set(sealed))
+
+
+async def test_failed_download_is_re_recorded_without_its_image_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper, "REQUESTS_PER_SECOND", 1000.0)
+    monkeypatch.setattr(scraper, "DOWNLOADS_PER_SECOND", 1000.0)
+    monkeypatch.setattr(scraper, "DOWNLOAD_RETRIES", 0)
+    fake = FakeTelegramClient.synthetic(40, channels=1, image_ratio=0.5)
+    broken = next(m for m in fake._history[fake.channels[0]] if m.media is not None)
+    broken.payload = None  # the download comes back empty
+
+    await scraper.main(limit=1000, channels=fake.channels, telegram=fake)
+
+    copies = sorted(((path.stat().st_mtime_ns, line), r["image_path"]) for path in scraper.RAW_DIR.rglob("*.jsonl")
+                    for line, r in enumerate(read_raw_file(path)) if r["message_id"] == broken.id)
+    assert len(copies) == 2 and copies[0][1] is not None
+    assert copies[-1][1] is None  # the loader keeps the latest copy
@@ -0,0 +1,64 @@
+# tests/test_synthetic_data.py
+"""Tests for the synthetic data generator and the benchmark's comparison helpers"""
+
+from pathlib import Path
+
+from src.scripts.benchmark_pipeline import compare, percentile
+from src.scripts.product_mentions import ProductMatcher, load_lexicon
+from src.scripts.raw_parser import read_raw_file
+from src.scripts.synthetic_data import generate
+
+
+def _generate(out_dir, seed=7):
+    raw_dir, images_dir = out_dir / "raw", out_dir / "images"
+    summary = generate(300, channels=6, days=30, unique_images=5, seed=seed, raw_dir=raw_dir, images_dir=images_dir)
+    records = [r for path in raw_dir.rglob("*.jsonl") for r in read_raw_file(path)]
+    return summary, sorted(records, key=lambda r: (r["channel_name"], r["message_id"]))
+
+
+def test_generated_messages_are_in_the_raw_layout(tmp_path):
+    summary, records = _generate(tmp_path)
+
+    assert summary["messages"] == len(records) == 300
+    assert len({r["channel_name"] for r in records}) <= 6
+    assert len({(r["channel_name"], r["message_id"]) for r in records}) == 300
+    images = [r["image_path"] for r in records if r["image_path"]]
+    assert len(images) == summary["images"] > 0
+    assert all(Path(p).is_file() for p in images)
+
+    matcher = ProductMatcher(load_lexicon())
+    assert sum(bool(matcher.find(r["message_text"])) for r in records) > 150
+
+
+def test_same_seed_same_data(tmp_path):
+    first = _generate(tmp_path / "first")[1]
+    second = _generate(tmp_path / "second")[1]
+    other = _generate(tmp_path / "other", seed=8)[1]
+    # image_path includes the output directory
+    strip = lambda records: [{k: v for k, v in r.items() if k != "image_path"} for r in records]  # noqa: E731
+
+    assert strip(first) == strip(second)
+    assert strip(first) != strip(other)
+
+
+def test_percentile_and_regression_check():
+    assert percentile(range(1, 101), 50) == 50
+    assert percentile(range(1, 101), 99) == 99
+    assert percentile([], 50) is None
+
+    baseline = {"stages": {
+        "load": {"items_per_sec": 1000, "peak_rss_mb": 200, "unit": "rows"},
+        "api": {"items_per_sec": 50, "peak_rss_mb": 150, "unit": "requests",
+                "endpoints": {"/trends": {"p50_ms": 10, "p99_ms": 20}}},
+    }}
+    results = {"stages": {
+        "load": {"items_per_sec": 700, "peak_rss_mb": 210, "unit": "rows"},
+        "api": {"items_per_sec": 55, "peak_rss_mb": 150, "unit": "requests",
+                "endpoints": {"/trends": {"p50_ms": 12, "p99_ms": 30}}},
+        "dbt": {"items_per_sec": 1, "peak_rss_mb": 900, "unit": "messages"},  # not in the baseline
+    }}
+
+    regressions = compare(results, baseline, tolerance=0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("load: 700")
+    assert regressions[1].startswith("api /trends: p99 30")